@@ -0,0 +1,44 @@
+"""Benchmark: AuthService.resolve latency vs number of configured agents.
+
+Run with: python -m benchmarks.bench_auth
+"""
+from __future__ import annotations
+
+import timeit
+
+from src.core.auth import AuthService
+from src.core.config import AgentConfig, AppConfig
+
+AGENT_COUNTS = [10, 100, 1_000, 10_000, 100_000]
+ITERATIONS = 20_000
+
+
+def _build(n: int) -> AuthService:
+    agents = {
+        f"agent-{i}": AgentConfig(token=f"token-{i:06d}-secret")
+        for i in range(n)
+    }
+    return AuthService(AppConfig(agents=agents))
+
+
+def main() -> None:
+    print(f"{'agents':>8}  {'hit (cached)':>14}  {'hit (cold)':>12}  {'miss':>10}")
+    for n in AGENT_COUNTS:
+        auth = _build(n)
+        last = f"token-{n - 1:06d}-secret"
+        auth.resolve(last)
+        cached = timeit.timeit(lambda: auth.resolve(last), number=ITERATIONS)
+        # Distinct tokens, more than the LRU holds, so every lookup goes to the index
+        cold_tokens = [f"token-{i:06d}-secret" for i in range(0, n, max(1, n // 1000))]
+        rounds = max(1, ITERATIONS // len(cold_tokens))
+        cold = timeit.timeit(lambda: [auth.resolve(t) for t in cold_tokens], number=rounds)
+        cold = cold / (rounds * len(cold_tokens)) * ITERATIONS
+        miss = timeit.timeit(lambda: auth.resolve("not-a-valid-token"), number=ITERATIONS)
+        print(
+            f"{n:>8}  {cached / ITERATIONS * 1e6:>11.2f} us  "
+            f"{cold / ITERATIONS * 1e6:>9.2f} us  {miss / ITERATIONS * 1e6:>7.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
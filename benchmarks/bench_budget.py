@@ -0,0 +1,32 @@
+"""Benchmark: BudgetTracker.record() throughput with and without the journal.
+
+Run with: python -m benchmarks.bench_budget
+"""
+from __future__ import annotations
+
+import tempfile
+import timeit
+from pathlib import Path
+
+from src.core.budget import BudgetTracker
+
+ITERATIONS = 200_000
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        in_memory = BudgetTracker()
+        journaled = BudgetTracker()
+        journaled.attach_journal(Path(tmp) / "budget.journal", flush_interval=1.0)
+
+        for name, tracker in (("in-memory", in_memory), ("journaled", journaled)):
+            elapsed = timeit.timeit(lambda: tracker.record("agent-x", 0.001), number=ITERATIONS)
+            print(
+                f"{name:<10} {ITERATIONS / elapsed:>12,.0f} records/s  "
+                f"{elapsed / ITERATIONS * 1e6:>6.2f} us/record"
+            )
+        journaled.close()
+
+
+if __name__ == "__main__":
+    main()
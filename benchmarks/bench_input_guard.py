@@ -0,0 +1,74 @@
+"""Benchmark: llm.query input guard on ~100 KB adversarial inputs.
+
+Compares the single-pass early-exit scanner with the previous
+encode + findall implementation.
+
+Run with: python -m benchmarks.bench_input_guard
+"""
+from __future__ import annotations
+
+import re
+import timeit
+
+from src.plugins.llm_query.input_guard import HARD_LIMIT_BYTES, check_input
+
+_LEGACY_FENCE = re.compile(r"```[\s\S]*?```", re.MULTILINE)
+_LEGACY_DEFINITION = re.compile(
+    r"^\s*(def |class |function |const |let |var |import |from |#include)",
+    re.MULTILINE,
+)
+
+
+def legacy_check_input(text: str) -> list[str]:
+    """The guard as it was before the single-pass scanner."""
+    reasons: list[str] = []
+    byte_size = len(text.encode("utf-8"))
+    if byte_size > HARD_LIMIT_BYTES:
+        return [f"Input size {byte_size} bytes exceeds hard limit"]
+    fences = _LEGACY_FENCE.findall(text)
+    if len(fences) > 10:
+        reasons.append(f"Input contains {len(fences)} code fences")
+    definitions = _LEGACY_DEFINITION.findall(text)
+    if len(definitions) > 20:
+        reasons.append(f"Input contains {len(definitions)} code definitions")
+    return reasons
+
+
+def _inputs() -> dict[str, str]:
+    size = HARD_LIMIT_BYTES - 100
+    return {
+        # Whitespace-only lines: `^\s*` restarts at every line and rescans the run
+        "blank lines": "\n" * (size // 8) + " \t" * (size // 4),
+        # Unterminated fence followed by prose
+        "open fence": "```" + ("lorem ipsum " * (size // 12)),
+        # Backtick noise that never forms a fence
+        "backtick noise": "``x" * (size // 3),
+        # Repo paste: decided after the first few KB
+        "repo paste": ("```python\ndef f():\n    pass\n```\n" * 10_000)[:size],
+        "many defs": ("def f(): pass\n" * 10_000)[:size],
+        # Clean prose: full scan, no matches
+        "prose": ("The quick brown fox jumps over the lazy dog. " * 3000)[:size],
+        "non-ascii prose": ("Grüße aus Köln — naïve café. " * 4000)[: size // 2],
+    }
+
+
+def _per_call(fn: object) -> float:
+    """Seconds per call; autorange keeps slow (quadratic) cases to a single run."""
+    timer = timeit.Timer(fn)  # type: ignore[arg-type]
+    number, total = timer.autorange()
+    return total / number
+
+
+def main() -> None:
+    print(f"{'input':>16}  {'legacy':>12}  {'single-pass':>12}  {'speedup':>8}")
+    for name, text in _inputs().items():
+        legacy = _per_call(lambda: legacy_check_input(text))
+        current = _per_call(lambda: check_input(text))
+        print(
+            f"{name:>16}  {legacy * 1e3:>9.3f} ms  {current * 1e3:>9.3f} ms  "
+            f"{legacy / current:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark: pure-ASGI BearerAuthMiddleware vs the former BaseHTTPMiddleware version.
+
+Drives each stack with raw ASGI calls (no HTTP client overhead) so the
+numbers reflect middleware cost per request.
+
+Run with: python -m benchmarks.bench_middleware
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from src.core.auth import AuthService
+from src.core.config import AgentConfig, AppConfig
+from src.transport.middleware import BearerAuthMiddleware, current_agent
+
+REQUESTS = 20_000
+TOKEN = "bench-token"
+
+
+class LegacyBearerAuthMiddleware(BaseHTTPMiddleware):
+    """The previous BaseHTTPMiddleware-based implementation, kept for comparison."""
+
+    def __init__(self, app: Any, auth_service: AuthService) -> None:
+        super().__init__(app)
+        self._auth = auth_service
+
+    async def dispatch(self, request: Request, call_next: Any) -> Response:
+        if request.url.path == "/health":
+            return await call_next(request)
+        auth_header = request.headers.get("authorization", "")
+        if not auth_header.startswith("Bearer "):
+            return JSONResponse({"error": "Missing or invalid Authorization header"}, status_code=401)
+        identity = self._auth.resolve(auth_header[7:])
+        if identity is None:
+            return JSONResponse({"error": "Invalid token"}, status_code=401)
+        current_agent.set(identity)
+        return await call_next(request)
+
+
+async def _endpoint(scope: Scope, receive: Receive, send: Send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def _run(app: Any) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/mcp",
+        "raw_path": b"/mcp",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"authorization", f"Bearer {TOKEN}".encode())],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message: dict[str, Any]) -> None:
+        pass
+
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    auth = AuthService(AppConfig(agents={"bench": AgentConfig(token=TOKEN)}))
+    stacks = {
+        "BaseHTTPMiddleware (legacy)": LegacyBearerAuthMiddleware(_endpoint, auth_service=auth),
+        "pure ASGI": BearerAuthMiddleware(_endpoint, auth_service=auth),
+    }
+    for name, app in stacks.items():
+        elapsed = asyncio.run(_run(app))
+        print(f"{name:<28} {REQUESTS / elapsed:>10,.0f} req/s  {elapsed / REQUESTS * 1e6:>7.1f} us/req")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Micro-benchmarks for the policy path (check_tool_call / check_egress).
+
+Run with: python -m benchmarks.bench_policy
+"""
+from __future__ import annotations
+
+import logging
+import timeit
+
+from src.core.config import AgentConfig, AppConfig
+from src.core.policy import PolicyEngine
+from src.core.types import AgentIdentity, Capability, PluginManifest
+
+ITERATIONS = 100_000
+
+
+def main() -> None:
+    config = AppConfig(
+        agents={
+            "bench": AgentConfig(
+                token="t",
+                allowed_tools=[f"tool.{i}" for i in range(50)] + ["llm.query"],
+                allowed_capabilities=[Capability.NETWORK_OUTBOUND, Capability.LLM_QUERY],
+                egress_allowlist=[f"host-{i}.example.com" for i in range(50)] + ["API.OpenAI.com"],
+                rate_limit=10**9,
+                max_cost_per_day=10**9,
+            )
+        }
+    )
+    policy = PolicyEngine(config)
+    identity = AgentIdentity(agent_id="bench", tenant_id="default")
+    llm = PluginManifest(
+        name="llm.query",
+        title="LLM",
+        description="llm",
+        capabilities=frozenset({Capability.NETWORK_OUTBOUND, Capability.LLM_QUERY}),
+    )
+    denied = PluginManifest(
+        name="fs.write",
+        title="FS",
+        description="fs",
+        capabilities=frozenset({Capability.FS_WRITE}),
+    )
+
+    cases = {
+        "check_tool_call (allow, llm)": lambda: policy.check_tool_call(identity, llm, 128),
+        "check_tool_call (static deny)": lambda: policy.check_tool_call(identity, denied, 128),
+        "check_egress (allow)": lambda: policy.check_egress(identity, "api.openai.com"),
+        "check_egress (deny)": lambda: policy.check_egress(identity, "evil.example.com"),
+    }
+    logging.getLogger("mcp_server").disabled = True
+    for name, fn in cases.items():
+        elapsed = timeit.timeit(fn, number=ITERATIONS)
+        print(f"{name:<32} {elapsed / ITERATIONS * 1e6:>7.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
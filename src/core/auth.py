@@ -1,30 +1,61 @@
 """Bearer token authentication: token → AgentIdentity."""
 from __future__ import annotations
 
+import hashlib
 import hmac
+import secrets
+import threading
+from collections import OrderedDict
 
 from src.core.config import AppConfig
 from src.core.types import AgentIdentity
 
+_CACHE_SIZE = 256
+
 
 class AuthService:
-    """Resolves bearer tokens to agent identities using constant-time comparison."""
+    """Resolves bearer tokens to agent identities using constant-time comparison.
+
+    Tokens are indexed by a keyed digest (HMAC-SHA256 with a per-process random
+    key), so resolving is a single dict probe followed by one constant-time
+    compare, independent of the number of configured agents.
+    """
 
     def __init__(self, config: AppConfig) -> None:
-        self._token_map: dict[str, AgentIdentity] = {}
+        self._key = secrets.token_bytes(32)
+        self._index: dict[bytes, tuple[str, AgentIdentity]] = {}
         for agent_id, agent_cfg in config.agents.items():
             if agent_cfg.token:
-                self._token_map[agent_cfg.token] = AgentIdentity(
-                    agent_id=agent_id,
-                    tenant_id=agent_cfg.tenant_id,
+                self._index[self._digest(agent_cfg.token)] = (
+                    agent_cfg.token,
+                    AgentIdentity(agent_id=agent_id, tenant_id=agent_cfg.tenant_id),
                 )
+        # Bounded LRU of recently resolved tokens: a hit skips the HMAC entirely
+        self._recent: OrderedDict[str, tuple[str, AgentIdentity]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, token: str) -> bytes:
+        return hmac.new(self._key, token.encode("utf-8"), hashlib.sha256).digest()
 
     def resolve(self, token: str) -> AgentIdentity | None:
         """Resolve a bearer token to an AgentIdentity, or None if invalid.
 
         Uses constant-time comparison to prevent timing attacks.
         """
-        for stored_token, identity in self._token_map.items():
-            if hmac.compare_digest(stored_token, token):
-                return identity
+        with self._lock:
+            entry = self._recent.get(token)
+            if entry is not None:
+                self._recent.move_to_end(token)
+        if entry is None:
+            entry = self._index.get(self._digest(token))
+            if entry is None:
+                return None
+            with self._lock:
+                self._recent[token] = entry
+                if len(self._recent) > _CACHE_SIZE:
+                    self._recent.popitem(last=False)
+
+        stored_token, identity = entry
+        if hmac.compare_digest(stored_token.encode("utf-8"), token.encode("utf-8")):
+            return identity
         return None
@@ -1,52 +1,131 @@
 """Per-agent LLM cost tracking with daily rotation."""
 from __future__ import annotations
 
-import threading
 import time
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+from pathlib import Path
 
+from src.core import journal
+from src.core.journal import BudgetJournal
+from src.core.state import MemoryStateBackend, State, StateBackend
 
-@dataclass
-class _AgentBudget:
-    spent: float = 0.0
-    day: int = 0  # day number since epoch
+_TTL = 2 * 86400.0  # keep yesterday's entry around until it can no longer matter
+
+
+@dataclass(frozen=True)
+class Reservation:
+    """Budget held for an in-flight call; settle with commit() or release()."""
+    agent_id: str
+    amount: float
+    day: int
 
 
 class BudgetTracker:
-    """Thread-safe per-agent daily LLM cost tracker."""
+    """Thread-safe per-agent daily LLM cost tracker.
+
+    Spend is stored in the state backend as (day, spent, reserved) per agent,
+    so workers sharing a backend share one daily budget. Reservations hold
+    estimated cost for in-flight calls so concurrent calls cannot overshoot
+    the limit. An optional journal makes spend survive restarts.
+    """
+
+    def __init__(self, backend: StateBackend | None = None) -> None:
+        self._backend = backend if backend is not None else MemoryStateBackend()
+        self._journal: BudgetJournal | None = None
+
+    def attach_journal(self, path: str | Path, flush_interval: float = 1.0) -> None:
+        """Restore today's spend from the journal, compact it, and journal new charges."""
+        today = self._current_day()
+        totals = journal.replay(path, today)
+        for agent_id, cost in totals.items():
+            self._adjust(agent_id, today, spent=cost)
+        journal.compact(path, today, totals)
+        self._journal = BudgetJournal(path, flush_interval=flush_interval)
 
-    def __init__(self) -> None:
-        self._budgets: dict[str, _AgentBudget] = {}
-        self._lock = threading.Lock()
+    def close(self) -> None:
+        """Flush and close the journal, if any."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
 
     @staticmethod
     def _current_day() -> int:
         return int(time.time() // 86400)
 
+    @staticmethod
+    def _key(agent_id: str) -> str:
+        return f"budget:{agent_id}"
+
+    def _totals(self, agent_id: str, today: int) -> tuple[float, float]:
+        """Return (spent, reserved) for today."""
+        return _unpack(self._backend.get(self._key(agent_id)), today)
+
     def check(self, agent_id: str, max_cost_per_day: float) -> float:
-        """Return remaining budget for today. Resets on new day."""
-        today = self._current_day()
-        with self._lock:
-            budget = self._budgets.get(agent_id)
-            if budget is None or budget.day != today:
-                return max_cost_per_day
-            return max(0.0, max_cost_per_day - budget.spent)
+        """Return remaining budget for today (net of reservations). Resets on new day."""
+        spent, reserved = self._totals(agent_id, self._current_day())
+        return max(0.0, max_cost_per_day - spent - reserved)
 
     def record(self, agent_id: str, cost: float) -> None:
         """Record a cost charge for an agent."""
         today = self._current_day()
-        with self._lock:
-            budget = self._budgets.get(agent_id)
-            if budget is None or budget.day != today:
-                budget = _AgentBudget(spent=0.0, day=today)
-                self._budgets[agent_id] = budget
-            budget.spent += cost
+        self._adjust(agent_id, today, spent=cost)
+        if self._journal is not None:
+            self._journal.append(agent_id, today, cost)
+
+    def reserve(
+        self,
+        agent_id: str,
+        amount: float,
+        max_cost_per_day: float,
+    ) -> Reservation | None:
+        """Atomically hold `amount` of today's budget, or return None if it does not fit."""
+        today = self._current_day()
+
+        def _hold(state: State | None) -> tuple[bool, State]:
+            spent, reserved = _unpack(state, today)
+            if spent + reserved + amount > max_cost_per_day:
+                return False, (float(today), spent, reserved)
+            return True, (float(today), spent, reserved + amount)
+
+        if not self._backend.update(self._key(agent_id), _hold, ttl=_TTL):
+            return None
+        return Reservation(agent_id=agent_id, amount=amount, day=today)
+
+    def commit(self, reservation: Reservation, actual_cost: float) -> None:
+        """Settle a reservation: drop the hold and charge the actual cost."""
+        today = self._current_day()
+        self._adjust(
+            reservation.agent_id,
+            today,
+            spent=actual_cost,
+            reserved=-reservation.amount if reservation.day == today else 0.0,
+        )
+        if self._journal is not None and actual_cost:
+            self._journal.append(reservation.agent_id, today, actual_cost)
+
+    def release(self, reservation: Reservation) -> None:
+        """Drop a reservation without charging anything (e.g. the call failed)."""
+        today = self._current_day()
+        if reservation.day == today:
+            self._adjust(reservation.agent_id, today, reserved=-reservation.amount)
+
+    def _adjust(self, agent_id: str, today: int, spent: float = 0.0, reserved: float = 0.0) -> None:
+        def _add(state: State | None) -> tuple[None, State]:
+            cur_spent, cur_reserved = _unpack(state, today)
+            return None, (float(today), cur_spent + spent, max(0.0, cur_reserved + reserved))
+
+        self._backend.update(self._key(agent_id), _add, ttl=_TTL)
 
     def spent_today(self, agent_id: str) -> float:
         """Return total spent today for an agent."""
-        today = self._current_day()
-        with self._lock:
-            budget = self._budgets.get(agent_id)
-            if budget is None or budget.day != today:
-                return 0.0
-            return budget.spent
+        return self._totals(agent_id, self._current_day())[0]
+
+    def reserved_today(self, agent_id: str) -> float:
+        """Return budget currently held by in-flight reservations."""
+        return self._totals(agent_id, self._current_day())[1]
+
+
+def _unpack(state: State | None, today: int) -> tuple[float, float]:
+    if state is None or int(state[0]) != today:
+        return 0.0, 0.0
+    return state[1], state[2] if len(state) > 2 else 0.0
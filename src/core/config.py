@@ -4,10 +4,11 @@ from __future__ import annotations
 import os
 import re
 from pathlib import Path
-from typing import Any
+from typing import Any, Literal
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import yaml
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
 from src.core.types import Capability
 
@@ -27,14 +28,191 @@ def _expand_env(value: Any) -> Any:
     return value
 
 
+class LLMPoolConfig(BaseModel):
+    """Upstream connection pool for one provider."""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0  # seconds an idle connection is kept open
+    http2: bool = False  # needs the optional `h2` package; falls back to HTTP/1.1
+    warmup_connections: int = 1  # connections opened at startup (0 disables warm-up)
+    warmup_timeout: float = 5.0
+
+
+_CLOCK_TIME = re.compile(r"(?:[01]\d|2[0-3]):[0-5]\d")
+
+
+class LLMKeepWarmConfig(BaseModel):
+    """Periodic empty loads that keep local models resident during working hours.
+
+    Outside the window models unload after keep_alive as usual. A window
+    whose end is before its start runs overnight.
+    """
+    enabled: bool = False
+    interval_seconds: float = 240.0  # keep below keep_alive (Ollama's default is 5m)
+    start: str = "08:00"  # HH:MM
+    end: str = "18:00"  # HH:MM, exclusive; "24:00" for end of day
+    days: list[int] = Field(default_factory=lambda: [0, 1, 2, 3, 4])  # Monday = 0
+    timezone: str = "UTC"
+    models: list[str] = Field(default_factory=list)  # default: allowed_models
+
+    @field_validator("start", "end")
+    @classmethod
+    def _check_time(cls, value: str, info: Any) -> str:
+        # Times are compared as strings, so they must be zero-padded HH:MM
+        if not _CLOCK_TIME.fullmatch(value) and not (info.field_name == "end" and value == "24:00"):
+            raise ValueError(f"expected a zero-padded HH:MM time, got {value!r}")
+        return value
+
+    @field_validator("days")
+    @classmethod
+    def _check_days(cls, value: list[int]) -> list[int]:
+        if any(not 0 <= day <= 6 for day in value):
+            raise ValueError(f"days must be 0 (Monday) to 6 (Sunday), got {value}")
+        return value
+
+    @field_validator("timezone")
+    @classmethod
+    def _check_timezone(cls, value: str) -> str:
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError) as exc:
+            raise ValueError(f"unknown timezone {value!r}") from exc
+        return value
+
+
 class LLMProviderConfig(BaseModel):
     api_key: str = ""
     base_url: str = ""
     allowed_models: list[str] = Field(default_factory=list)
+    pool: LLMPoolConfig = Field(default_factory=LLMPoolConfig)
+    max_concurrency: int | None = None  # upstream calls in flight; default llm.scheduler's
+    # local only: Ollama servers to balance across (default: just base_url)
+    endpoints: list[str] = Field(default_factory=list)
+    health_check_interval: float = 15.0  # seconds between /api/ps polls of each endpoint
+    # local only: how long Ollama keeps a model loaded after a call ("30m", -1 = forever)
+    keep_alive: str | int | None = None
+    preload: bool = False  # local only: load allowed_models at startup
+    keep_warm: LLMKeepWarmConfig = Field(default_factory=LLMKeepWarmConfig)
+
+
+class LLMCacheConfig(BaseModel):
+    enabled: bool = True
+    ttl_seconds: float = 300.0
+    max_bytes: int = 32 * 1024 * 1024
+
+
+class LLMSingleFlightConfig(BaseModel):
+    """Coalescing of identical in-flight llm.query calls into one upstream request."""
+    enabled: bool = True
+    scope: Literal["tenant", "global"] = "tenant"  # who may share an in-flight call
+    cost_attribution: Literal["leader", "split"] = "leader"  # who pays for a shared call
+
+
+class LLMSessionConfig(BaseModel):
+    """Server-side conversation history, so agents send only the new message."""
+    enabled: bool = True
+    ttl_seconds: float = 3600.0  # a session expires after this long without a call
+    max_bytes: int = 64 * 1024 * 1024  # all sessions held in memory
+    max_session_bytes: int = 1024 * 1024  # oldest turns are dropped beyond this
+    spill_dir: str | None = None  # sessions evicted from memory are written here
+
+
+class LLMAdaptiveLimitConfig(BaseModel):
+    """AIMD adjustment of each provider's scheduler limit from observed load.
+
+    The configured max_concurrency is the starting point; the limit then
+    moves between min_limit and max_limit.
+    """
+    enabled: bool = True
+    min_limit: int = 1
+    max_limit: int = 256
+    backoff: float = 0.7  # multiply the limit by this on 429s, 502-504s, timeouts
+    # Opt-in: ...or on a call this many times the baseline latency. Completion
+    # latency grows with output length, so this only suits uniform workloads.
+    latency_tolerance: float | None = None
+
+
+class LLMSchedulerConfig(BaseModel):
+    """Global cap on concurrent upstream calls per provider, shared fairly.
+
+    Under contention, slots are shared between tenants in proportion to
+    tenant_weights, and between a tenant's agents by AgentConfig.llm_weight.
+    """
+    enabled: bool = True
+    max_concurrency: int = 32  # per provider, unless the provider sets its own
+    tenant_weights: dict[str, float] = Field(default_factory=dict)  # default 1.0
+    adaptive: LLMAdaptiveLimitConfig = Field(default_factory=LLMAdaptiveLimitConfig)
+
+
+class LLMBreakerConfig(BaseModel):
+    """Circuit breaker per provider (or per provider/model with per_model).
+
+    Opens when at least failure_rate of the last `window` calls (and at
+    least min_calls) failed with a 5xx or connection error (timeouts
+    included, as are calls cut off by the tool deadline). While open, calls fail immediately. After open_seconds,
+    half_open_probes trial calls decide whether it closes.
+
+    Completion latency grows with output length, so slow calls only count
+    as failures when slow_call_seconds is set.
+    """
+    enabled: bool = True
+    per_model: bool = False
+    window: int = 20
+    min_calls: int = 5
+    failure_rate: float = 0.5
+    slow_call_seconds: float | None = None  # opt-in; also counts slow cancelled calls
+    open_seconds: float = 30.0
+    half_open_probes: int = 1
+
+
+class LLMRetryConfig(BaseModel):
+    """Retries of transient upstream failures inside each provider call.
+
+    Only failures where the upstream did not run the completion are retried
+    (429, 408, 502, 503, 529 and connection errors before the request was
+    sent), with exponential backoff and full jitter, or after Retry-After.
+    Each provider shares a retry budget: every call adds budget_ratio of a
+    retry, each retry spends one, up to budget_reserve banked.
+    """
+    enabled: bool = True
+    max_retries: int = 2  # per call
+    base_delay: float = 0.5  # backoff before retry n is up to base_delay * 2**n
+    max_delay: float = 8.0
+    max_retry_after: float = 30.0  # a longer Retry-After fails the call instead
+    budget_ratio: float = 0.1
+    budget_reserve: float = 10.0
+
+
+class LLMRouteTarget(BaseModel):
+    provider: str
+    model: str
+
+
+class LLMRouteConfig(BaseModel):
+    """Equivalent models that can stand in for each other (a model group).
+
+    A query for any target is sent to that target first; the others are
+    used, in order, as hedges and fallbacks.
+    """
+    targets: list[LLMRouteTarget] = Field(default_factory=list)
+    hedge: bool = True
+    # Fire a hedge once the primary has been slower than this percentile of its
+    # recent latencies; hedge_delay_seconds is used until min_samples are recorded
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    hedge_delay_seconds: float = 2.0
+    fallback: bool = True  # move to the next target on 5xx, 429 or connection errors
 
 
 class LLMConfig(BaseModel):
     providers: dict[str, LLMProviderConfig] = Field(default_factory=dict)
+    cache: LLMCacheConfig = Field(default_factory=LLMCacheConfig)
+    single_flight: LLMSingleFlightConfig = Field(default_factory=LLMSingleFlightConfig)
+    sessions: LLMSessionConfig = Field(default_factory=LLMSessionConfig)
+    scheduler: LLMSchedulerConfig = Field(default_factory=LLMSchedulerConfig)
+    breaker: LLMBreakerConfig = Field(default_factory=LLMBreakerConfig)
+    retry: LLMRetryConfig = Field(default_factory=LLMRetryConfig)
+    routes: dict[str, LLMRouteConfig] = Field(default_factory=dict)  # model group -> route
 
 
 class AgentConfig(BaseModel):
@@ -46,11 +224,30 @@ class AgentConfig(BaseModel):
     egress_allowlist: list[str] = Field(default_factory=list)
     max_payload_bytes: int = 1_048_576  # 1 MB
     max_response_bytes: int = 1_048_576
-    timeout_seconds: int = 30
+    timeout_seconds: float = 30
     concurrency: int = 5
+    concurrency_mode: Literal["wait", "reject"] = "wait"
+    max_queue_depth: int = 10  # callers allowed to wait for a slot ("wait" mode)
+    queue_timeout_seconds: float = 10.0  # max time spent waiting for a slot
     rate_limit: int = 60  # requests per minute
+    rate_limit_algorithm: Literal["sliding_window", "token_bucket", "gcra"] = "sliding_window"
     max_tokens_per_request: int = 4096
+    batch_parallelism: int = 4  # concurrent llm.query_batch upstream calls per agent
+    llm_weight: float = 1.0  # share of its tenant's upstream slots under contention
     max_cost_per_day: float = 10.0  # USD
+    llm_cache: bool = True  # serve identical llm.query calls from the response cache
+    llm_cache_scope: Literal["agent", "tenant"] = "agent"  # who shares cache entries
+
+
+class StateConfig(BaseModel):
+    """Where rate-limit and budget counters live ("mmap" is shared across workers)."""
+    backend: Literal["memory", "mmap", "sqlite"] = "memory"
+    path: str = ""  # file for the mmap/sqlite backends
+    mmap_slots: int = 65_536
+    # Append-only journal that makes daily spend survive restarts. Only used with
+    # the process-local "memory" backend; mmap/sqlite state already persists.
+    budget_journal: str = ""
+    journal_flush_interval: float = 1.0
 
 
 class ServerConfig(BaseModel):
@@ -67,6 +264,7 @@ class AppConfig(BaseModel):
     agents: dict[str, AgentConfig] = Field(default_factory=dict)
     enabled_plugins: list[str] = Field(default_factory=lambda: ["core.echo", "core.sum"])
     llm: LLMConfig = Field(default_factory=LLMConfig)
+    state: StateConfig = Field(default_factory=StateConfig)
     redact_patterns: list[str] = Field(default_factory=lambda: [
         r"(?i)(sk-[a-zA-Z0-9]{20,})",
         r"(?i)(Bearer\s+[a-zA-Z0-9._\-]+)",
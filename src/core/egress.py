@@ -1,10 +1,16 @@
 """Guarded HTTP client: httpx wrapper enforcing egress allowlist."""
 from __future__ import annotations
 
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 from urllib.parse import urlparse
 
 import httpx
 
+logger = logging.getLogger("mcp_server")
+
 
 class EgressDeniedError(Exception):
     """Raised when an outbound HTTP request targets a host not on the allowlist."""
@@ -17,15 +23,46 @@ class EgressDeniedError(Exception):
         )
 
 
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
 class GuardedHttpClient:
     """httpx.AsyncClient wrapper that enforces an egress host allowlist.
 
-    Every outbound request is checked before being sent.
+    Every outbound request is checked before being sent. The underlying
+    connection pool is sized by `limits`; `warmup()` pre-opens connections so
+    the first real requests do not pay for DNS, TCP and TLS setup.
     """
 
-    def __init__(self, allowlist: list[str], timeout: float = 30.0) -> None:
+    def __init__(
+        self,
+        allowlist: list[str],
+        timeout: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+        limits: httpx.Limits | None = None,
+        http2: bool = False,
+    ) -> None:
         self._allowlist = [h.lower() for h in allowlist]
-        self._client = httpx.AsyncClient(timeout=timeout)
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        # Same as httpx's defaults, made explicit so pool_stats() can report them
+        self._limits = limits or httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        self._http2 = http2
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            transport=transport,
+            limits=self._limits,
+            http2=http2,
+        )
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
 
     def _check(self, url: str) -> None:
         parsed = urlparse(url)
@@ -33,22 +70,88 @@ class GuardedHttpClient:
         if host not in self._allowlist:
             raise EgressDeniedError(host, self._allowlist)
 
+    def _begin(self) -> None:
+        self._requests += 1
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
     async def request(
         self,
         method: str,
         url: str,
-        **kwargs: object,
+        **kwargs: Any,
     ) -> httpx.Response:
         self._check(url)
-        return await self._client.request(method, url, **kwargs)
+        self._begin()
+        try:
+            return await self._client.request(method, url, **kwargs)
+        finally:
+            self._in_flight -= 1
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
 
-    async def post(self, url: str, **kwargs: object) -> httpx.Response:
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        **kwargs: Any,
+    ) -> AsyncIterator[httpx.Response]:
+        """Open a streamed request; the body is consumed incrementally by the caller."""
         self._check(url)
-        return await self._client.post(url, **kwargs)
+        self._begin()
+        try:
+            async with self._client.stream(method, url, **kwargs) as response:
+                yield response
+        finally:
+            self._in_flight -= 1
+
+    async def warmup(self, url: str, connections: int = 1, timeout: float = 5.0) -> int:
+        """Open up to `connections` keep-alive connections to url's host.
 
-    async def get(self, url: str, **kwargs: object) -> httpx.Response:
+        Sends concurrent HEAD requests; any HTTP response counts as success,
+        since only the established connection matters. Returns the number of
+        successful requests. Failures are logged, never raised.
+        """
         self._check(url)
-        return await self._client.get(url, **kwargs)
+
+        async def _one() -> bool:
+            try:
+                await self._client.head(url, timeout=timeout)
+            except httpx.HTTPError as exc:
+                logger.warning("Connection warm-up failed", extra={"url": url, "error": str(exc)})
+                return False
+            return True
+
+        results = await asyncio.gather(*(_one() for _ in range(connections)))
+        return sum(results)
+
+    def pool_stats(self) -> dict[str, Any]:
+        """Request counters and, when the transport exposes it, pool occupancy."""
+        stats: dict[str, Any] = {
+            "max_connections": self._limits.max_connections,
+            "max_keepalive_connections": self._limits.max_keepalive_connections,
+            "keepalive_expiry": self._limits.keepalive_expiry,
+            "http2": self._http2,
+            "requests": self._requests,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+        }
+        # httpx's default transport wraps an httpcore pool; custom transports may not
+        pool = getattr(self._client._transport, "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            stats["open_connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+            if self._limits.max_connections:
+                stats["utilisation"] = round(
+                    (len(connections) - stats["idle_connections"]) / self._limits.max_connections, 4
+                )
+        return stats
 
     async def aclose(self) -> None:
         await self._client.aclose()
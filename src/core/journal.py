@@ -0,0 +1,105 @@
+"""Append-only, write-behind journal for daily LLM spend.
+
+record() only adds the charge to an in-memory batch; a background thread
+writes the batch (one line per agent) and fsyncs it every `flush_interval`
+seconds, so the event loop never blocks on disk. On startup the journal is replayed into
+today's per-agent totals and compacted to one line per agent.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+logger = logging.getLogger("mcp_server")
+
+
+def replay(path: str | Path, day: int) -> dict[str, float]:
+    """Return per-agent spend recorded in the journal for `day`.
+
+    Malformed lines (e.g. a torn final write after a crash) are skipped.
+    """
+    totals: dict[str, float] = {}
+    path = Path(path)
+    if not path.exists():
+        return totals
+    with path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                entry = json.loads(line)
+                if int(entry["day"]) == day:
+                    agent_id = str(entry["agent_id"])
+                    totals[agent_id] = totals.get(agent_id, 0.0) + float(entry["cost"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return totals
+
+
+def compact(path: str | Path, day: int, totals: dict[str, float]) -> None:
+    """Atomically rewrite the journal as one line per agent for `day`."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        for agent_id, cost in totals.items():
+            fh.write(_line(agent_id, day, cost))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _line(agent_id: str, day: int, cost: float) -> str:
+    return json.dumps({"agent_id": agent_id, "day": day, "cost": cost}) + "\n"
+
+
+class BudgetJournal:
+    """Batched, periodically fsynced append-only journal of budget charges.
+
+    At most `flush_interval` seconds of spend can be lost on a hard crash.
+    """
+
+    def __init__(self, path: str | Path, flush_interval: float = 1.0) -> None:
+        self._path = Path(path)
+        self._flush_interval = flush_interval
+        # Charges since the last flush, summed per (agent_id, day)
+        self._pending: dict[tuple[str, int], float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._file = self._path.open("a", encoding="utf-8")
+        self._thread = threading.Thread(
+            target=self._run, name="budget-journal", daemon=True
+        )
+        self._thread.start()
+
+    def append(self, agent_id: str, day: int, cost: float) -> None:
+        """Queue a charge; it is serialised and written on the next flush."""
+        key = (agent_id, day)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0.0) + cost
+
+    def flush(self) -> None:
+        """Write and fsync everything queued so far."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            self._file.write("".join(
+                _line(agent_id, day, cost) for (agent_id, day), cost in batch.items()
+            ))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError:
+            logger.exception("Budget journal write failed", extra={"path": str(self._path)})
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Stop the flusher thread, flush remaining entries and close the file."""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self._file.close()
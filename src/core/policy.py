@@ -5,74 +5,159 @@ Every tool call passes through this engine — no bypass path.
 from __future__ import annotations
 
 import logging
-from typing import TYPE_CHECKING
+from dataclasses import dataclass
 
 from src.core.budget import BudgetTracker
 from src.core.config import AgentConfig, AppConfig
-from src.core.rate_limit import RateLimiter
+from src.core.rate_limit import ConcurrencyLimiter, RateLimiter
+from src.core.state import StateBackend, create_state_backend
 from src.core.types import AgentIdentity, Capability, PluginManifest, PolicyDecision
 
-if TYPE_CHECKING:
-    pass
-
 logger = logging.getLogger("mcp_server")
 
+_CAPABILITY_BITS: dict[Capability, int] = {cap: 1 << i for i, cap in enumerate(Capability)}
+_NETWORK_OUTBOUND_BIT = _CAPABILITY_BITS[Capability.NETWORK_OUTBOUND]
+
+
+def capability_mask(capabilities: frozenset[Capability] | list[Capability]) -> int:
+    """Encode a set of capabilities as a bitmask."""
+    mask = 0
+    for cap in capabilities:
+        mask |= _CAPABILITY_BITS[cap]
+    return mask
+
+
+@dataclass(frozen=True)
+class CompiledAgentPolicy:
+    """Static, per-agent policy tables precomputed once per config load."""
+    config: AgentConfig
+    tools: frozenset[str]
+    capability_mask: int
+    egress_hosts: frozenset[str]
+
+
+def compile_agent_policy(agent_cfg: AgentConfig) -> CompiledAgentPolicy:
+    return CompiledAgentPolicy(
+        config=agent_cfg,
+        tools=frozenset(agent_cfg.allowed_tools),
+        capability_mask=capability_mask(agent_cfg.allowed_capabilities),
+        egress_hosts=frozenset(h.lower() for h in agent_cfg.egress_allowlist),
+    )
+
 
 class PolicyEngine:
-    """Central policy enforcement for all tool calls and egress."""
+    """Central policy enforcement for all tool calls and egress.
+
+    Static checks (tool allowlist, capability gating) are resolved once per
+    (agent, tool) against compiled tables and cached; only the dynamic checks
+    (payload size, budget, rate limit) run on every call.
+    """
+
+    def __init__(self, config: AppConfig, state_backend: StateBackend | None = None) -> None:
+        # Rate-limit and budget counters share one backend; with the mmap or
+        # sqlite backend they are shared by every worker process.
+        self._state = state_backend if state_backend is not None else create_state_backend(config.state)
+        self._budget = BudgetTracker(self._state)
+        if config.state.budget_journal:
+            if config.state.backend == "memory":
+                self._budget.attach_journal(
+                    config.state.budget_journal,
+                    flush_interval=config.state.journal_flush_interval,
+                )
+            else:
+                logger.warning(
+                    "budget_journal ignored: state backend '%s' is already persistent",
+                    config.state.backend,
+                )
+        self._rate_limiter = RateLimiter(self._state)
+        self._concurrency = ConcurrencyLimiter()
+        self.reload(config)
 
-    def __init__(self, config: AppConfig) -> None:
+    def close(self) -> None:
+        """Flush the budget journal and release the state backend."""
+        self._budget.close()
+        self._state.close()
+
+    def reload(self, config: AppConfig) -> None:
+        """Recompile policy tables from config and drop cached verdicts."""
         self._config = config
-        self._budget = BudgetTracker()
-        self._rate_limiter = RateLimiter()
+        self._compiled: dict[str, CompiledAgentPolicy] = {
+            agent_id: compile_agent_policy(agent_cfg)
+            for agent_id, agent_cfg in config.agents.items()
+        }
+        self._static_verdicts: dict[tuple[str, PluginManifest], tuple[str, ...]] = {}
 
     @property
     def budget_tracker(self) -> BudgetTracker:
         return self._budget
 
-    def _get_agent_config(self, identity: AgentIdentity) -> AgentConfig | None:
-        return self._config.agents.get(identity.agent_id)
+    @property
+    def concurrency_limiter(self) -> ConcurrencyLimiter:
+        return self._concurrency
 
-    def check_tool_call(
+    def agent_config(self, identity: AgentIdentity) -> AgentConfig | None:
+        compiled = self._compiled.get(identity.agent_id)
+        return compiled.config if compiled is not None else None
+
+    def _static_reasons(
         self,
         identity: AgentIdentity,
+        compiled: CompiledAgentPolicy,
         manifest: PluginManifest,
-        payload_size: int = 0,
-    ) -> PolicyDecision:
-        """Run all policy checks for a tool call. Returns deny with reasons if any fail."""
-        agent_cfg = self._get_agent_config(identity)
-        if agent_cfg is None:
-            return PolicyDecision.deny([f"Unknown agent: {identity.agent_id}"])
+    ) -> tuple[str, ...]:
+        """Return cached tool-allowlist and capability denials for (agent, tool)."""
+        key = (identity.agent_id, manifest)
+        cached = self._static_verdicts.get(key)
+        if cached is not None:
+            return cached
 
         reasons: list[str] = []
 
         # 1. Tool allowlist
-        if manifest.name not in agent_cfg.allowed_tools:
+        if manifest.name not in compiled.tools:
             reasons.append(
                 f"Tool '{manifest.name}' is not in allowed_tools for agent '{identity.agent_id}'"
             )
 
         # 2. Capability gating
-        allowed_caps = frozenset(agent_cfg.allowed_capabilities)
-        missing = manifest.capabilities - allowed_caps
-        if missing:
+        missing_mask = capability_mask(manifest.capabilities) & ~compiled.capability_mask
+        if missing_mask:
+            missing = [c for c, bit in _CAPABILITY_BITS.items() if missing_mask & bit]
             reasons.append(
                 f"Missing capabilities: {sorted(c.value for c in missing)}"
             )
 
+        verdict = tuple(reasons)
+        self._static_verdicts[key] = verdict
+        return verdict
+
+    def check_tool_call(
+        self,
+        identity: AgentIdentity,
+        manifest: PluginManifest,
+        payload_size: int = 0,
+        rate_cost: int = 1,
+    ) -> PolicyDecision:
+        """Run all policy checks for a tool call. Returns deny with reasons if any fail.
+
+        `rate_cost` is the number of rate-limit units the call consumes. A call
+        costing more than the agent's whole per-minute limit could never be
+        admitted, so it is rejected with its own reason rather than "retry later".
+        """
+        compiled = self._compiled.get(identity.agent_id)
+        if compiled is None:
+            return PolicyDecision.deny([f"Unknown agent: {identity.agent_id}"])
+        agent_cfg = compiled.config
+
+        reasons = list(self._static_reasons(identity, compiled, manifest))
+
         # 3. Payload size
         if payload_size > agent_cfg.max_payload_bytes:
             reasons.append(
                 f"Payload size {payload_size} exceeds limit {agent_cfg.max_payload_bytes}"
             )
 
-        # 4. Rate limit
-        if not self._rate_limiter.check(identity.agent_id, agent_cfg.rate_limit):
-            reasons.append(
-                f"Rate limit exceeded: {agent_cfg.rate_limit} requests/minute"
-            )
-
-        # 5. LLM budget (only for tools requiring llm:query)
+        # 4. LLM budget (only for tools requiring llm:query)
         if Capability.LLM_QUERY in manifest.capabilities:
             remaining = self._budget.check(
                 identity.agent_id, agent_cfg.max_cost_per_day
@@ -82,6 +167,20 @@ class PolicyEngine:
                     f"Daily LLM budget exhausted (limit: ${agent_cfg.max_cost_per_day:.2f})"
                 )
 
+        # 5. Rate limit — atomic check-and-consume, only charged for otherwise-allowed calls
+        if not reasons and rate_cost > agent_cfg.rate_limit:
+            reasons.append(
+                f"Call needs {rate_cost} rate-limit units, more than the limit of "
+                f"{agent_cfg.rate_limit} requests/minute; split it into smaller calls"
+            )
+        elif not reasons and not self._rate_limiter.acquire(
+            identity.agent_id, agent_cfg.rate_limit, agent_cfg.rate_limit_algorithm, cost=rate_cost
+        ):
+            reasons.append(
+                f"Rate limit exceeded: {agent_cfg.rate_limit} requests/minute"
+                + (f" (call needs {rate_cost})" if rate_cost > 1 else "")
+            )
+
         if reasons:
             logger.warning(
                 "Policy deny",
@@ -93,23 +192,20 @@ class PolicyEngine:
             )
             return PolicyDecision.deny(reasons)
 
-        # Record rate limit hit
-        self._rate_limiter.record(identity.agent_id)
         return PolicyDecision.allow()
 
     def check_egress(self, identity: AgentIdentity, host: str) -> PolicyDecision:
         """Check if outbound HTTP to a given host is allowed for this agent."""
-        agent_cfg = self._get_agent_config(identity)
-        if agent_cfg is None:
+        compiled = self._compiled.get(identity.agent_id)
+        if compiled is None:
             return PolicyDecision.deny([f"Unknown agent: {identity.agent_id}"])
 
-        if Capability.NETWORK_OUTBOUND not in agent_cfg.allowed_capabilities:
+        if not compiled.capability_mask & _NETWORK_OUTBOUND_BIT:
             return PolicyDecision.deny(
                 [f"Agent '{identity.agent_id}' lacks capability 'network:outbound'"]
             )
 
-        host_lower = host.lower()
-        if host_lower not in [h.lower() for h in agent_cfg.egress_allowlist]:
+        if host.lower() not in compiled.egress_hosts:
             return PolicyDecision.deny(
                 [f"Host '{host}' not in egress allowlist for agent '{identity.agent_id}'"]
             )
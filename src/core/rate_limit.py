@@ -1,47 +1,225 @@
-"""Rate limiter (sliding window) and concurrency limiter per agent."""
+"""Rate limiter (sliding window, token bucket, GCRA) and concurrency limiter per agent."""
 from __future__ import annotations
 
 import asyncio
 import time
 import threading
-from collections import defaultdict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from src.core.state import MemoryStateBackend, StateBackend
+
+
+_WINDOW = 60.0  # rate limits are expressed per minute
+_IDLE_EVICT_AFTER = 2 * _WINDOW  # every algorithm has fully recovered by then
+
+# Per-key state is a small tuple of floats; each algorithm maps
+# (state, now, limit, cost) -> (allowed, new_state) and never allocates per request.
+RateState = tuple[float, ...]
+
+
+def _token_bucket(state: RateState | None, now: float, limit: int, cost: int) -> tuple[bool, RateState]:
+    """Bucket of `limit` tokens refilled continuously at limit/minute. State: (tokens, last)."""
+    if state is None:
+        tokens = float(limit)
+    else:
+        tokens, last = state
+        tokens = min(float(limit), tokens + (now - last) * limit / _WINDOW)
+    if tokens >= cost:
+        return True, (tokens - cost, now)
+    return False, (tokens, now)
+
+
+def _gcra(state: RateState | None, now: float, limit: int, cost: int) -> tuple[bool, RateState]:
+    """Generic cell rate algorithm: one theoretical arrival time per key. State: (tat,)."""
+    interval = _WINDOW / limit
+    tat = now if state is None else max(state[0], now)
+    new_tat = tat + interval * cost
+    if new_tat - now > _WINDOW:
+        return False, (tat,)
+    return True, (new_tat,)
+
+
+def _sliding_window(state: RateState | None, now: float, limit: int, cost: int) -> tuple[bool, RateState]:
+    """Sliding-window counter: current + weighted previous fixed window.
+
+    State: (window_start, previous_count, current_count).
+    """
+    window_start = now - (now % _WINDOW)
+    if state is None:
+        previous, current = 0.0, 0.0
+    else:
+        start, previous, current = state
+        if window_start - start >= 2 * _WINDOW:
+            previous, current = 0.0, 0.0
+        elif window_start > start:
+            previous, current = current, 0.0
+    weight = 1.0 - (now - window_start) / _WINDOW
+    if previous * weight + current + cost > limit:
+        return False, (window_start, previous, current)
+    return True, (window_start, previous, current + cost)
+
+
+RATE_LIMIT_ALGORITHMS = {
+    "sliding_window": _sliding_window,
+    "token_bucket": _token_bucket,
+    "gcra": _gcra,
+}
 
 
 class RateLimiter:
-    """Sliding-window rate limiter: max N requests per 60-second window per agent."""
+    """Per-agent rate limiter: max N requests per minute, constant memory per key.
 
-    def __init__(self) -> None:
-        self._windows: dict[str, list[float]] = defaultdict(list)
-        self._lock = threading.Lock()
+    acquire() is an atomic check-and-consume against the state backend. The
+    algorithm is chosen per call ("sliding_window", "token_bucket" or "gcra");
+    keys idle long enough to have fully recovered expire from the backend.
+    Timestamps are wall-clock so state can be shared across processes.
+    """
 
-    def check(self, agent_id: str, limit: int) -> bool:
-        """Return True if the request is within rate limit."""
-        now = time.monotonic()
-        cutoff = now - 60.0
+    def __init__(self, backend: StateBackend | None = None) -> None:
+        self._backend = backend if backend is not None else MemoryStateBackend()
 
-        with self._lock:
-            timestamps = self._windows[agent_id]
-            # Prune old entries
-            self._windows[agent_id] = [t for t in timestamps if t > cutoff]
-            return len(self._windows[agent_id]) < limit
-
-    def record(self, agent_id: str) -> None:
-        """Record a request for rate limiting."""
-        now = time.monotonic()
-        with self._lock:
-            self._windows[agent_id].append(now)
+    def acquire(
+        self,
+        agent_id: str,
+        limit: int,
+        algorithm: str = "sliding_window",
+        cost: int = 1,
+    ) -> bool:
+        """Consume `cost` units of the agent's rate limit. Returns False if over limit."""
+        step = RATE_LIMIT_ALGORITHMS[algorithm]
+        now = time.time()
+
+        def _consume(state: RateState | None) -> tuple[bool, RateState]:
+            return step(state, now, limit, cost)
+
+        return self._backend.update(f"rate:{agent_id}", _consume, ttl=_IDLE_EVICT_AFTER)
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """Raised when an agent's concurrency slot cannot be obtained."""
+
+    def __init__(self, agent_id: str, reason: str) -> None:
+        self.agent_id = agent_id
+        self.reason = reason
+        super().__init__(reason)
+
+
+@dataclass
+class _AgentSlots:
+    semaphore: asyncio.Semaphore
+    limit: int
+    in_flight: int = 0
+    waiting: int = 0
+    max_waiting: int = 0
+    waits: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    rejected: int = 0
 
 
 class ConcurrencyLimiter:
-    """Per-agent concurrency limiter using asyncio.Semaphore."""
+    """Per-agent concurrency limiter using asyncio.Semaphore.
+
+    Two modes: "wait" queues callers (bounded by max_queue_depth and
+    queue_timeout) until a slot frees up; "reject" fails fast when all
+    slots are taken.
+    """
 
     def __init__(self) -> None:
-        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._slots: dict[str, _AgentSlots] = {}
         self._lock = threading.Lock()
 
+    def _get(self, agent_id: str, max_concurrency: int) -> _AgentSlots:
+        with self._lock:
+            slots = self._slots.get(agent_id)
+            if slots is None:
+                slots = _AgentSlots(
+                    semaphore=asyncio.Semaphore(max_concurrency),
+                    limit=max_concurrency,
+                )
+                self._slots[agent_id] = slots
+            return slots
+
     def get_semaphore(self, agent_id: str, max_concurrency: int) -> asyncio.Semaphore:
         """Get or create a semaphore for the given agent."""
+        return self._get(agent_id, max_concurrency).semaphore
+
+    @asynccontextmanager
+    async def acquire(
+        self,
+        agent_id: str,
+        max_concurrency: int,
+        mode: str = "wait",
+        max_queue_depth: int = 0,
+        queue_timeout: float = 0.0,
+    ) -> AsyncIterator[None]:
+        """Hold one of the agent's concurrency slots for the duration of the block.
+
+        Raises ConcurrencyLimitExceeded if no slot can be obtained.
+        """
+        slots = self._get(agent_id, max_concurrency)
+        sem = slots.semaphore
+
+        if sem.locked():
+            if mode == "reject":
+                slots.rejected += 1
+                raise ConcurrencyLimitExceeded(
+                    agent_id,
+                    f"Concurrency limit reached: {slots.limit} calls in flight",
+                )
+            if slots.waiting >= max_queue_depth:
+                slots.rejected += 1
+                raise ConcurrencyLimitExceeded(
+                    agent_id,
+                    f"Concurrency queue full: {slots.waiting} calls already waiting "
+                    f"(max_queue_depth={max_queue_depth})",
+                )
+
+        slots.waiting += 1
+        slots.max_waiting = max(slots.max_waiting, slots.waiting)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout=queue_timeout or None)
+        except asyncio.TimeoutError:
+            slots.rejected += 1
+            raise ConcurrencyLimitExceeded(
+                agent_id,
+                f"Timed out after {queue_timeout:g}s waiting for a concurrency slot",
+            ) from None
+        finally:
+            slots.waiting -= 1
+            waited = time.monotonic() - started
+            slots.waits += 1
+            slots.total_wait += waited
+            slots.max_wait = max(slots.max_wait, waited)
+
+        slots.in_flight += 1
+        try:
+            yield
+        finally:
+            slots.in_flight -= 1
+            sem.release()
+
+    def stats(self, agent_id: str) -> dict[str, float]:
+        """Return live queue depth and wait-time stats for an agent."""
         with self._lock:
-            if agent_id not in self._semaphores:
-                self._semaphores[agent_id] = asyncio.Semaphore(max_concurrency)
-            return self._semaphores[agent_id]
+            slots = self._slots.get(agent_id)
+        if slots is None:
+            return {
+                "in_flight": 0,
+                "queue_depth": 0,
+                "max_queue_depth": 0,
+                "avg_wait_seconds": 0.0,
+                "max_wait_seconds": 0.0,
+                "rejected": 0,
+            }
+        return {
+            "in_flight": slots.in_flight,
+            "queue_depth": slots.waiting,
+            "max_queue_depth": slots.max_waiting,
+            "avg_wait_seconds": slots.total_wait / slots.waits if slots.waits else 0.0,
+            "max_wait_seconds": slots.max_wait,
+            "rejected": slots.rejected,
+        }
@@ -15,8 +15,10 @@ PLUGIN_MODULES: dict[str, str] = {
     "core.echo": "src.plugins.core_echo.plugin",
     "core.sum": "src.plugins.core_sum.plugin",
     "llm.query": "src.plugins.llm_query.plugin",
+    "llm.query_batch": "src.plugins.llm_query_batch.plugin",
     "about.server": "src.plugins.about_server.plugin",
     "about.policies": "src.plugins.about_policies.plugin",
+    "about.upstreams": "src.plugins.about_upstreams.plugin",
     "instructions.agent": "src.plugins.instructions_agent.plugin",
     "prompt.review_pr": "src.plugins.prompt_review_pr.plugin",
     "prompt.tool_usage": "src.plugins.prompt_tool_usage.plugin",
@@ -30,9 +32,14 @@ class PluginRegistry:
         self.tools: dict[str, ToolPlugin] = {}
         self.resources: dict[str, ResourcePlugin] = {}
         self.prompts: dict[str, PromptPlugin] = {}
+        # Objects shared between plugins (e.g. upstream clients), created by the
+        # first plugin that needs them. Optional async startup()/shutdown()
+        # methods are run by the app lifespan.
+        self.services: dict[str, Any] = {}
 
     def load(self, config: AppConfig, **kwargs: Any) -> None:
         """Load all enabled plugins from config."""
+        kwargs.setdefault("services", self.services)
         for plugin_name in config.enabled_plugins:
             module_path = PLUGIN_MODULES.get(plugin_name)
             if module_path is None:
@@ -56,3 +63,25 @@ class PluginRegistry:
                     logger.warning("Plugin %s has unknown type", plugin_name)
             except Exception:
                 logger.exception("Failed to load plugin: %s", plugin_name)
+
+    async def startup(self) -> None:
+        """Start shared services, in creation order."""
+        for name, service in self.services.items():
+            hook = getattr(service, "startup", None)
+            if hook is None:
+                continue
+            try:
+                await hook()
+            except Exception:
+                logger.exception("Service startup failed: %s", name)
+
+    async def shutdown(self) -> None:
+        """Stop shared services, in reverse creation order."""
+        for name, service in reversed(list(self.services.items())):
+            hook = getattr(service, "shutdown", None)
+            if hook is None:
+                continue
+            try:
+                await hook()
+            except Exception:
+                logger.exception("Service shutdown failed: %s", name)
@@ -0,0 +1,269 @@
+"""Pluggable state backends for rate limits and budgets.
+
+Each key holds a small tuple of floats (at most STATE_SIZE) plus an expiry.
+All backends provide an atomic read-modify-write (`update`), so policy
+counters stay correct when several workers share one backend:
+
+- MemoryStateBackend: process-local dict (default, single worker)
+- MmapStateBackend: fixed-size hash table in a shared mmap file, for
+  `uvicorn --workers N` on a single host
+- SQLiteStateBackend: SQLite in WAL mode, for state that survives restarts
+  of a single server process
+"""
+from __future__ import annotations
+
+import abc
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from typing import Callable, TypeVar
+
+from src.core.config import StateConfig
+
+State = tuple[float, ...]
+T = TypeVar("T")
+
+STATE_SIZE = 3
+_SWEEP_INTERVAL = 60.0
+_BUSY_TIMEOUT = 5.0  # seconds SQLite waits for another connection's write lock
+
+
+class StateBackend(abc.ABC):
+    """Key → (state tuple, expiry) store with atomic read-modify-write."""
+
+    @abc.abstractmethod
+    def update(
+        self,
+        key: str,
+        fn: Callable[[State | None], tuple[T, State]],
+        ttl: float,
+    ) -> T:
+        """Atomically apply `fn` to the key's state and store the new state.
+
+        `fn` receives the current state (None if missing or expired) and
+        returns (result, new_state). The stored entry expires `ttl` seconds
+        from now. Returns `result`.
+        """
+        ...
+
+    @abc.abstractmethod
+    def get(self, key: str) -> State | None:
+        """Return the current state for key, or None if missing or expired."""
+        ...
+
+    def incr(self, key: str, amount: float, ttl: float) -> float:
+        """Atomically add `amount` to a single-value counter and return the new value."""
+        def _add(state: State | None) -> tuple[float, State]:
+            value = (state[0] if state else 0.0) + amount
+            return value, (value,)
+        return self.update(key, _add, ttl)
+
+    def close(self) -> None:
+        """Release any resources held by the backend."""
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local backend. Expired keys are swept periodically."""
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[float, State]] = {}  # key -> (expires_at, state)
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def update(
+        self,
+        key: str,
+        fn: Callable[[State | None], tuple[T, State]],
+        ttl: float,
+    ) -> T:
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep >= _SWEEP_INTERVAL:
+                self._sweep(now)
+            entry = self._data.get(key)
+            state = entry[1] if entry is not None and entry[0] > now else None
+            result, new_state = fn(state)
+            self._data[key] = (now + ttl, new_state)
+            return result
+
+    def get(self, key: str) -> State | None:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            return entry[1] if entry is not None and entry[0] > now else None
+
+    def _sweep(self, now: float) -> None:
+        for key in [k for k, (expires, _) in self._data.items() if expires <= now]:
+            del self._data[key]
+        self._last_sweep = now
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Slot: key digest, expires_at, state values, state length (56 bytes, 8-byte aligned)
+_SLOT = struct.Struct(f"<16sd{STATE_SIZE}dB7x")
+_EMPTY_DIGEST = b"\0" * 16
+
+
+class MmapStateBackend(StateBackend):
+    """Shared-memory backend: open-addressing hash table in an mmap'd file.
+
+    Workers on the same host open the same file; updates are serialised with
+    an exclusive flock on the file (plus a thread lock within a process).
+    Expired slots are reused in place, so the table never needs compaction.
+    """
+
+    def __init__(self, path: str, slots: int = 65_536) -> None:
+        self._slots = slots
+        size = slots * _SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        return digest if digest != _EMPTY_DIGEST else b"\1" + digest[1:]
+
+    def _find(self, digest: bytes, now: float) -> tuple[int, State | None]:
+        """Return (slot index, live state) for digest; index is where to write it."""
+        start = int.from_bytes(digest[:8], "little") % self._slots
+        reusable = -1
+        for probe in range(self._slots):
+            index = (start + probe) % self._slots
+            slot_digest, expires, *values = _SLOT.unpack_from(self._mm, index * _SLOT.size)
+            if slot_digest == digest:
+                if expires > now:
+                    return index, tuple(values[:values[-1]])
+                return index, None
+            if slot_digest == _EMPTY_DIGEST:
+                return (reusable if reusable >= 0 else index), None
+            if reusable < 0 and expires <= now:
+                reusable = index
+        if reusable >= 0:
+            return reusable, None
+        raise RuntimeError(f"Shared state table is full ({self._slots} slots)")
+
+    def update(
+        self,
+        key: str,
+        fn: Callable[[State | None], tuple[T, State]],
+        ttl: float,
+    ) -> T:
+        digest = self._digest(key)
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                index, state = self._find(digest, now)
+                result, new_state = fn(state)
+                values = list(new_state) + [0.0] * (STATE_SIZE - len(new_state))
+                _SLOT.pack_into(
+                    self._mm, index * _SLOT.size,
+                    digest, now + ttl, *values, len(new_state),
+                )
+                return result
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def get(self, key: str) -> State | None:
+        digest = self._digest(key)
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                return self._find(digest, time.time())[1]
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+
+class SQLiteStateBackend(StateBackend):
+    """SQLite (WAL mode) backend: durable across restarts, for one server process.
+
+    Each update runs in a BEGIN IMMEDIATE transaction, which takes the
+    database write lock for the read-modify-write. Policy checks are
+    synchronous, so this runs on the event loop: within one process the
+    thread lock means the write lock is never waited for, but a second
+    process holding it would stall the loop for up to `_BUSY_TIMEOUT`.
+    Several workers should share the mmap backend instead.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(
+            path, timeout=_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS policy_state ("
+            "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, state TEXT NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def update(
+        self,
+        key: str,
+        fn: Callable[[State | None], tuple[T, State]],
+        ttl: float,
+    ) -> T:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if now - self._last_sweep >= _SWEEP_INTERVAL:
+                    self._conn.execute("DELETE FROM policy_state WHERE expires_at <= ?", (now,))
+                    self._last_sweep = now
+                row = self._conn.execute(
+                    "SELECT state FROM policy_state WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                state = tuple(json.loads(row[0])) if row is not None else None
+                result, new_state = fn(state)
+                self._conn.execute(
+                    "INSERT INTO policy_state (key, expires_at, state) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at, "
+                    "state = excluded.state",
+                    (key, now + ttl, json.dumps(list(new_state))),
+                )
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, key: str) -> State | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM policy_state WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return tuple(json.loads(row[0])) if row is not None else None
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def create_state_backend(config: StateConfig) -> StateBackend:
+    """Build the state backend selected in config."""
+    if config.backend == "mmap":
+        return MmapStateBackend(config.path or "mcp-state.mmap", slots=config.mmap_slots)
+    if config.backend == "sqlite":
+        return SQLiteStateBackend(config.path or "mcp-state.sqlite3")
+    return MemoryStateBackend()
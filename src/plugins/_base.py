@@ -2,8 +2,9 @@
 from __future__ import annotations
 
 import abc
+import time
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Awaitable, Callable
 
 from pydantic import BaseModel
 
@@ -15,6 +16,19 @@ class ToolContext:
     """Context passed to tool plugin execute method."""
     identity: AgentIdentity
     raw_arguments: dict[str, Any]
+    deadline: float | None = None  # time.monotonic() value the call must finish by
+    progress: Callable[[str], Awaitable[None]] | None = None  # set when the client wants progress
+
+    def remaining_time(self) -> float | None:
+        """Seconds left before the call's deadline, or None if it has none."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    async def report_progress(self, message: str) -> None:
+        """Send a progress notification to the client (no-op if it did not ask for them)."""
+        if self.progress is not None:
+            await self.progress(message)
 
 
 class ToolPlugin(abc.ABC):
@@ -32,6 +46,10 @@ class ToolPlugin(abc.ABC):
         """Execute the tool and return a string result."""
         ...
 
+    def rate_cost(self, arguments: dict[str, Any]) -> int:
+        """Rate-limit units this call consumes (e.g. one per item of a batch)."""
+        return 1
+
 
 class ResourcePlugin(abc.ABC):
     @abc.abstractmethod
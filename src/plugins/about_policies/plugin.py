@@ -5,13 +5,15 @@ import json
 from typing import Any
 
 from src.core.config import AppConfig
+from src.core.policy import PolicyEngine
 from src.core.types import AgentIdentity, PluginManifest
 from src.plugins._base import ResourcePlugin
 
 
 class AboutPoliciesPlugin(ResourcePlugin):
-    def __init__(self, config: AppConfig) -> None:
+    def __init__(self, config: AppConfig, policy_engine: PolicyEngine | None = None) -> None:
         self._config = config
+        self._policy = policy_engine
 
     def manifest(self) -> PluginManifest:
         return PluginManifest(
@@ -31,7 +33,7 @@ class AboutPoliciesPlugin(ResourcePlugin):
         if agent_cfg is None:
             return json.dumps({"error": f"Unknown agent: {identity.agent_id}"})
 
-        return json.dumps({
+        result: dict[str, Any] = {
             "agent_id": identity.agent_id,
             "tenant_id": identity.tenant_id,
             "allowed_tools": agent_cfg.allowed_tools,
@@ -41,12 +43,22 @@ class AboutPoliciesPlugin(ResourcePlugin):
             "max_response_bytes": agent_cfg.max_response_bytes,
             "timeout_seconds": agent_cfg.timeout_seconds,
             "concurrency": agent_cfg.concurrency,
+            "concurrency_mode": agent_cfg.concurrency_mode,
+            "max_queue_depth": agent_cfg.max_queue_depth,
+            "queue_timeout_seconds": agent_cfg.queue_timeout_seconds,
             "rate_limit": agent_cfg.rate_limit,
             "max_tokens_per_request": agent_cfg.max_tokens_per_request,
             "max_cost_per_day": agent_cfg.max_cost_per_day,
             "enabled_plugins": self._config.enabled_plugins,
-        }, indent=2)
+        }
+        if self._policy is not None:
+            result["concurrency_stats"] = self._policy.concurrency_limiter.stats(identity.agent_id)
+        return json.dumps(result, indent=2)
 
 
-def create_plugin(config: AppConfig, **kwargs: Any) -> AboutPoliciesPlugin:
-    return AboutPoliciesPlugin(config=config)
+def create_plugin(
+    config: AppConfig,
+    policy_engine: PolicyEngine | None = None,
+    **kwargs: Any,
+) -> AboutPoliciesPlugin:
+    return AboutPoliciesPlugin(config=config, policy_engine=policy_engine)
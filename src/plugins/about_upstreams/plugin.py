@@ -0,0 +1,39 @@
+"""about://upstreams — connection pool and cache stats for LLM providers."""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from src.core.config import AppConfig
+from src.core.types import AgentIdentity, PluginManifest
+from src.plugins._base import ResourcePlugin
+from src.plugins.llm_query.backend import LLMBackend, get_llm_backend
+
+
+class AboutUpstreamsPlugin(ResourcePlugin):
+    def __init__(self, backend: LLMBackend) -> None:
+        self._backend = backend
+
+    def manifest(self) -> PluginManifest:
+        return PluginManifest(
+            name="about.upstreams",
+            title="About Upstreams",
+            description="Upstream LLM connection pool utilisation and response cache stats.",
+        )
+
+    def uri(self) -> str:
+        return "about://upstreams"
+
+    async def read(self, identity: AgentIdentity | None) -> str:
+        if identity is None:
+            return json.dumps({"error": "Not authenticated"})
+        # Per-agent queues are shown for the caller's own tenant only
+        return json.dumps(self._backend.stats(identity.tenant_id), indent=2)
+
+
+def create_plugin(
+    config: AppConfig,
+    services: dict[str, Any] | None = None,
+    **kwargs: Any,
+) -> AboutUpstreamsPlugin:
+    return AboutUpstreamsPlugin(backend=get_llm_backend(config, services))
@@ -0,0 +1,116 @@
+"""Adaptive concurrency limit for one upstream provider (AIMD).
+
+The limit grows by about one slot per limit's worth of successful calls
+while the provider is saturated (all slots in use), and shrinks by a
+constant factor when calls come back rate limited, overloaded or timed
+out. Completion latency grows with output length, so a call much slower
+than the provider's recent baseline only counts when a latency tolerance
+is configured. Calls that were
+already in flight when the limit last shrank cannot shrink it again, so one
+burst of errors counts as a single congestion signal.
+"""
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Any
+
+import httpx
+
+_HISTORY = 100  # limit changes kept for the admin view
+_BASELINE_ALPHA = 0.1  # weight of each new latency sample in the baseline
+
+
+def congestion_reason(exc: BaseException) -> str | None:
+    """Why an upstream error means "back off", or None if it says nothing about load."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        if status == 429:
+            return "rate_limited"
+        if status in (502, 503, 504):
+            return "overloaded"
+        return None
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    return None
+
+
+class AIMDLimit:
+    """Additive-increase / multiplicative-decrease limit on in-flight calls."""
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        backoff: float,
+        latency_tolerance: float | None = None,
+    ) -> None:
+        self._min = min_limit
+        self._max = max(min_limit, max_limit)
+        self._limit = float(min(max(initial, self._min), self._max))
+        self._backoff = backoff
+        self._tolerance = latency_tolerance
+        self._decreased_at = float("-inf")
+        self.baseline: float | None = None  # smoothed latency of successful calls
+        self.history: deque[dict[str, Any]] = deque(maxlen=_HISTORY)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def observe(
+        self,
+        started: float,
+        latency: float,
+        saturated: bool,
+        error: BaseException | None = None,
+    ) -> None:
+        """Feed back one finished call.
+
+        `started` is the call's monotonic start time and `saturated` whether
+        every slot was in use when it started.
+        """
+        if error is not None:
+            reason = congestion_reason(error)
+            if reason is not None:
+                self._decrease(started, reason)
+            return
+
+        slow = (
+            self._tolerance is not None
+            and self.baseline is not None
+            and latency > self.baseline * self._tolerance
+        )
+        # Every success feeds the baseline, so a lasting shift (e.g. longer
+        # completions) stops counting as slow once the baseline catches up
+        self.baseline = (
+            latency
+            if self.baseline is None
+            else self.baseline + _BASELINE_ALPHA * (latency - self.baseline)
+        )
+        if slow:
+            self._decrease(started, "latency")
+        elif saturated:
+            self._set(self._limit + 1.0 / self._limit, "headroom")
+
+    def _decrease(self, started: float, reason: str) -> None:
+        if started < self._decreased_at:
+            return  # in flight before the last decrease: same congestion event
+        self._decreased_at = time.monotonic()
+        self._set(self._limit * self._backoff, reason)
+
+    def _set(self, value: float, reason: str) -> None:
+        before = self.limit
+        self._limit = min(max(value, float(self._min)), float(self._max))
+        if self.limit != before:
+            self.history.append({"time": time.time(), "limit": self.limit, "reason": reason})
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "min_limit": self._min,
+            "max_limit": self._max,
+            "baseline_latency": self.baseline,
+            "history": list(self.history),
+        }
@@ -0,0 +1,220 @@
+"""Provider clients and response cache shared by the LLM tools."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+from urllib.parse import urlparse
+
+import httpx
+
+from src.core.config import AppConfig, LLMProviderConfig
+from src.core.egress import GuardedHttpClient
+from src.plugins.llm_query.breaker import CircuitBreakers
+from src.plugins.llm_query.cache import ResponseCache
+from src.plugins.llm_query.providers.anthropic import AnthropicProvider
+from src.plugins.llm_query.providers.base import LLMProvider, LLMResponse
+from src.plugins.llm_query.providers.local import LocalProvider
+from src.plugins.llm_query.providers.openai import OpenAIProvider
+from src.plugins.llm_query.retry import RetryPolicy
+from src.plugins.llm_query.routing import LatencyTracker, Router
+from src.plugins.llm_query.scheduler import UpstreamScheduler
+from src.plugins.llm_query.sessions import SessionStore
+from src.plugins.llm_query.singleflight import SingleFlight
+
+logger = logging.getLogger("mcp_server")
+
+_DEFAULT_BASE_URLS: dict[str, str] = {
+    "openai": "https://api.openai.com/v1",
+    "anthropic": "https://api.anthropic.com/v1",
+    "local": "http://localhost:11434",
+}
+
+# Services key under which the backend is shared between plugins
+SERVICE_KEY = "llm_backend"
+
+
+def _http_client(hosts: list[str], timeout: float, pcfg: LLMProviderConfig) -> GuardedHttpClient:
+    pool = pcfg.pool
+    return GuardedHttpClient(
+        allowlist=hosts,
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=pool.max_connections,
+            max_keepalive_connections=pool.max_keepalive_connections,
+            keepalive_expiry=pool.keepalive_expiry,
+        ),
+        http2=pool.http2,
+    )
+
+
+class LLMBackend:
+    """Owns one pooled GuardedHttpClient per provider, the response cache, the
+    single-flight group for in-flight requests, the upstream scheduler,
+    circuit breakers and retry budgets, the hedging router and the
+    conversation session store.
+
+    Built once per app and shared through the registry's services, so every
+    LLM tool reuses the same warm connections. `startup()` pre-opens pool
+    connections; `shutdown()` closes them.
+    """
+
+    def __init__(self, config: AppConfig) -> None:
+        self._config = config
+        self.providers: dict[str, LLMProvider] = {}
+        # name -> (client, base URLs)
+        self._clients: dict[str, tuple[GuardedHttpClient, list[str]]] = {}
+        self.hosts: dict[str, list[str]] = {}  # name -> upstream hosts agents need egress to
+        self.retries: dict[str, RetryPolicy] = {}  # name -> retry policy and shared budget
+        self._init_providers()
+        cache_cfg = config.llm.cache
+        self.cache = (
+            ResponseCache(max_bytes=cache_cfg.max_bytes, ttl_seconds=cache_cfg.ttl_seconds)
+            if cache_cfg.enabled
+            else None
+        )
+        flight_cfg = config.llm.single_flight
+        self.single_flight: SingleFlight[LLMResponse] | None = (
+            SingleFlight(attribution=flight_cfg.cost_attribution)
+            if flight_cfg.enabled
+            else None
+        )
+        sched_cfg = config.llm.scheduler
+        self.scheduler = (
+            UpstreamScheduler(
+                limits={
+                    name: pcfg.max_concurrency
+                    for name, pcfg in config.llm.providers.items()
+                    if pcfg.max_concurrency is not None
+                },
+                default_limit=sched_cfg.max_concurrency,
+                tenant_weights=sched_cfg.tenant_weights,
+                agent_weights={
+                    agent_id: agent.llm_weight for agent_id, agent in config.agents.items()
+                },
+                adaptive=sched_cfg.adaptive,
+            )
+            if sched_cfg.enabled
+            else None
+        )
+        self.breakers = CircuitBreakers(config.llm.breaker) if config.llm.breaker.enabled else None
+        self.router = Router(
+            LatencyTracker(),
+            scheduler=self.scheduler,
+            breakers=self.breakers,
+            retries=self.retries,
+        )
+        session_cfg = config.llm.sessions
+        self.sessions = (
+            SessionStore(
+                max_bytes=session_cfg.max_bytes,
+                ttl_seconds=session_cfg.ttl_seconds,
+                max_session_bytes=session_cfg.max_session_bytes,
+                spill_dir=session_cfg.spill_dir,
+            )
+            if session_cfg.enabled
+            else None
+        )
+
+    def _init_providers(self) -> None:
+        for name, pcfg in self._config.llm.providers.items():
+            if name not in _DEFAULT_BASE_URLS:
+                continue
+            base_url = pcfg.base_url or _DEFAULT_BASE_URLS[name]
+            if self._config.llm.retry.enabled:
+                self.retries[name] = RetryPolicy(self._config.llm.retry)
+            # Each provider's client only reaches its own hosts; agents must
+            # additionally have every one of them on their egress allowlist
+            if name == "openai":
+                base_urls, hosts = [base_url], ["api.openai.com"]
+                http_client = _http_client(hosts, 60.0, pcfg)
+                self.providers[name] = OpenAIProvider(
+                    api_key=pcfg.api_key, base_url=base_url, http_client=http_client
+                )
+            elif name == "anthropic":
+                base_urls, hosts = [base_url], ["api.anthropic.com"]
+                http_client = _http_client(hosts, 60.0, pcfg)
+                self.providers[name] = AnthropicProvider(
+                    api_key=pcfg.api_key, base_url=base_url, http_client=http_client
+                )
+            else:
+                base_urls = pcfg.endpoints or [base_url]
+                hosts = list(dict.fromkeys(urlparse(u).hostname or "localhost" for u in base_urls))
+                http_client = _http_client(hosts, 120.0, pcfg)
+                self.providers[name] = LocalProvider(
+                    base_url=base_url,
+                    http_client=http_client,
+                    endpoints=base_urls,
+                    health_check_interval=pcfg.health_check_interval,
+                    keep_alive=pcfg.keep_alive,
+                    preload=pcfg.allowed_models if pcfg.preload else (),
+                    keep_warm=pcfg.keep_warm,
+                    keep_warm_models=pcfg.keep_warm.models or pcfg.allowed_models,
+                )
+            self._clients[name] = (http_client, base_urls)
+            self.hosts[name] = hosts
+
+    async def startup(self) -> None:
+        """Warm every provider's connection pool and start provider background
+        tasks. Failures are logged, not raised."""
+        async def _warm(name: str, base_url: str) -> None:
+            client, _ = self._clients[name]
+            pool = self._config.llm.providers[name].pool
+            if pool.warmup_connections <= 0:
+                return
+            opened = await client.warmup(
+                base_url, connections=pool.warmup_connections, timeout=pool.warmup_timeout
+            )
+            logger.info(
+                "Warmed upstream connections",
+                extra={"provider": name, "base_url": base_url, "connections": opened},
+            )
+
+        await asyncio.gather(
+            *(
+                _warm(name, base_url)
+                for name, (_, base_urls) in self._clients.items()
+                for base_url in base_urls
+            )
+        )
+        for provider in self.providers.values():
+            await provider.start()
+
+    async def shutdown(self) -> None:
+        """Close all provider connections."""
+        for name, provider in self.providers.items():
+            try:
+                await provider.close()
+            except Exception:
+                logger.exception("Failed to close LLM provider", extra={"provider": name})
+
+    def stats(self, tenant_id: str | None = None) -> dict[str, Any]:
+        """Pool, cache, single-flight, scheduler, breaker, retry, routing and session
+        stats, for about://upstreams. With `tenant_id`, scheduler queues of other
+        tenants are left out."""
+        providers: dict[str, Any] = {}
+        for name, (client, _) in self._clients.items():
+            providers[name] = client.pool_stats()
+            provider = self.providers[name]
+            if isinstance(provider, LocalProvider):
+                providers[name]["endpoints"] = provider.endpoint_stats()
+        return {
+            "providers": providers,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "single_flight": self.single_flight.stats() if self.single_flight is not None else None,
+            "scheduler": self.scheduler.stats(tenant_id) if self.scheduler is not None else None,
+            "breakers": self.breakers.stats() if self.breakers is not None else None,
+            "retries": {name: retry.stats() for name, retry in self.retries.items()},
+            "routing": self.router.stats(),
+            "sessions": self.sessions.stats() if self.sessions is not None else None,
+        }
+
+
+def get_llm_backend(config: AppConfig, services: dict[str, Any] | None) -> LLMBackend:
+    """Return the backend registered in `services`, creating it on first use."""
+    if services is None:
+        return LLMBackend(config)
+    backend = services.get(SERVICE_KEY)
+    if backend is None:
+        backend = services[SERVICE_KEY] = LLMBackend(config)
+    return backend
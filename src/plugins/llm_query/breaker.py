@@ -0,0 +1,233 @@
+"""Circuit breakers for upstream LLM providers.
+
+A breaker watches the outcome of recent calls to one provider (or one
+provider/model pair). Once enough of them fail, it opens and
+calls fail immediately with CircuitOpenError instead of waiting out the
+upstream timeout. After `open_seconds` it lets a few probe calls through
+(half-open): if they all succeed the breaker closes, if one fails it opens
+again.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator, Awaitable, Callable, Literal
+
+import httpx
+
+from src.core.config import LLMBreakerConfig
+from src.core.types import AgentIdentity
+from src.plugins.llm_query.providers.base import LLMResponse
+from src.plugins.llm_query.retry import RetryPolicy
+from src.plugins.llm_query.scheduler import UpstreamScheduler, upstream_slot
+
+State = Literal["closed", "open", "half_open"]
+
+# A cancelled call counts as timed out if it had at most this long left
+_DEADLINE_SLACK = 0.01
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+    def __init__(self, provider: str, model: str, retry_after: float) -> None:
+        self.provider = provider
+        self.model = model
+        self.retry_after = retry_after
+        super().__init__(
+            f"Circuit open for {provider}/{model}: failing fast, retry in {retry_after:.0f}s"
+        )
+
+
+def counts_as_failure(exc: BaseException) -> bool:
+    """5xx and connection errors (timeouts included) mean the upstream is unhealthy.
+
+    4xx errors, 429 included, are answers from a working upstream; rate
+    limiting is handled by the adaptive concurrency limit instead.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+@dataclass
+class CircuitBreaker:
+    provider: str
+    model: str
+    config: LLMBreakerConfig
+    state: State = "closed"
+    outcomes: deque[bool] = field(default_factory=deque)  # True = healthy, newest last
+    opened_at: float = 0.0
+    probes: int = 0  # half-open probes in flight
+    probe_successes: int = 0
+    trips: int = 0
+    rejected: int = 0
+
+    def admit(self, now: float) -> bool:
+        """Let a call through (returns True if it is a half-open probe) or raise."""
+        if self.state == "open":
+            remaining = self.opened_at + self.config.open_seconds - now
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.provider, self.model, remaining)
+            self.state = "half_open"
+            self.probes = 0
+            self.probe_successes = 0
+        if self.state == "half_open":
+            if self.probes >= self.config.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(self.provider, self.model, 0.0)
+            self.probes += 1
+            return True
+        return False
+
+    def settle(self, probe: bool, healthy: bool | None, now: float) -> None:
+        """Record a call's outcome; `healthy` is None for calls that were abandoned."""
+        if probe:
+            self.probes -= 1
+        if healthy is None:
+            return
+        if self.state == "half_open":
+            if not probe:
+                return  # admitted before the breaker opened
+            if not healthy:
+                self._trip(now)
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= self.config.half_open_probes:
+                self.state = "closed"
+                self.outcomes.clear()
+            return
+        if self.state == "open":
+            return
+        self.outcomes.append(healthy)
+        while len(self.outcomes) > self.config.window:
+            self.outcomes.popleft()
+        if len(self.outcomes) >= self.config.min_calls:
+            failures = self.outcomes.count(False)
+            if failures / len(self.outcomes) >= self.config.failure_rate:
+                self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self.trips += 1
+        self.outcomes.clear()
+
+    def stats(self, now: float) -> dict[str, Any]:
+        calls = len(self.outcomes)
+        return {
+            "state": self.state,
+            "recent_calls": calls,
+            "failure_rate": self.outcomes.count(False) / calls if calls else 0.0,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_after_seconds": (
+                max(0.0, self.opened_at + self.config.open_seconds - now)
+                if self.state == "open"
+                else 0.0
+            ),
+        }
+
+
+class CircuitBreakers:
+    """One breaker per provider, or per (provider, model) with `per_model`."""
+
+    def __init__(self, config: LLMBreakerConfig) -> None:
+        self._config = config
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model if self._config.per_model else "*")
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(
+                provider=key[0], model=key[1], config=self._config
+            )
+        return breaker
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        return {f"{p}/{m}": b.stats(now) for (p, m), b in self._breakers.items()}
+
+
+def _slow(breaker: CircuitBreaker, started: float) -> bool:
+    threshold = breaker.config.slow_call_seconds
+    return threshold is not None and time.monotonic() - started > threshold
+
+
+@asynccontextmanager
+async def upstream_call(
+    breakers: CircuitBreakers | None,
+    scheduler: UpstreamScheduler | None,
+    provider: str,
+    model: str,
+    identity: AgentIdentity | None,
+    timeout: float | None = None,
+) -> AsyncIterator[None]:
+    """Guard one upstream call: breaker admission, then a scheduler slot.
+
+    The breaker is checked before queueing for a slot, so an open circuit
+    fails fast even when the slots are held by hung calls. A call cancelled
+    once its `timeout` has run out (the tool deadline cutting off a hung
+    upstream before httpx's own timeout fires) counts as a timeout. With
+    slow_call_seconds set, the call's own latency (without queue wait)
+    decides whether it counts as slow.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    breaker = breakers.get(provider, model) if breakers is not None else None
+    probe = breaker.admit(time.monotonic()) if breaker is not None else False
+    healthy: bool | None = None
+    try:
+        async with upstream_slot(scheduler, provider, identity):
+            started = time.monotonic()
+            try:
+                yield
+            except asyncio.CancelledError:
+                # A hedge loser says nothing about the upstream, but a call cut
+                # off by its deadline, or after running slow, does
+                timed_out = (
+                    deadline is not None and time.monotonic() >= deadline - _DEADLINE_SLACK
+                )
+                if breaker is not None and (timed_out or _slow(breaker, started)):
+                    healthy = False
+                raise
+            except BaseException as exc:
+                healthy = not counts_as_failure(exc)
+                raise
+            else:
+                healthy = breaker is None or not _slow(breaker, started)
+    finally:
+        if breaker is not None:
+            breaker.settle(probe, healthy, time.monotonic())
+
+
+async def guarded_call(
+    breakers: CircuitBreakers | None,
+    scheduler: UpstreamScheduler | None,
+    retry: RetryPolicy | None,
+    provider: str,
+    model: str,
+    identity: AgentIdentity | None,
+    call: Callable[[float | None], Awaitable[LLMResponse]],
+    timeout: float | None,
+    replayable: Callable[[], bool] = lambda: True,
+) -> LLMResponse:
+    """Run `call(remaining_timeout)` with retries, each attempt under upstream_call.
+
+    Every attempt is admitted by the breaker and holds a scheduler slot on
+    its own, so the breaker and the adaptive limit see each 429 or 5xx, and
+    no slot is held while backing off. With a retry policy, usage reports
+    the retries the call needed.
+    """
+    async def attempt(remaining: float | None) -> LLMResponse:
+        async with upstream_call(breakers, scheduler, provider, model, identity, remaining):
+            return await call(remaining)
+
+    if retry is None:
+        return await attempt(timeout)
+    response, retries = await retry.run(attempt, timeout, replayable)
+    return replace(response, usage={**response.usage, "retries": retries})
@@ -0,0 +1,82 @@
+"""Exact-match LLM response cache with LRU eviction, TTL and a byte cap."""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from src.plugins.llm_query.providers.base import LLMResponse
+
+_ENTRY_OVERHEAD = 256  # rough per-entry bookkeeping cost in bytes
+
+
+def cache_key(
+    scope: str,
+    provider: str,
+    model: str,
+    prompt: str,
+    max_tokens: int,
+    system: str = "",
+) -> str:
+    """Hash the fields that fully determine an llm.query response."""
+    raw = json.dumps([scope, provider, model, system, prompt, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _size(response: LLMResponse) -> int:
+    return len(response.text.encode("utf-8")) + len(response.model) + _ENTRY_OVERHEAD
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of LLM responses bounded by total bytes and TTL."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float) -> None:
+        self._max_bytes = max_bytes
+        self._ttl = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, int, LLMResponse]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> LLMResponse | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, size, response = entry
+            if expires <= now:
+                del self._entries[key]
+                self._bytes -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key: str, response: LLMResponse) -> None:
+        size = _size(response)
+        if not response.cacheable or size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self._ttl, size, response)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
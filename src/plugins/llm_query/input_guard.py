@@ -1,41 +1,96 @@
 """Input validation for llm.query: size limit + repo-paste heuristic."""
 from __future__ import annotations
 
+import asyncio
 import re
 
 HARD_LIMIT_BYTES = 102_400  # 100 KB
 
 # Heuristics for detecting repo-paste attempts
-_CODE_FENCE_PATTERN = re.compile(r"```[\s\S]*?```", re.MULTILINE)
-_DEFINITION_PATTERN = re.compile(
-    r"^\s*(def |class |function |const |let |var |import |from |#include)",
-    re.MULTILINE,
-)
+MAX_CODE_FENCES = 10  # fenced blocks (pairs of ```)
+MAX_DEFINITIONS = 20
 
+# Inputs longer than this (in characters) are scanned in a worker thread
+OFFLOAD_THRESHOLD_CHARS = 16_384
 
-def check_input(text: str) -> list[str]:
-    """Validate LLM query input. Returns list of rejection reasons (empty if OK)."""
-    reasons: list[str] = []
+_DEFINITION_KEYWORDS = r"(?:def |class |function |const |let |var |import |from |#include)"
+# Definitions on the first line, and on every following line. Anchoring on a
+# literal "\n" (rather than MULTILINE "^") lets the regex engine skip ahead
+# with a fast literal search, and leading whitespace stops at the line end so
+# runs of blank lines cannot cause quadratic backtracking.
+_FIRST_LINE_DEFINITION = re.compile(r"[^\S\n]*" + _DEFINITION_KEYWORDS)
+_LINE_DEFINITION = re.compile(r"\n[^\S\n]*" + _DEFINITION_KEYWORDS)
 
-    byte_size = len(text.encode("utf-8"))
-    if byte_size > HARD_LIMIT_BYTES:
-        reasons.append(
-            f"Input size {byte_size} bytes exceeds hard limit of {HARD_LIMIT_BYTES} bytes"
+
+def _size_reason(text: str) -> str | None:
+    """Check the UTF-8 size without encoding unless the answer depends on it."""
+    chars = len(text)
+    if text.isascii():
+        size = chars
+    elif chars > HARD_LIMIT_BYTES:
+        # UTF-8 needs at least one byte per character
+        return (
+            f"Input size of at least {chars} bytes exceeds hard limit of {HARD_LIMIT_BYTES} bytes"
         )
-        return reasons  # No point checking heuristics on oversized input
+    elif chars * 4 <= HARD_LIMIT_BYTES:
+        return None  # at most 4 bytes per character
+    else:
+        size = len(text.encode("utf-8"))
+    if size > HARD_LIMIT_BYTES:
+        return f"Input size {size} bytes exceeds hard limit of {HARD_LIMIT_BYTES} bytes"
+    return None
+
+
+def _too_many_fences(text: str) -> bool:
+    """True once more than MAX_CODE_FENCES fenced blocks (marker pairs) are seen."""
+    markers_needed = 2 * (MAX_CODE_FENCES + 1)
+    pos = 0
+    for _ in range(markers_needed):
+        pos = text.find("```", pos)
+        if pos < 0:
+            return False
+        pos += 3
+    return True
+
+
+def _too_many_definitions(text: str) -> bool:
+    """True once more than MAX_DEFINITIONS definition lines are seen."""
+    count = 1 if _FIRST_LINE_DEFINITION.match(text) else 0
+    for _ in _LINE_DEFINITION.finditer(text):
+        count += 1
+        if count > MAX_DEFINITIONS:
+            return True
+    return count > MAX_DEFINITIONS
+
+
+def check_input(text: str) -> list[str]:
+    """Validate LLM query input. Returns list of rejection reasons (empty if OK).
+
+    Each heuristic scans the text once and stops as soon as its threshold is crossed.
+    """
+    size_reason = _size_reason(text)
+    if size_reason is not None:
+        return [size_reason]  # No point checking heuristics on oversized input
+
+    reasons: list[str] = []
 
     # Heuristic: many code fences suggest a repo paste
-    fences = _CODE_FENCE_PATTERN.findall(text)
-    if len(fences) > 10:
+    if _too_many_fences(text):
         reasons.append(
-            f"Input contains {len(fences)} code fences — suspected repo paste"
+            f"Input contains more than {MAX_CODE_FENCES} code fences — suspected repo paste"
         )
 
     # Heuristic: many function/class definitions
-    definitions = _DEFINITION_PATTERN.findall(text)
-    if len(definitions) > 20:
+    if _too_many_definitions(text):
         reasons.append(
-            f"Input contains {len(definitions)} code definitions — suspected repo paste"
+            f"Input contains more than {MAX_DEFINITIONS} code definitions — suspected repo paste"
         )
 
     return reasons
+
+
+async def check_input_async(text: str) -> list[str]:
+    """check_input, run in a worker thread for large inputs so the event loop stays responsive."""
+    if len(text) > OFFLOAD_THRESHOLD_CHARS:
+        return await asyncio.to_thread(check_input, text)
+    return check_input(text)
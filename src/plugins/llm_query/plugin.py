@@ -3,73 +3,73 @@ from __future__ import annotations
 
 import json
 import logging
-from typing import Any
+from typing import Any, Sequence
 
 from pydantic import BaseModel, Field
 
-from src.core.config import AppConfig
-from src.core.egress import GuardedHttpClient
+from src.core.config import AgentConfig, AppConfig, LLMRouteConfig
 from src.core.policy import PolicyEngine
-from src.core.types import Capability, PluginManifest
+from src.core.types import AgentIdentity, Capability, PluginManifest, PolicyDecision
 from src.plugins._base import ToolContext, ToolPlugin
-from src.plugins.llm_query.input_guard import check_input
-from src.plugins.llm_query.providers.anthropic import AnthropicProvider
-from src.plugins.llm_query.providers.base import LLMProvider
-from src.plugins.llm_query.providers.local import LocalProvider
-from src.plugins.llm_query.providers.openai import OpenAIProvider
+from src.plugins.llm_query.backend import LLMBackend, get_llm_backend
+from src.plugins.llm_query.cache import cache_key
+from src.plugins.llm_query.input_guard import HARD_LIMIT_BYTES, check_input_async
+from src.plugins.llm_query.providers.base import LLMProvider, LLMResponse, Message
+from src.plugins.llm_query.breaker import CircuitOpenError, guarded_call
+from src.plugins.llm_query.routing import RouteTarget
+from src.plugins.llm_query.sessions import fit_history
 
 logger = logging.getLogger("mcp_server")
 
 
+def _route_key(targets: list[RouteTarget]) -> str:
+    """The resolved targets a call may be served by, in order."""
+    return ",".join(f"{t.name}/{t.model}" for t in targets)
+
+
 class LLMQueryInput(BaseModel):
     provider: str = Field(description="LLM provider: 'openai', 'anthropic', or 'local'")
     model: str = Field(description="Model name (must be on allowlist)")
     prompt: str = Field(description="The prompt to send to the LLM")
+    system: str = Field(
+        default="",
+        description="Stable prefix reused across calls (instructions, templates, repo context); "
+        "sent ahead of the prompt so the provider can cache it and bill it at a discount",
+    )
     max_tokens: int = Field(default=1024, description="Maximum tokens in response")
+    new_session: bool = Field(
+        default=False,
+        description="Start a server-side conversation; the result carries its session_id",
+    )
+    session_id: str | None = Field(
+        default=None,
+        description="Continue a server-side conversation: send only the new message as prompt; "
+        "earlier turns are replayed from the session",
+    )
+    stream: bool = Field(
+        default=False,
+        description="Send partial text as MCP progress notifications while the model generates",
+    )
 
 
 class LLMQueryPlugin(ToolPlugin):
-    def __init__(self, config: AppConfig, policy_engine: PolicyEngine) -> None:
+    def __init__(
+        self,
+        config: AppConfig,
+        policy_engine: PolicyEngine,
+        backend: LLMBackend | None = None,
+    ) -> None:
         self._config = config
         self._policy = policy_engine
-        self._providers: dict[str, LLMProvider] = {}
-        self._init_providers()
-
-    def _init_providers(self) -> None:
-        for name, pcfg in self._config.llm.providers.items():
-            # Each provider gets its own GuardedHttpClient with egress enforced
-            # via the global allowlist (providers must be on agent's egress allowlist)
-            if name == "openai":
-                http_client = GuardedHttpClient(
-                    allowlist=["api.openai.com"],
-                    timeout=60.0,
-                )
-                self._providers["openai"] = OpenAIProvider(
-                    api_key=pcfg.api_key,
-                    base_url=pcfg.base_url or "https://api.openai.com/v1",
-                    http_client=http_client,
-                )
-            elif name == "anthropic":
-                http_client = GuardedHttpClient(
-                    allowlist=["api.anthropic.com"],
-                    timeout=60.0,
-                )
-                self._providers["anthropic"] = AnthropicProvider(
-                    api_key=pcfg.api_key,
-                    base_url=pcfg.base_url or "https://api.anthropic.com/v1",
-                    http_client=http_client,
-                )
-            elif name == "local":
-                from urllib.parse import urlparse
-                host = urlparse(pcfg.base_url or "http://localhost:11434").hostname or "localhost"
-                http_client = GuardedHttpClient(
-                    allowlist=[host],
-                    timeout=120.0,
-                )
-                self._providers["local"] = LocalProvider(
-                    base_url=pcfg.base_url or "http://localhost:11434",
-                    http_client=http_client,
-                )
+        self._backend = backend if backend is not None else LLMBackend(config)
+        self._providers = self._backend.providers
+        self._cache = self._backend.cache
+        self._single_flight = self._backend.single_flight
+        self._scheduler = self._backend.scheduler
+        self._breakers = self._backend.breakers
+        self._router = self._backend.router
+        self._retries = self._backend.retries
+        self._sessions = self._backend.sessions
 
     def manifest(self) -> PluginManifest:
         return PluginManifest(
@@ -90,57 +90,356 @@ class LLMQueryPlugin(ToolPlugin):
         if agent_cfg is None:
             return json.dumps({"error": f"Unknown agent: {identity.agent_id}"})
 
-        # Check egress allowlist for the provider
-        egress_decision = self._policy.check_egress(identity, self._get_provider_host(params.provider))
-        if not egress_decision.allowed:
-            return json.dumps({"error": "Egress denied", "reasons": egress_decision.reasons})
-
-        # Check provider exists
-        provider = self._providers.get(params.provider)
-        if provider is None:
-            return json.dumps({"error": f"Unknown provider: {params.provider}"})
-
-        # Check model allowlist
-        pcfg = self._config.llm.providers.get(params.provider)
-        if pcfg is None or params.model not in pcfg.allowed_models:
-            return json.dumps({
-                "error": f"Model '{params.model}' is not on the allowlist for provider '{params.provider}'"
-            })
+        provider, error = self._resolve_provider(identity, params.provider, params.model)
+        if error is not None:
+            return json.dumps(error)
+        assert provider is not None
+        targets, route = self._targets(identity, params.provider, params.model, provider)
 
         # Input guard
-        guard_reasons = check_input(params.prompt)
+        guard_reasons = await check_input_async(params.prompt)
+        if not guard_reasons and params.system:
+            guard_reasons = await check_input_async(params.system)
         if guard_reasons:
             return json.dumps({"error": "Input rejected", "reasons": guard_reasons})
 
+        # Conversation session: only the new message was sent, earlier turns are stored here
+        session_id, history, error = await self._session(identity, params)
+        if error is not None:
+            return json.dumps(error)
+        if history:
+            # Replayed turns reach the upstream too, so the whole conversation is kept
+            # within the guard's size limit. The heuristics are not re-run over it: each
+            # stored turn passed them when it was sent, and their counts would add up
+            # until an ordinary long conversation was rejected for good
+            history = fit_history(
+                history, HARD_LIMIT_BYTES - len(params.prompt.encode("utf-8"))
+            )
+
         # Cap max_tokens to agent limit
         max_tokens = min(params.max_tokens, agent_cfg.max_tokens_per_request)
 
-        # Execute query
+        # Exact-match response cache: hits cost nothing and skip the budget entirely.
+        # Session turns depend on the whole conversation, so they are never cached.
+        key = (
+            self._cache_key(identity, agent_cfg, targets, params.prompt, max_tokens, params.system)
+            if session_id is None
+            else None
+        )
+        cached = self._cache.get(key) if key is not None and self._cache is not None else None
+        if cached is not None:
+            if params.stream:
+                await ctx.report_progress(cached.text)
+            return json.dumps({
+                "text": cached.text,
+                "model": cached.model,
+                "usage": cached.usage,
+                "estimated_cost": 0.0,
+                "cached": True,
+            })
+
+        # Reserve the estimated cost up front so concurrent calls cannot overshoot the budget
+        budget = self._policy.budget_tracker
+        estimate = self._estimate(targets, params.prompt, max_tokens, params.system, history)
+        reservation = budget.reserve(identity.agent_id, estimate, agent_cfg.max_cost_per_day)
+        if reservation is None:
+            return json.dumps(self._budget_error(identity, agent_cfg, estimate))
+
+        # Execute query; the reservation is released unless it is committed
+        committed = False
         try:
-            response = await provider.query(params.model, params.prompt, max_tokens)
+            response, cost, coalesced = await self._complete(
+                ctx, targets, route, params.prompt, max_tokens,
+                system=params.system, history=history, stream=params.stream,
+            )
+            budget.commit(reservation, cost)
+            committed = True
+        except CircuitOpenError as exc:
+            logger.warning("LLM provider circuit open", extra={"provider": exc.provider, "model": exc.model})
+            return json.dumps(self._query_error(exc))
         except Exception as exc:
             logger.exception("LLM query failed", extra={"provider": params.provider, "model": params.model})
-            return json.dumps({"error": f"LLM query failed: {exc}"})
+            return json.dumps(self._query_error(exc))
+        finally:
+            if not committed:
+                budget.release(reservation)
 
-        # Record cost in budget tracker
-        if response.estimated_cost > 0:
-            self._policy.budget_tracker.record(identity.agent_id, response.estimated_cost)
+        if key is not None and self._cache is not None:
+            self._cache.put(key, response)
 
-        return json.dumps({
+        result: dict[str, Any] = {
             "text": response.text,
             "model": response.model,
             "usage": response.usage,
-            "estimated_cost": response.estimated_cost,
-        })
-
-    def _get_provider_host(self, provider_name: str) -> str:
-        hosts = {
-            "openai": "api.openai.com",
-            "anthropic": "api.anthropic.com",
-            "local": "localhost",
+            "estimated_cost": cost,
+            "cached": False,
+            "coalesced": coalesced,
         }
-        return hosts.get(provider_name, "unknown")
+        if session_id is not None and self._sessions is not None:
+            await self._sessions.append(identity.agent_id, session_id, [
+                {"role": "user", "content": params.prompt},
+                {"role": "assistant", "content": response.text},
+            ])
+            result["session_id"] = session_id
+        return json.dumps(result)
+
+    @staticmethod
+    def _query_error(exc: Exception) -> dict[str, Any]:
+        """Error result for a failed upstream call."""
+        if isinstance(exc, CircuitOpenError):
+            return {
+                "error": "Provider unavailable",
+                "reason": "circuit_open",
+                "provider": exc.provider,
+                "model": exc.model,
+                "retry_after_seconds": round(exc.retry_after, 1),
+            }
+        return {"error": f"LLM query failed: {exc}"}
+
+    async def _session(
+        self,
+        identity: AgentIdentity,
+        params: LLMQueryInput,
+    ) -> tuple[str | None, list[Message], dict[str, Any] | None]:
+        """Resolve the call's session; returns (session_id, history, error)."""
+        if params.session_id is None and not params.new_session:
+            return None, [], None
+        if self._sessions is None:
+            return None, [], {"error": "Conversation sessions are disabled"}
+        if params.session_id is None:
+            return self._sessions.new_session_id(), [], None
+        if params.new_session:
+            return None, [], {"error": "Pass either session_id or new_session, not both"}
+        # Sessions are keyed by agent, so one agent cannot read another's conversation
+        history = await self._sessions.history(identity.agent_id, params.session_id)
+        if history is None:
+            return None, [], {"error": f"Unknown or expired session: {params.session_id}"}
+        return params.session_id, history, None
+
+    def _resolve_provider(
+        self,
+        identity: AgentIdentity,
+        provider_name: str,
+        model: str,
+    ) -> tuple[LLMProvider | None, dict[str, Any] | None]:
+        """Resolve the provider for a call; returns (provider, None) or (None, error)."""
+        # Check egress allowlist for the provider
+        egress_decision = self._check_egress(identity, provider_name)
+        if not egress_decision.allowed:
+            return None, {"error": "Egress denied", "reasons": egress_decision.reasons}
+
+        # Check provider exists
+        provider = self._providers.get(provider_name)
+        if provider is None:
+            return None, {"error": f"Unknown provider: {provider_name}"}
+
+        # Check model allowlist
+        pcfg = self._config.llm.providers.get(provider_name)
+        if pcfg is None or model not in pcfg.allowed_models:
+            return None, {
+                "error": f"Model '{model}' is not on the allowlist for provider '{provider_name}'"
+            }
+        return provider, None
+
+    def _cache_key(
+        self,
+        identity: AgentIdentity,
+        agent_cfg: AgentConfig,
+        targets: list[RouteTarget],
+        prompt: str,
+        max_tokens: int,
+        system: str = "",
+    ) -> str | None:
+        """Response cache key for a call, or None if the agent does not use the cache.
+
+        A cached response may have come from any of the route targets (a
+        fallback or hedge), so like _flight_key the key covers the resolved
+        target list: a tenant-scoped entry is never served to an agent whose
+        allowlists resolve the route differently.
+        """
+        if self._cache is None or not agent_cfg.llm_cache:
+            return None
+        scope = (
+            f"tenant:{identity.tenant_id}"
+            if agent_cfg.llm_cache_scope == "tenant"
+            else f"agent:{identity.agent_id}"
+        )
+        return cache_key(scope, _route_key(targets), targets[0].model, prompt, max_tokens, system)
+
+    def _budget_error(
+        self,
+        identity: AgentIdentity,
+        agent_cfg: AgentConfig,
+        estimate: float,
+    ) -> dict[str, Any]:
+        remaining = self._policy.budget_tracker.check(identity.agent_id, agent_cfg.max_cost_per_day)
+        return {
+            "error": "Budget exceeded",
+            "reasons": [
+                f"Estimated cost ${estimate:.4f} exceeds remaining daily budget ${remaining:.4f}"
+            ],
+        }
+
+    def _targets(
+        self,
+        identity: AgentIdentity,
+        provider_name: str,
+        model: str,
+        provider: LLMProvider,
+    ) -> tuple[list[RouteTarget], LLMRouteConfig | None]:
+        """Requested target first, then usable alternates from its model group, if any.
+
+        Alternates must be configured, on their provider's allowed_models and
+        reachable under the agent's egress policy.
+        """
+        primary = RouteTarget(name=provider_name, provider=provider, model=model)
+        for route in self._config.llm.routes.values():
+            if not any(t.provider == provider_name and t.model == model for t in route.targets):
+                continue
+            targets = [primary]
+            for alt in route.targets:
+                if alt.provider == provider_name and alt.model == model:
+                    continue
+                alt_provider = self._providers.get(alt.provider)
+                pcfg = self._config.llm.providers.get(alt.provider)
+                if alt_provider is None or pcfg is None or alt.model not in pcfg.allowed_models:
+                    continue
+                if not self._check_egress(identity, alt.provider).allowed:
+                    continue
+                targets.append(RouteTarget(name=alt.provider, provider=alt_provider, model=alt.model))
+            return targets, route
+        return [primary], None
+
+    @staticmethod
+    def _estimate(
+        targets: list[RouteTarget],
+        prompt: str,
+        max_tokens: int,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> float:
+        """Budget to hold: the dearest target that might end up serving the call.
+
+        The system prefix and any replayed conversation are estimated at full
+        price; cache discounts are reconciled from actual usage when the
+        reservation is committed.
+        """
+        text = system + "".join(m["content"] for m in history) + prompt
+        return max(t.provider.estimate_cost(t.model, text, max_tokens) for t in targets)
+
+    async def _complete(
+        self,
+        ctx: ToolContext,
+        targets: list[RouteTarget],
+        route: LLMRouteConfig | None,
+        prompt: str,
+        max_tokens: int,
+        system: str = "",
+        history: Sequence[Message] = (),
+        stream: bool = False,
+    ) -> tuple[LLMResponse, float, bool]:
+        """Run one upstream completion. Returns (response, cost to charge, coalesced)."""
+        primary = targets[0]
+        retry = self._retries.get(primary.name)
+        if stream:
+            delivered = False
+
+            async def on_text(text: str) -> None:
+                nonlocal delivered
+                delivered = True
+                await ctx.report_progress(text)
+
+            async def stream_once(timeout: float | None) -> LLMResponse:
+                return await primary.provider.stream(
+                    primary.model,
+                    prompt,
+                    max_tokens,
+                    on_text=on_text,
+                    timeout=timeout,
+                    system=system,
+                    history=history,
+                )
+
+            # Once text has reached the caller the stream cannot be started over
+            response = await guarded_call(
+                self._breakers, self._scheduler, retry, primary.name, primary.model,
+                ctx.identity, stream_once, ctx.remaining_time(), replayable=lambda: not delivered,
+            )
+            return response, response.estimated_cost, False
+
+        async def upstream() -> LLMResponse:
+            if route is not None and len(targets) > 1:
+                # Hedge/fallback across the model group; only the kept response is returned
+                return await self._router.query(
+                    targets, route, prompt, max_tokens, ctx.remaining_time,
+                    system=system, history=history, identity=ctx.identity,
+                )
+            async def once(timeout: float | None) -> LLMResponse:
+                return await primary.provider.query(
+                    primary.model,
+                    prompt,
+                    max_tokens,
+                    timeout=timeout,
+                    system=system,
+                    history=history,
+                )
+
+            return await guarded_call(
+                self._breakers, self._scheduler, retry, primary.name, primary.model,
+                ctx.identity, once, ctx.remaining_time(),
+            )
+
+        if self._single_flight is not None and not history:
+            # Identical in-flight calls share one upstream request; each
+            # caller is charged its share under the attribution policy
+            flight = await self._single_flight.do(
+                self._flight_key(ctx.identity, targets, prompt, max_tokens, system),
+                upstream,
+            )
+            response = flight.value
+            return response, response.estimated_cost * flight.cost_share, flight.coalesced
+
+        response = await upstream()
+        return response, response.estimated_cost, False
+
+    def _flight_key(
+        self,
+        identity: AgentIdentity,
+        targets: list[RouteTarget],
+        prompt: str,
+        max_tokens: int,
+        system: str = "",
+    ) -> str:
+        """Key for sharing an in-flight call.
+
+        The leader's call may be answered by any of its route targets, which
+        were filtered by the leader's own model allowlist and egress policy,
+        so only callers resolving to the same target list can share it.
+        """
+        scope = (
+            "global"
+            if self._config.llm.single_flight.scope == "global"
+            else f"tenant:{identity.tenant_id}"
+        )
+        return cache_key(scope, _route_key(targets), targets[0].model, prompt, max_tokens, system)
+
+    def _check_egress(self, identity: AgentIdentity, provider_name: str) -> PolicyDecision:
+        """The agent must be allowed to reach every host the provider may call."""
+        for host in self._backend.hosts.get(provider_name, ["unknown"]):
+            decision = self._policy.check_egress(identity, host)
+            if not decision.allowed:
+                return decision
+        return PolicyDecision.allow()
 
 
-def create_plugin(config: AppConfig, policy_engine: PolicyEngine, **kwargs: Any) -> LLMQueryPlugin:
-    return LLMQueryPlugin(config=config, policy_engine=policy_engine)
+def create_plugin(
+    config: AppConfig,
+    policy_engine: PolicyEngine,
+    services: dict[str, Any] | None = None,
+    **kwargs: Any,
+) -> LLMQueryPlugin:
+    return LLMQueryPlugin(
+        config=config,
+        policy_engine=policy_engine,
+        backend=get_llm_backend(config, services),
+    )
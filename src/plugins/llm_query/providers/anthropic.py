@@ -1,14 +1,29 @@
 """Anthropic provider using GuardedHttpClient for egress enforcement."""
 from __future__ import annotations
 
+import json
+from typing import Any, Sequence
+
 from src.core.egress import GuardedHttpClient
-from src.plugins.llm_query.providers.base import LLMProvider, LLMResponse
+from src.plugins.llm_query.providers.base import (
+    LLMProvider,
+    LLMResponse,
+    Message,
+    TextCallback,
+    estimate_tokens,
+    iter_sse_data,
+    timeout_kwargs,
+)
 
 _COST_PER_1K: dict[str, float] = {
     "claude-sonnet-4-20250514": 0.006,
     "claude-haiku-4-5-20251001": 0.002,
 }
 
+# Prompt-cache pricing relative to the base input rate
+_CACHE_WRITE_MULTIPLIER = 1.25
+_CACHE_READ_MULTIPLIER = 0.1
+
 
 class AnthropicProvider(LLMProvider):
     def __init__(self, api_key: str, base_url: str, http_client: GuardedHttpClient) -> None:
@@ -19,50 +34,148 @@ class AnthropicProvider(LLMProvider):
     def provider_name(self) -> str:
         return "anthropic"
 
-    async def query(self, model: str, prompt: str, max_tokens: int) -> LLMResponse:
-        if not self._api_key:
-            return LLMResponse(
-                text="Error: Anthropic API key is not configured. Set ANTHROPIC_API_KEY in environment.",
-                model=model,
-            )
+    def _missing_key(self, model: str) -> LLMResponse:
+        return LLMResponse(
+            text="Error: Anthropic API key is not configured. Set ANTHROPIC_API_KEY in environment.",
+            model=model,
+            cacheable=False,
+        )
 
-        url = f"{self._base_url}/messages"
-        payload = {
+    def _payload(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        system: str,
+        history: Sequence[Message],
+    ) -> dict[str, Any]:
+        messages: list[dict[str, Any]] = [dict(m) for m in history]
+        if messages:
+            # Cache the conversation so far; the next turn reads it back at a discount
+            last = messages[-1]
+            last["content"] = [
+                {"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}
+            ]
+        messages.append({"role": "user", "content": prompt})
+        payload: dict[str, Any] = {
             "model": model,
             "max_tokens": max_tokens,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": messages,
         }
+        if system:
+            # Mark the end of the stable prefix so later calls read it from cache
+            payload["system"] = [
+                {"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}
+            ]
+        return payload
 
-        resp = await self._http.post(
-            url,
-            json=payload,
-            headers={
-                "x-api-key": self._api_key,
-                "anthropic-version": "2023-06-01",
-                "Content-Type": "application/json",
-            },
-        )
-        resp.raise_for_status()
-        data = resp.json()
+    def _headers(self) -> dict[str, str]:
+        return {
+            "x-api-key": self._api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json",
+        }
 
-        text_blocks = [b["text"] for b in data.get("content", []) if b.get("type") == "text"]
-        text = "\n".join(text_blocks)
-        usage = data.get("usage", {})
+    def _response(self, model: str, text: str, usage: dict[str, Any]) -> LLMResponse:
         input_tokens = usage.get("input_tokens", 0)
         output_tokens = usage.get("output_tokens", 0)
-        total = input_tokens + output_tokens
-        cost = (total / 1000) * _COST_PER_1K.get(model, 0.005)
-
+        # input_tokens excludes the cached prefix, which is billed separately
+        cache_write = usage.get("cache_creation_input_tokens") or 0
+        cache_read = usage.get("cache_read_input_tokens") or 0
+        total = input_tokens + output_tokens + cache_write + cache_read
+        billed = (
+            input_tokens
+            + output_tokens
+            + cache_write * _CACHE_WRITE_MULTIPLIER
+            + cache_read * _CACHE_READ_MULTIPLIER
+        )
+        cost = (billed / 1000) * _COST_PER_1K.get(model, 0.005)
         return LLMResponse(
             text=text,
             model=model,
             usage={
                 "input_tokens": input_tokens,
                 "output_tokens": output_tokens,
+                "cache_creation_input_tokens": cache_write,
+                "cache_read_input_tokens": cache_read,
                 "total_tokens": total,
             },
             estimated_cost=cost,
         )
 
+    async def query(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        if not self._api_key:
+            return self._missing_key(model)
+
+        resp = await self._http.post(
+            f"{self._base_url}/messages",
+            json=self._payload(model, prompt, max_tokens, system, history),
+            **timeout_kwargs(timeout),
+            headers=self._headers(),
+        )
+        resp.raise_for_status()
+        data = resp.json()
+
+        text_blocks = [b["text"] for b in data.get("content", []) if b.get("type") == "text"]
+        return self._response(model, "\n".join(text_blocks), data.get("usage", {}))
+
+    async def stream(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        on_text: TextCallback,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        if not self._api_key:
+            return self._missing_key(model)
+
+        payload = self._payload(model, prompt, max_tokens, system, history)
+        payload["stream"] = True
+
+        parts: list[str] = []
+        usage: dict[str, Any] = {}
+        async with self._http.stream(
+            "POST",
+            f"{self._base_url}/messages",
+            json=payload,
+            **timeout_kwargs(timeout),
+            headers=self._headers(),
+        ) as resp:
+            resp.raise_for_status()
+            async for data in iter_sse_data(resp):
+                event = json.loads(data)
+                kind = event.get("type")
+                if kind == "message_start":
+                    # Input tokens are reported up front, output tokens at the end
+                    usage.update(event.get("message", {}).get("usage", {}))
+                elif kind == "content_block_delta":
+                    delta = event.get("delta", {})
+                    if delta.get("type") == "text_delta" and delta.get("text"):
+                        parts.append(delta["text"])
+                        await on_text(delta["text"])
+                elif kind == "message_delta":
+                    usage.update(event.get("usage", {}))
+                elif kind == "message_stop":
+                    break
+                elif kind == "error":
+                    raise RuntimeError(event.get("error", {}).get("message", "stream error"))
+
+        return self._response(model, "".join(parts), usage)
+
+    def estimate_cost(self, model: str, prompt: str, max_tokens: int) -> float:
+        tokens = estimate_tokens(prompt) + max_tokens
+        return (tokens / 1000) * _COST_PER_1K.get(model, 0.005)
+
     async def close(self) -> None:
         await self._http.aclose()
@@ -3,6 +3,15 @@ from __future__ import annotations
 
 import abc
 from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Sequence
+
+import httpx
+
+# Receives each chunk of generated text as it arrives
+TextCallback = Callable[[str], Awaitable[None]]
+
+# One conversation turn: {"role": "user" | "assistant", "content": text}
+Message = dict[str, str]
 
 
 @dataclass(frozen=True)
@@ -11,6 +20,27 @@ class LLMResponse:
     model: str
     usage: dict[str, int] = field(default_factory=dict)
     estimated_cost: float = 0.0
+    # False for locally generated placeholders (e.g. a missing API key) that must not be cached
+    cacheable: bool = True
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def timeout_kwargs(timeout: float | None) -> dict[str, Any]:
+    """httpx request kwargs for a remaining time budget (None keeps the client default)."""
+    if timeout is None:
+        return {}
+    return {"timeout": timeout}
+
+
+async def iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """Yield the `data:` payloads of a server-sent events stream."""
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            yield line[5:].strip()
 
 
 class LLMProvider(abc.ABC):
@@ -24,9 +54,54 @@ class LLMProvider(abc.ABC):
         model: str,
         prompt: str,
         max_tokens: int,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
     ) -> LLMResponse:
+        """Run a completion. `timeout` is the caller's remaining time budget in seconds.
+
+        `system` is a stable prefix (instructions, templates, shared context)
+        sent ahead of the prompt in a form the provider can cache across calls.
+        `history` holds earlier turns of a conversation, oldest first; `prompt`
+        is the new user message.
+        """
         ...
 
+    async def stream(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        on_text: TextCallback,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        """Run a completion, passing text deltas to `on_text` as they are generated.
+
+        Returns the full response with final usage. Providers without a
+        streaming API deliver the whole text as a single delta.
+        """
+        response = await self.query(
+            model, prompt, max_tokens, timeout=timeout, system=system, history=history
+        )
+        if response.text:
+            await on_text(response.text)
+        return response
+
+    def estimate_cost(self, model: str, prompt: str, max_tokens: int) -> float:
+        """Cost estimate used to reserve budget before dispatch.
+
+        Assumes the full `max_tokens` are generated, but the prompt is counted
+        with the `estimate_tokens` heuristic, so this is not an upper bound:
+        dense text or code can cost more. The reservation is settled with the
+        actual cost afterwards.
+        """
+        return 0.0
+
+    async def start(self) -> None:
+        """Start background work (e.g. endpoint health checks); called at app startup."""
+
     @abc.abstractmethod
     async def close(self) -> None:
         ...
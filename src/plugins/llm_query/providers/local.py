@@ -1,43 +1,412 @@
-"""Local/Ollama-compatible provider using GuardedHttpClient."""
+"""Local/Ollama-compatible provider using GuardedHttpClient.
+
+The provider can front several Ollama endpoints. Each call goes to a healthy
+endpoint that already has the model loaded if there is one (model affinity),
+otherwise to the healthy endpoint with the fewest requests in flight. A
+background task polls every endpoint's /api/ps to track health and which
+models are resident.
+
+Cold loads cost tens of seconds, so models can be preloaded at startup and
+kept resident during working hours by periodic empty requests, which load
+a model without generating anything.
+"""
 from __future__ import annotations
 
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Sequence
+from zoneinfo import ZoneInfo
+
+import httpx
+
+from src.core.config import LLMKeepWarmConfig
 from src.core.egress import GuardedHttpClient
-from src.plugins.llm_query.providers.base import LLMProvider, LLMResponse
+from src.plugins.llm_query.providers.base import (
+    LLMProvider,
+    LLMResponse,
+    Message,
+    TextCallback,
+    timeout_kwargs,
+)
+
+logger = logging.getLogger("mcp_server")
+
+# A resident endpoint keeps a model's traffic until it has this many more
+# requests in flight than the least busy endpoint
+_AFFINITY_SLACK = 4
+
+
+def _model_names(name: str) -> set[str]:
+    """Names under which Ollama may report a model ("llama3" is "llama3:latest")."""
+    if ":" in name:
+        base, tag = name.split(":", 1)
+        return {name, base} if tag == "latest" else {name}
+    return {name, f"{name}:latest"}
+
+
+def in_working_hours(config: LLMKeepWarmConfig, now: datetime) -> bool:
+    """Whether `now` falls in the keep-warm window (the end time is exclusive)."""
+    clock = now.strftime("%H:%M")
+    if config.start <= config.end:
+        return now.weekday() in config.days and config.start <= clock < config.end
+    # Overnight: the evening belongs to today, the early morning to yesterday
+    if clock >= config.start:
+        return now.weekday() in config.days
+    return clock < config.end and (now.weekday() - 1) % 7 in config.days
+
+
+def _ms(nanoseconds: int | None) -> int:
+    return (nanoseconds or 0) // 1_000_000
+
+
+@dataclass
+class _Endpoint:
+    base_url: str
+    outstanding: int = 0
+    healthy: bool = True
+    models: set[str] = field(default_factory=set)  # resident models, per the last /api/ps
+    failed_models: set[str] = field(default_factory=set)  # 5xx here, until the next check
+    requests: int = 0
+    failures: int = 0
+    checked_at: float | None = None
+    warmups: int = 0
+    load_seconds: float = 0.0  # time spent loading models, from Ollama's load_duration
 
 
 class LocalProvider(LLMProvider):
-    def __init__(self, base_url: str, http_client: GuardedHttpClient) -> None:
-        self._base_url = base_url.rstrip("/")
+    def __init__(
+        self,
+        base_url: str,
+        http_client: GuardedHttpClient,
+        endpoints: Sequence[str] = (),
+        health_check_interval: float = 15.0,
+        keep_alive: str | int | None = None,
+        preload: Sequence[str] = (),
+        keep_warm: LLMKeepWarmConfig | None = None,
+        keep_warm_models: Sequence[str] = (),
+    ) -> None:
+        urls = list(endpoints) or [base_url]
+        self._endpoints = [_Endpoint(base_url=url.rstrip("/")) for url in urls]
         self._http = http_client
+        self._health_check_interval = health_check_interval
+        self._health_task: asyncio.Task[None] | None = None
+        self._keep_alive = keep_alive
+        self._preload = list(preload)
+        self._keep_warm = keep_warm if keep_warm is not None and keep_warm.enabled else None
+        self._keep_warm_models = list(keep_warm_models)
+        self._keep_warm_task: asyncio.Task[None] | None = None
 
     def provider_name(self) -> str:
         return "local"
 
-    async def query(self, model: str, prompt: str, max_tokens: int) -> LLMResponse:
-        url = f"{self._base_url}/api/generate"
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {"num_predict": max_tokens},
-        }
-
-        resp = await self._http.post(
-            url,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        )
-        resp.raise_for_status()
-        data = resp.json()
+    def _candidates(self, names: set[str]) -> list[_Endpoint]:
+        """Healthy endpoints where the model has not failed (all of them if none are)."""
+        return [
+            e for e in self._endpoints if e.healthy and not e.failed_models & names
+        ] or self._endpoints
+
+    def _pick(self, model: str) -> _Endpoint:
+        """Least-outstanding healthy endpoint, preferring ones with the model resident."""
+        names = _model_names(model)
+        candidates = self._candidates(names)
+        least = min(candidates, key=lambda e: e.outstanding)
+        resident = [e for e in candidates if e.models & names]
+        if resident:
+            best = min(resident, key=lambda e: e.outstanding)
+            if best.outstanding <= least.outstanding + _AFFINITY_SLACK:
+                return best
+        return least
 
+    @asynccontextmanager
+    async def _endpoint(self, model: str) -> AsyncIterator[_Endpoint]:
+        """Hold an endpoint for one call and track its outcome."""
+        endpoint = self._pick(model)
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        # With one endpoint there is nowhere else to route and no health loop
+        # to put it back, so failures are only counted
+        rotate = len(self._endpoints) > 1
+        try:
+            yield endpoint
+        except httpx.HTTPStatusError as exc:
+            if exc.response.status_code >= 500:
+                # Often the model rather than the server (e.g. it does not fit in
+                # memory), so only this model avoids the endpoint until the next check
+                endpoint.failures += 1
+                if rotate:
+                    endpoint.failed_models |= _model_names(model)
+            raise
+        except httpx.TransportError as exc:
+            # A read timeout is the caller's deadline or a long generation on a
+            # reachable server; anything else means the endpoint is not answering
+            if not isinstance(exc, (httpx.ReadTimeout, httpx.WriteTimeout, httpx.PoolTimeout)):
+                endpoint.failures += 1
+                if rotate:
+                    endpoint.healthy = False
+            raise
+        else:
+            endpoint.models |= _model_names(model)  # the model is loaded there now
+        finally:
+            endpoint.outstanding -= 1
+
+    async def check_health(self) -> None:
+        """Poll /api/ps on every endpoint: reachability and resident models."""
+        async def _check(endpoint: _Endpoint) -> None:
+            try:
+                resp = await self._http.get(f"{endpoint.base_url}/api/ps", timeout=5.0)
+                resp.raise_for_status()
+                loaded = resp.json().get("models") or []
+            except (httpx.HTTPError, ValueError) as exc:
+                if endpoint.healthy:
+                    logger.warning(
+                        "Local LLM endpoint unhealthy",
+                        extra={"endpoint": endpoint.base_url, "error": str(exc)},
+                    )
+                endpoint.healthy = False
+            else:
+                endpoint.healthy = True
+                endpoint.failed_models.clear()
+                endpoint.models = {
+                    name
+                    for m in loaded
+                    for name in _model_names(m.get("name") or m.get("model") or "")
+                }
+            endpoint.checked_at = time.time()
+
+        await asyncio.gather(*(_check(e) for e in self._endpoints))
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self.check_health()
+            except Exception:
+                logger.exception("Local endpoint health check failed")
+            await asyncio.sleep(self._health_check_interval)
+
+    def _warm_target(self, model: str) -> _Endpoint:
+        """Where to load `model`: where it is resident, else the least loaded endpoint."""
+        names = _model_names(model)
+        candidates = self._candidates(names)
+        resident = [e for e in candidates if e.models & names]
+        return resident[0] if resident else min(candidates, key=lambda e: len(e.models))
+
+    async def warm(self, models: Sequence[str]) -> None:
+        """Load each model (or refresh its keep-alive) without generating anything.
+
+        Models are loaded one at a time so they do not compete for memory.
+        Failures are logged, not raised.
+        """
+        for model in models:
+            endpoint = self._warm_target(model)
+            body: dict[str, Any] = {"model": model}
+            if self._keep_alive is not None:
+                body["keep_alive"] = self._keep_alive
+            try:
+                resp = await self._http.post(
+                    f"{endpoint.base_url}/api/generate",
+                    json=body,
+                    headers={"Content-Type": "application/json"},
+                )
+                resp.raise_for_status()
+                data = resp.json()
+            except (httpx.HTTPError, ValueError) as exc:
+                logger.warning(
+                    "Failed to warm local model",
+                    extra={"endpoint": endpoint.base_url, "model": model, "error": str(exc)},
+                )
+                continue
+            endpoint.warmups += 1
+            endpoint.models |= _model_names(model)
+            self._record_load(endpoint, data)
+            if data.get("load_duration"):
+                logger.info(
+                    "Warmed local model",
+                    extra={
+                        "endpoint": endpoint.base_url,
+                        "model": model,
+                        "load_duration_ms": _ms(data.get("load_duration")),
+                    },
+                )
+
+    async def _keep_warm_loop(self, config: LLMKeepWarmConfig) -> None:
+        zone = ZoneInfo(config.timezone)
+        while True:
+            try:
+                if in_working_hours(config, datetime.now(zone)):
+                    await self.warm(self._keep_warm_models)
+            except Exception:
+                logger.exception("Keep-warm pass failed")
+            await asyncio.sleep(config.interval_seconds)
+
+    async def start(self) -> None:
+        if self._preload:
+            if len(self._endpoints) > 1:
+                await self.check_health()  # load models where they already are
+            await self.warm(self._preload)
+        if len(self._endpoints) > 1 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+        if self._keep_warm is not None and self._keep_warm_models and self._keep_warm_task is None:
+            self._keep_warm_task = asyncio.create_task(self._keep_warm_loop(self._keep_warm))
+
+    @staticmethod
+    def _record_load(endpoint: _Endpoint, data: dict[str, Any]) -> None:
+        endpoint.load_seconds += (data.get("load_duration") or 0) / 1e9
+
+    def endpoint_stats(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "base_url": e.base_url,
+                "healthy": e.healthy,
+                "outstanding": e.outstanding,
+                "requests": e.requests,
+                "failures": e.failures,
+                "resident_models": sorted(e.models),
+                "failed_models": sorted(e.failed_models),
+                "checked_at": e.checked_at,
+                "warmups": e.warmups,
+                "load_seconds": e.load_seconds,
+            }
+            for e in self._endpoints
+        ]
+
+    def _request(
+        self,
+        base_url: str,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        stream: bool,
+        system: str,
+        history: Sequence[Message],
+    ) -> tuple[str, dict[str, Any]]:
+        """Return (url, body): /api/chat for conversations, /api/generate otherwise."""
+        options = {"num_predict": max_tokens}
+        if history:
+            messages = [{"role": "system", "content": system}] if system else []
+            messages.extend(history)
+            messages.append({"role": "user", "content": prompt})
+            url = f"{base_url}/api/chat"
+            payload: dict[str, Any] = {
+                "model": model,
+                "messages": messages,
+                "stream": stream,
+                "options": options,
+            }
+        else:
+            url = f"{base_url}/api/generate"
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": stream,
+                "options": options,
+            }
+            if system:
+                payload["system"] = system
+        if self._keep_alive is not None:
+            payload["keep_alive"] = self._keep_alive
+        return url, payload
+
+    @staticmethod
+    def _text(chunk: dict[str, Any]) -> str:
+        """Generated text of a /api/generate or /api/chat response (or stream chunk)."""
+        if "message" in chunk:
+            return (chunk.get("message") or {}).get("content", "")
+        return chunk.get("response", "")
+
+    def _response(self, model: str, text: str, data: dict[str, Any]) -> LLMResponse:
+        # Time spent loading a cold model is reported apart from generation time
         return LLMResponse(
-            text=data.get("response", ""),
+            text=text,
             model=model,
             usage={
                 "total_tokens": data.get("eval_count", 0) + data.get("prompt_eval_count", 0),
+                "load_duration_ms": _ms(data.get("load_duration")),
+                "prompt_eval_duration_ms": _ms(data.get("prompt_eval_duration")),
+                "eval_duration_ms": _ms(data.get("eval_duration")),
             },
             estimated_cost=0.0,
         )
 
+    async def query(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        async with self._endpoint(model) as endpoint:
+            url, body = self._request(
+                endpoint.base_url, model, prompt, max_tokens, False, system, history
+            )
+            resp = await self._http.post(
+                url,
+                json=body,
+                **timeout_kwargs(timeout),
+                headers={"Content-Type": "application/json"},
+            )
+            resp.raise_for_status()
+            data = resp.json()
+            self._record_load(endpoint, data)
+        return self._response(model, self._text(data), data)
+
+    async def stream(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        on_text: TextCallback,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        parts: list[str] = []
+        final: dict[str, Any] = {}
+        async with self._endpoint(model) as endpoint:
+            url, body = self._request(
+                endpoint.base_url, model, prompt, max_tokens, True, system, history
+            )
+            async with self._http.stream(
+                "POST",
+                url,
+                json=body,
+                **timeout_kwargs(timeout),
+                headers={"Content-Type": "application/json"},
+            ) as resp:
+                resp.raise_for_status()
+                # Newline-delimited JSON; the last object (done=true) carries the token counts
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    delta = self._text(chunk)
+                    if delta:
+                        parts.append(delta)
+                        await on_text(delta)
+                    if chunk.get("done"):
+                        final = chunk
+                        break
+            self._record_load(endpoint, final)
+        return self._response(model, "".join(parts), final)
+
     async def close(self) -> None:
+        for task in (self._health_task, self._keep_warm_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                except Exception:
+                    # A task that died earlier must not keep the pool from closing
+                    logger.exception("Local provider background task failed")
+        self._health_task = self._keep_warm_task = None
         await self._http.aclose()
@@ -2,9 +2,18 @@
 from __future__ import annotations
 
 import json
+from typing import Any, Sequence
 
 from src.core.egress import GuardedHttpClient
-from src.plugins.llm_query.providers.base import LLMProvider, LLMResponse
+from src.plugins.llm_query.providers.base import (
+    LLMProvider,
+    LLMResponse,
+    Message,
+    TextCallback,
+    estimate_tokens,
+    iter_sse_data,
+    timeout_kwargs,
+)
 
 # Rough cost estimates per 1K tokens (input + output averaged)
 _COST_PER_1K: dict[str, float] = {
@@ -12,6 +21,9 @@ _COST_PER_1K: dict[str, float] = {
     "gpt-4o-mini": 0.0003,
 }
 
+# Cached prompt tokens are billed at this fraction of the normal rate
+_CACHED_TOKEN_MULTIPLIER = 0.5
+
 
 class OpenAIProvider(LLMProvider):
     def __init__(self, api_key: str, base_url: str, http_client: GuardedHttpClient) -> None:
@@ -22,46 +34,125 @@ class OpenAIProvider(LLMProvider):
     def provider_name(self) -> str:
         return "openai"
 
-    async def query(self, model: str, prompt: str, max_tokens: int) -> LLMResponse:
-        if not self._api_key:
-            return LLMResponse(
-                text="Error: OpenAI API key is not configured. Set OPENAI_API_KEY in environment.",
-                model=model,
-            )
+    def _missing_key(self, model: str) -> LLMResponse:
+        return LLMResponse(
+            text="Error: OpenAI API key is not configured. Set OPENAI_API_KEY in environment.",
+            model=model,
+            cacheable=False,
+        )
 
-        url = f"{self._base_url}/chat/completions"
-        payload = {
+    def _payload(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        system: str,
+        history: Sequence[Message],
+    ) -> dict[str, Any]:
+        # Prefix caching matches on the leading tokens, so the stable system
+        # block goes first, then earlier turns, and the new message last
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.extend(history)
+        messages.append({"role": "user", "content": prompt})
+        return {
             "model": model,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": messages,
             "max_tokens": max_tokens,
         }
 
-        resp = await self._http.post(
-            url,
-            json=payload,
-            headers={
-                "Authorization": f"Bearer {self._api_key}",
-                "Content-Type": "application/json",
-            },
-        )
-        resp.raise_for_status()
-        data = resp.json()
+    def _headers(self) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self._api_key}",
+            "Content-Type": "application/json",
+        }
 
-        text = data["choices"][0]["message"]["content"]
-        usage = data.get("usage", {})
+    def _response(self, model: str, text: str, usage: dict[str, Any]) -> LLMResponse:
         total_tokens = usage.get("total_tokens", 0)
-        cost = (total_tokens / 1000) * _COST_PER_1K.get(model, 0.01)
-
+        # prompt_tokens includes the cached ones; only the discount is subtracted
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        billed = total_tokens - cached_tokens * (1 - _CACHED_TOKEN_MULTIPLIER)
+        cost = (billed / 1000) * _COST_PER_1K.get(model, 0.01)
         return LLMResponse(
             text=text,
             model=model,
             usage={
                 "prompt_tokens": usage.get("prompt_tokens", 0),
                 "completion_tokens": usage.get("completion_tokens", 0),
+                "cached_tokens": cached_tokens,
                 "total_tokens": total_tokens,
             },
             estimated_cost=cost,
         )
 
+    async def query(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        if not self._api_key:
+            return self._missing_key(model)
+
+        resp = await self._http.post(
+            f"{self._base_url}/chat/completions",
+            json=self._payload(model, prompt, max_tokens, system, history),
+            **timeout_kwargs(timeout),
+            headers=self._headers(),
+        )
+        resp.raise_for_status()
+        data = resp.json()
+
+        text = data["choices"][0]["message"]["content"]
+        return self._response(model, text, data.get("usage", {}))
+
+    async def stream(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        on_text: TextCallback,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        if not self._api_key:
+            return self._missing_key(model)
+
+        payload = self._payload(model, prompt, max_tokens, system, history)
+        payload["stream"] = True
+        # Final chunk carries token usage so streamed calls are billed exactly
+        payload["stream_options"] = {"include_usage": True}
+
+        parts: list[str] = []
+        usage: dict[str, Any] = {}
+        async with self._http.stream(
+            "POST",
+            f"{self._base_url}/chat/completions",
+            json=payload,
+            **timeout_kwargs(timeout),
+            headers=self._headers(),
+        ) as resp:
+            resp.raise_for_status()
+            async for data in iter_sse_data(resp):
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                for choice in chunk.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        await on_text(delta)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+
+        return self._response(model, "".join(parts), usage)
+
+    def estimate_cost(self, model: str, prompt: str, max_tokens: int) -> float:
+        tokens = estimate_tokens(prompt) + max_tokens
+        return (tokens / 1000) * _COST_PER_1K.get(model, 0.01)
+
     async def close(self) -> None:
         await self._http.aclose()
@@ -0,0 +1,160 @@
+"""Retries of transient upstream failures.
+
+A completion is not idempotent: it is billed, and a retried call may come
+back with a different answer. So only failures where the upstream did not
+run it are retried: explicit rejections (429, 408, 503, Anthropic's 529
+"overloaded"), a 502 from a gateway that never reached the model, and
+connection errors before the request was sent. 500, 504 and read timeouts
+may come after the model ran and are returned to the caller.
+
+Each provider has one RetryPolicy, so retries draw on a shared budget and
+cannot multiply the load on an upstream that is already failing. The loop
+runs outside the scheduler slot and breaker admission (see guarded_call):
+each attempt is admitted and reported on its own, and backoff holds no slot.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, TypeVar
+
+import httpx
+
+from src.core.config import LLMRetryConfig
+
+T = TypeVar("T")
+
+_RETRYABLE_STATUS = {408, 429, 502, 503, 529}
+# Raised before any of the request reached the upstream
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def retry_reason(exc: BaseException) -> str | None:
+    """Why a failed call can safely be sent again, or None if it cannot."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return f"http_{status}" if status in _RETRYABLE_STATUS else None
+    if isinstance(exc, _UNSENT_ERRORS):
+        return "connect"
+    return None
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """Seconds the upstream asked us to wait (Retry-After, or OpenAI's retry-after-ms)."""
+    value = response.headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """Token bucket limiting retries to a fraction of calls.
+
+    Every call deposits `ratio` tokens and every retry withdraws one, so in
+    a sustained outage at most about `ratio` retries are made per call. The
+    bucket starts full at `reserve`, which lets isolated failures retry.
+    """
+
+    def __init__(self, ratio: float, reserve: float) -> None:
+        self._ratio = ratio
+        self._reserve = reserve
+        self.tokens = reserve
+
+    def deposit(self) -> None:
+        self.tokens = min(self._reserve, self.tokens + self._ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class RetryPolicy:
+    """Runs one provider's calls with backoff, jitter and Retry-After."""
+
+    def __init__(self, config: LLMRetryConfig) -> None:
+        self._config = config
+        self.budget = RetryBudget(config.budget_ratio, config.budget_reserve)
+        self.calls = 0
+        self.retries = 0
+        self.reasons: Counter[str] = Counter()  # retries made, by failure
+        self.skipped: Counter[str] = Counter()  # retryable failures not retried, by cause
+
+    def _delay(self, exc: BaseException, attempt: int) -> float:
+        """Full-jitter exponential backoff, or at least what the upstream asked for."""
+        backoff = random.uniform(
+            0.0, min(self._config.max_delay, self._config.base_delay * 2**attempt)
+        )
+        if isinstance(exc, httpx.HTTPStatusError):
+            asked = retry_after(exc.response)
+            if asked is not None:
+                return max(asked, backoff)
+        return backoff
+
+    async def run(
+        self,
+        attempt: Callable[[float | None], Awaitable[T]],
+        timeout: float | None = None,
+        replayable: Callable[[], bool] = lambda: True,
+    ) -> tuple[T, int]:
+        """Call `attempt(remaining_timeout)` until it succeeds or may not be retried.
+
+        Returns the result and the number of retries made. `replayable` is
+        asked before each retry; a stream that has already delivered text
+        must not be started again.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.calls += 1
+        self.budget.deposit()
+        retries = 0
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                return await attempt(remaining), retries
+            except Exception as exc:
+                reason = retry_reason(exc)
+                if reason is None or not replayable():
+                    raise
+                delay = self._delay(exc, retries)
+                if retries >= self._config.max_retries:
+                    self.skipped["max_retries"] += 1
+                    raise
+                if delay > self._config.max_retry_after:
+                    self.skipped["retry_after"] += 1
+                    raise
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    self.skipped["deadline"] += 1
+                    raise
+                if not self.budget.withdraw():
+                    self.skipped["budget"] += 1
+                    raise
+                retries += 1
+                self.retries += 1
+                self.reasons[reason] += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "budget_tokens": self.budget.tokens,
+            "reasons": dict(self.reasons),
+            "not_retried": dict(self.skipped),
+        }
@@ -0,0 +1,201 @@
+"""Hedged requests and fallback across equivalent models (model groups).
+
+The primary target is queried first. If it has not answered within its
+recent latency percentile, a hedge is sent to the next target and whichever
+answers first wins; the loser is cancelled. Retryable failures (5xx, 429,
+connection errors, an open circuit) move on to the next target immediately.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+import httpx
+
+from src.core.config import LLMRouteConfig
+from src.core.types import AgentIdentity
+from src.plugins.llm_query.providers.base import LLMProvider, LLMResponse, Message
+from src.plugins.llm_query.breaker import CircuitBreakers, CircuitOpenError, guarded_call
+from src.plugins.llm_query.retry import RetryPolicy
+from src.plugins.llm_query.scheduler import UpstreamScheduler
+
+logger = logging.getLogger("mcp_server")
+
+_SAMPLES = 256  # latencies kept per target
+
+
+@dataclass(frozen=True)
+class RouteTarget:
+    name: str  # provider name
+    provider: LLMProvider
+    model: str
+
+
+class LatencyTracker:
+    """Recent successful-call latencies per (provider, model)."""
+
+    def __init__(self, samples: int = _SAMPLES) -> None:
+        self._samples = samples
+        self._latencies: dict[tuple[str, str], deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: str, seconds: float) -> None:
+        with self._lock:
+            window = self._latencies.get((provider, model))
+            if window is None:
+                window = self._latencies[(provider, model)] = deque(maxlen=self._samples)
+            window.append(seconds)
+
+    def percentile(self, provider: str, model: str, pct: float, min_samples: int = 1) -> float | None:
+        """Nearest-rank percentile, or None with fewer than min_samples samples."""
+        with self._lock:
+            window = self._latencies.get((provider, model))
+            if window is None or len(window) < max(1, min_samples):
+                return None
+            ordered = sorted(window)
+        rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+        return ordered[rank - 1]
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            keys = list(self._latencies)
+        result = {}
+        for provider, model in keys:
+            result[f"{provider}/{model}"] = {
+                "samples": len(self._latencies[(provider, model)]),
+                "p50": self.percentile(provider, model, 50),
+                "p95": self.percentile(provider, model, 95),
+            }
+        return result
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """5xx, 429, transport failures and open circuits may succeed elsewhere; anything else will not."""
+    if isinstance(exc, CircuitOpenError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+class Router:
+    """Runs one query over a list of equivalent targets with hedging and fallback."""
+
+    def __init__(
+        self,
+        latency: LatencyTracker,
+        scheduler: UpstreamScheduler | None = None,
+        breakers: CircuitBreakers | None = None,
+        retries: dict[str, RetryPolicy] | None = None,
+    ) -> None:
+        self._latency = latency
+        self._scheduler = scheduler
+        self._breakers = breakers
+        self._retries = retries or {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def _hedge_delay(self, target: RouteTarget, route: LLMRouteConfig) -> float:
+        observed = self._latency.percentile(
+            target.name, target.model, route.hedge_percentile, route.hedge_min_samples
+        )
+        return observed if observed is not None else route.hedge_delay_seconds
+
+    async def query(
+        self,
+        targets: list[RouteTarget],
+        route: LLMRouteConfig,
+        prompt: str,
+        max_tokens: int,
+        remaining_time: Callable[[], float | None],
+        system: str = "",
+        history: Sequence[Message] = (),
+        identity: AgentIdentity | None = None,
+    ) -> LLMResponse:
+        """Return the first successful response; raise the last error if all fail.
+
+        With a scheduler, each target's call (hedges included) holds one of
+        that provider's upstream slots on behalf of `identity`; with breakers,
+        a target whose circuit is open fails fast and the next one is tried.
+        Transient failures are retried on the same target under its provider's
+        retry policy before falling back.
+        """
+        queue = list(targets)
+        running: dict[asyncio.Task[LLMResponse], tuple[RouteTarget, float]] = {}
+        hedged = False
+        last_error: BaseException | None = None
+
+        async def call(target: RouteTarget) -> LLMResponse:
+            async def once(timeout: float | None) -> LLMResponse:
+                return await target.provider.query(
+                    target.model, prompt, max_tokens, timeout=timeout, system=system, history=history
+                )
+
+            return await guarded_call(
+                self._breakers, self._scheduler, self._retries.get(target.name),
+                target.name, target.model, identity, once, remaining_time(),
+            )
+
+        def start(target: RouteTarget) -> None:
+            task = asyncio.ensure_future(call(target))
+            running[task] = (target, time.monotonic())
+
+        primary = queue.pop(0)
+        start(primary)
+        try:
+            while running:
+                wait_for = None
+                if route.hedge and not hedged and queue:
+                    wait_for = self._hedge_delay(primary, route)
+                done, _ = await asyncio.wait(
+                    running, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Primary is slower than usual: race it against the next target
+                    hedged = True
+                    self.hedges += 1
+                    start(queue.pop(0))
+                    continue
+                for task in done:
+                    target, started = running.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        self._latency.record(target.name, target.model, time.monotonic() - started)
+                        if target is not primary and hedged:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = exc
+                    logger.warning(
+                        "LLM route target failed",
+                        extra={"provider": target.name, "model": target.model, "error": str(exc)},
+                    )
+                    if route.fallback and queue and is_retryable(exc):
+                        self.fallbacks += 1
+                        start(queue.pop(0))
+                    elif not is_retryable(exc) and not running:
+                        raise exc
+            assert last_error is not None
+            raise last_error
+        finally:
+            # Cancel the loser (or anything still running on error) and wait for it
+            # to unwind, so its upstream connection is released before we return
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "latency": self._latency.stats(),
+        }
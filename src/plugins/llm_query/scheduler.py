@@ -0,0 +1,259 @@
+"""Global upstream scheduler: a concurrency cap per provider, shared fairly
+between tenants and, within a tenant, between its agents.
+
+Calls that find every slot taken wait in a queue per (tenant, agent). When a
+slot frees up it goes to the backlogged tenant that has received the least
+service relative to its weight, then to that tenant's least-served agent
+(stride scheduling, a form of weighted fair queuing). A tenant or agent that
+was idle rejoins at the current virtual time, so it cannot bank credit while
+idle and then crowd everyone else out.
+
+With an adaptive config, each provider's cap is an AIMDLimit fed by the
+latency and outcome of every call made under it.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, TypeVar
+
+from src.core.config import LLMAdaptiveLimitConfig
+from src.core.types import AgentIdentity
+from src.plugins.llm_query.adaptive import AIMDLimit
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future[None]
+    enqueued: float
+
+
+@dataclass
+class _AgentQueue:
+    weight: float
+    pass_: float = 0.0  # virtual service received; lowest goes next
+    waiters: deque[_Waiter] = field(default_factory=deque)
+    max_waiting: int = 0
+    waits: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def backlogged(self) -> bool:
+        return bool(self.waiters)
+
+
+@dataclass
+class _TenantQueue:
+    weight: float
+    pass_: float = 0.0
+    vtime: float = 0.0  # pass of the last agent served, where idle agents rejoin
+    agents: dict[str, _AgentQueue] = field(default_factory=dict)
+
+    def backlogged(self) -> bool:
+        return any(q.waiters for q in self.agents.values())
+
+
+@dataclass
+class _ProviderQueue:
+    limit: int
+    active: int = 0
+    vtime: float = 0.0  # pass of the last tenant served, where idle tenants rejoin
+    tenants: dict[str, _TenantQueue] = field(default_factory=dict)
+    granted: int = 0
+    queued: int = 0
+    adaptive: AIMDLimit | None = None
+
+
+_Flow = TypeVar("_Flow", _TenantQueue, _AgentQueue)
+
+
+def _least_served(flows: dict[str, _Flow]) -> _Flow:
+    """The backlogged flow with the lowest pass (first inserted wins ties)."""
+    best: _Flow | None = None
+    for flow in flows.values():
+        if flow.backlogged() and (best is None or flow.pass_ < best.pass_):
+            best = flow
+    assert best is not None
+    return best
+
+
+class UpstreamScheduler:
+    """Caps concurrent upstream calls per provider with weighted fair queuing.
+
+    Weights default to 1.0: a tenant with weight 2 gets twice the slots of a
+    tenant with weight 1 while both have calls waiting. The cap only matters
+    under contention; when a slot is free the call starts immediately.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, int],
+        default_limit: int,
+        tenant_weights: dict[str, float] | None = None,
+        agent_weights: dict[str, float] | None = None,
+        adaptive: LLMAdaptiveLimitConfig | None = None,
+    ) -> None:
+        self._limits = limits
+        self._default_limit = default_limit
+        self._tenant_weights = tenant_weights or {}
+        self._agent_weights = agent_weights or {}
+        self._adaptive = adaptive if adaptive is not None and adaptive.enabled else None
+        self._providers: dict[str, _ProviderQueue] = {}
+        for name in limits:
+            self._provider(name)
+
+    def _provider(self, name: str) -> _ProviderQueue:
+        queue = self._providers.get(name)
+        if queue is None:
+            limit = self._limits.get(name, self._default_limit)
+            queue = self._providers[name] = _ProviderQueue(limit=limit)
+            if self._adaptive is not None:
+                queue.adaptive = AIMDLimit(
+                    initial=limit,
+                    min_limit=self._adaptive.min_limit,
+                    max_limit=self._adaptive.max_limit,
+                    backoff=self._adaptive.backoff,
+                    latency_tolerance=self._adaptive.latency_tolerance,
+                )
+                queue.limit = queue.adaptive.limit
+        return queue
+
+    def _agent_queue(
+        self, pq: _ProviderQueue, tenant_id: str, agent_id: str
+    ) -> tuple[_TenantQueue, _AgentQueue]:
+        tq = pq.tenants.get(tenant_id)
+        if tq is None:
+            tq = pq.tenants[tenant_id] = _TenantQueue(
+                weight=self._tenant_weights.get(tenant_id, 1.0), pass_=pq.vtime
+            )
+        aq = tq.agents.get(agent_id)
+        if aq is None:
+            aq = tq.agents[agent_id] = _AgentQueue(
+                weight=self._agent_weights.get(agent_id, 1.0), pass_=tq.vtime
+            )
+        return tq, aq
+
+    @asynccontextmanager
+    async def acquire(self, provider: str, tenant_id: str, agent_id: str) -> AsyncIterator[None]:
+        """Hold one of the provider's upstream slots for the duration of the block."""
+        pq = self._provider(provider)
+        tq, aq = self._agent_queue(pq, tenant_id, agent_id)
+        if pq.active < pq.limit and pq.queued == 0:
+            pq.active += 1
+            pq.granted += 1
+            aq.waits += 1
+        else:
+            await self._wait(pq, tq, aq)
+        started = time.monotonic()
+        saturated = pq.active >= pq.limit
+        error: BaseException | None = None
+        try:
+            yield
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            if pq.adaptive is not None and not isinstance(error, asyncio.CancelledError):
+                # Cancelled calls (e.g. hedge losers) say nothing about the upstream
+                pq.adaptive.observe(started, time.monotonic() - started, saturated, error)
+                pq.limit = pq.adaptive.limit
+            self._release(pq)
+
+    async def _wait(
+        self,
+        pq: _ProviderQueue,
+        tq: _TenantQueue,
+        aq: _AgentQueue,
+    ) -> None:
+        # Rejoining after an idle spell starts at the current virtual time
+        if not tq.backlogged():
+            tq.pass_ = max(tq.pass_, pq.vtime)
+        if not aq.backlogged():
+            aq.pass_ = max(aq.pass_, tq.vtime)
+        waiter = _Waiter(
+            future=asyncio.get_running_loop().create_future(), enqueued=time.monotonic()
+        )
+        aq.waiters.append(waiter)
+        aq.max_waiting = max(aq.max_waiting, len(aq.waiters))
+        pq.queued += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted a slot just as the caller was cancelled: pass it on
+                self._release(pq)
+            else:
+                aq.waiters.remove(waiter)
+                pq.queued -= 1
+            raise
+        finally:
+            waited = time.monotonic() - waiter.enqueued
+            aq.waits += 1
+            aq.total_wait += waited
+            aq.max_wait = max(aq.max_wait, waited)
+
+    def _release(self, pq: _ProviderQueue) -> None:
+        pq.active -= 1
+        self._dispatch(pq)
+
+    def _dispatch(self, pq: _ProviderQueue) -> None:
+        """Hand free slots to waiting calls in weighted fair order."""
+        while pq.active < pq.limit and pq.queued:
+            tq = _least_served(pq.tenants)
+            aq = _least_served(tq.agents)
+            pq.vtime = tq.pass_
+            tq.pass_ += 1.0 / tq.weight
+            tq.vtime = aq.pass_
+            aq.pass_ += 1.0 / aq.weight
+            waiter = aq.waiters.popleft()
+            pq.queued -= 1
+            pq.active += 1
+            pq.granted += 1
+            waiter.future.set_result(None)
+
+    def stats(self, tenant_id: str | None = None) -> dict[str, Any]:
+        """Slots in use, queue depth and wait times per provider and (tenant, agent) queue.
+
+        With `tenant_id`, only that tenant's queues are listed; the provider
+        totals are always included.
+        """
+        now = time.monotonic()
+        result: dict[str, Any] = {}
+        for name, pq in self._providers.items():
+            queues: dict[str, Any] = {}
+            for queue_tenant, tq in pq.tenants.items():
+                if tenant_id is not None and queue_tenant != tenant_id:
+                    continue
+                for agent_id, aq in tq.agents.items():
+                    queues[f"{queue_tenant}/{agent_id}"] = {
+                        "tenant_weight": tq.weight,
+                        "agent_weight": aq.weight,
+                        "depth": len(aq.waiters),
+                        "max_depth": aq.max_waiting,
+                        "oldest_wait_seconds": now - aq.waiters[0].enqueued if aq.waiters else 0.0,
+                        "avg_wait_seconds": aq.total_wait / aq.waits if aq.waits else 0.0,
+                        "max_wait_seconds": aq.max_wait,
+                    }
+            result[name] = {
+                "limit": pq.limit,
+                "active": pq.active,
+                "queued": pq.queued,
+                "granted": pq.granted,
+                "queues": queues,
+                "adaptive": pq.adaptive.stats() if pq.adaptive is not None else None,
+            }
+        return result
+
+
+def upstream_slot(
+    scheduler: UpstreamScheduler | None,
+    provider: str,
+    identity: AgentIdentity | None,
+) -> AbstractAsyncContextManager[None]:
+    """The caller's slot for one upstream call; a no-op without a scheduler or caller."""
+    if scheduler is None or identity is None:
+        return nullcontext()
+    return scheduler.acquire(provider, identity.tenant_id, identity.agent_id)
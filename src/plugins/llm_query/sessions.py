@@ -0,0 +1,251 @@
+"""Server-side conversation history for llm.query sessions.
+
+An agent opens a session, then sends only each new message; earlier turns
+are kept here and the provider adapters rebuild the full messages array.
+Sessions belong to the agent that opened them. Memory is bounded by total
+bytes with LRU eviction and an idle TTL; expired sessions are swept
+periodically. With a spill directory, sessions evicted from memory are
+written to disk (in a worker thread) and read back on their next use.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Sequence
+
+from src.plugins.llm_query.providers.base import Message
+
+logger = logging.getLogger("mcp_server")
+
+_MESSAGE_OVERHEAD = 64  # rough per-message bookkeeping cost in bytes
+_SWEEP_INTERVAL = 60.0  # seconds between sweeps of expired sessions
+
+
+def _message_size(message: Message) -> int:
+    return len(message["content"].encode("utf-8")) + _MESSAGE_OVERHEAD
+
+
+def fit_history(messages: Sequence[Message], max_bytes: int) -> list[Message]:
+    """The newest turns whose content fits in `max_bytes`, dropping the oldest pairs."""
+    kept = list(messages)
+    size = sum(len(m["content"].encode("utf-8")) for m in kept)
+    while kept and size > max_bytes:
+        for dropped in kept[:2]:
+            size -= len(dropped["content"].encode("utf-8"))
+        del kept[:2]
+    return kept
+
+
+@dataclass
+class _Session:
+    expires: float  # wall-clock time, so spilled sessions survive restarts
+    messages: list[Message] = field(default_factory=list)
+    size: int = 0
+
+
+class SessionStore:
+    """Thread-safe, agent-scoped conversation store.
+
+    A session longer than `max_session_bytes` drops its oldest turns, so the
+    history replayed upstream stays bounded too.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        max_session_bytes: int,
+        spill_dir: str | Path | None = None,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._ttl = ttl_seconds
+        self._max_session_bytes = max_session_bytes
+        self._spill_dir = Path(spill_dir) if spill_dir is not None else None
+        self._sessions: OrderedDict[tuple[str, str], _Session] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._next_sweep = time.time() + _SWEEP_INTERVAL
+        self.spilled = 0
+        self.restored = 0
+        self.expired = 0
+        if self._spill_dir is not None:
+            self._spill_dir.mkdir(parents=True, exist_ok=True)
+            self._sweep_spilled()
+
+    @staticmethod
+    def new_session_id() -> str:
+        return secrets.token_urlsafe(16)
+
+    async def history(self, agent_id: str, session_id: str) -> list[Message] | None:
+        """Turns of an agent's session, oldest first, or None if unknown or expired."""
+        key = (agent_id, session_id)
+        now = time.time()
+        await self._maybe_sweep(now)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                if session.expires <= now:
+                    self._drop(key)
+                    self.expired += 1
+                    return None
+                self._sessions.move_to_end(key)
+                return list(session.messages)
+        session = await self._restore_async(key, now)
+        return list(session.messages) if session is not None else None
+
+    async def append(self, agent_id: str, session_id: str, messages: Sequence[Message]) -> None:
+        """Add turns to a session (creating it if needed) and refresh its TTL."""
+        key = (agent_id, session_id)
+        now = time.time()
+        await self._maybe_sweep(now)
+        with self._lock:
+            resident = key in self._sessions
+        if not resident:
+            await self._restore_async(key, now)
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session is None:
+                session = _Session(expires=now)
+            else:
+                self._bytes -= session.size
+            for message in messages:
+                session.messages.append(dict(message))
+                session.size += _message_size(message)
+            # Drop the oldest user/assistant pairs, keeping at least the newest pair
+            while session.size > self._max_session_bytes and len(session.messages) > 2:
+                for dropped in session.messages[:2]:
+                    session.size -= _message_size(dropped)
+                del session.messages[:2]
+            session.expires = now + self._ttl
+            self._sessions[key] = session
+            self._bytes += session.size
+            evicted = self._evict()
+        if evicted and self._spill_dir is not None:
+            await asyncio.to_thread(self._spill, evicted)
+
+    def sweep(self, now: float | None = None) -> int:
+        """Drop expired sessions from memory; returns how many were dropped."""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [key for key, session in self._sessions.items() if session.expires <= now]
+            for key in expired:
+                self._drop(key)
+            self.expired += len(expired)
+        return len(expired)
+
+    async def _maybe_sweep(self, now: float) -> None:
+        """Sweep expired sessions (and spill files) at most every _SWEEP_INTERVAL."""
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + _SWEEP_INTERVAL
+        self.sweep(now)
+        if self._spill_dir is not None:
+            await asyncio.to_thread(self._sweep_spilled)
+
+    async def _restore_async(self, key: tuple[str, str], now: float) -> _Session | None:
+        # File I/O runs in a worker thread, off the event loop
+        if self._spill_dir is None:
+            return None
+        return await asyncio.to_thread(self._restore, key, now)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "spilled": self.spilled,
+                "restored": self.restored,
+                "expired": self.expired,
+            }
+
+    def _drop(self, key: tuple[str, str]) -> None:
+        session = self._sessions.pop(key)
+        self._bytes -= session.size
+
+    def _evict(self) -> list[tuple[tuple[str, str], _Session]]:
+        """Pop least recently used sessions until under the byte cap (lock held)."""
+        evicted = []
+        while self._bytes > self._max_bytes and len(self._sessions) > 1:
+            key, session = self._sessions.popitem(last=False)
+            self._bytes -= session.size
+            evicted.append((key, session))
+        return evicted
+
+    def _path(self, key: tuple[str, str]) -> Path:
+        assert self._spill_dir is not None
+        digest = hashlib.sha256(json.dumps(list(key)).encode("utf-8")).hexdigest()
+        return self._spill_dir / f"{digest}.json"
+
+    def _spill(self, evicted: list[tuple[tuple[str, str], _Session]]) -> None:
+        if self._spill_dir is None:
+            return
+        now = time.time()
+        for key, session in evicted:
+            if session.expires <= now:
+                continue
+            path = self._path(key)
+            tmp = path.with_name(path.name + ".tmp")
+            try:
+                tmp.write_text(
+                    json.dumps({"expires": session.expires, "messages": session.messages}),
+                    encoding="utf-8",
+                )
+                os.replace(tmp, path)
+            except OSError:
+                logger.exception("Session spill failed", extra={"path": str(path)})
+                continue
+            with self._lock:
+                self.spilled += 1
+
+    def _restore(self, key: tuple[str, str], now: float) -> _Session | None:
+        """Load a spilled session back into memory, or None if there is none."""
+        if self._spill_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            path.unlink()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.exception("Session restore failed", extra={"path": str(path)})
+            return None
+        if float(data.get("expires", 0.0)) <= now:
+            return None
+        messages = data.get("messages", [])
+        session = _Session(
+            expires=now + self._ttl,
+            messages=messages,
+            size=sum(_message_size(m) for m in messages),
+        )
+        with self._lock:
+            self.restored += 1
+            if key not in self._sessions:
+                self._sessions[key] = session
+                self._bytes += session.size
+            session = self._sessions[key]
+            evicted = self._evict()
+        self._spill(evicted)
+        return session
+
+    def _sweep_spilled(self) -> None:
+        """Delete expired spill files left over from earlier runs."""
+        assert self._spill_dir is not None
+        now = time.time()
+        for path in self._spill_dir.glob("*.json"):
+            try:
+                expires = float(json.loads(path.read_text(encoding="utf-8")).get("expires", 0.0))
+            except (OSError, ValueError):
+                expires = 0.0
+            if expires <= now:
+                path.unlink(missing_ok=True)
@@ -0,0 +1,94 @@
+"""Single-flight coalescing: identical concurrent requests share one upstream call.
+
+Unlike the response cache nothing is kept once a call completes; callers
+that arrive after completion start a new call.
+"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Literal, TypeVar
+
+T = TypeVar("T")
+
+CostAttribution = Literal["leader", "split"]
+
+
+@dataclass
+class _Call(Generic[T]):
+    task: asyncio.Task[T]
+    waiting: int = 1  # callers currently awaiting the result
+    collectors: int = 0  # callers that were still waiting when the call finished
+    collected: int = 0
+
+
+@dataclass(frozen=True)
+class FlightResult(Generic[T]):
+    value: T
+    cost_share: float  # fraction of the upstream cost this caller is charged
+    coalesced: bool  # True if the caller joined a call started by someone else
+
+
+class SingleFlight(Generic[T]):
+    """Deduplicates concurrent calls by key.
+
+    The upstream call runs in its own task and each caller awaits it through
+    asyncio.shield, so a caller that is cancelled (e.g. by its deadline) does
+    not abort the call for the others. The task is cancelled only when every
+    caller has gone away.
+
+    Cost attribution:
+      - "leader": the first caller to collect the result pays the full cost
+      - "split": every caller that collects the result pays an equal share
+    """
+
+    def __init__(self, attribution: CostAttribution = "leader") -> None:
+        self._attribution = attribution
+        self._calls: dict[str, _Call[T]] = {}
+        self.calls = 0  # upstream calls started
+        self.coalesced = 0  # callers that joined an in-flight call
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> FlightResult[T]:
+        call = self._calls.get(key)
+        coalesced = call is not None and not call.task.done()
+        if call is not None and coalesced:
+            call.waiting += 1
+            self.coalesced += 1
+        else:
+            call = self._start(key, fn)
+
+        try:
+            value = await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            call.waiting -= 1
+            if call.waiting == 0 and not call.task.done():
+                call.task.cancel()
+            raise
+
+        call.collected += 1
+        if self._attribution == "split":
+            share = 1.0 / max(call.collectors, 1)
+        else:
+            share = 1.0 if call.collected == 1 else 0.0
+        return FlightResult(value=value, cost_share=share, coalesced=coalesced)
+
+    def _start(self, key: str, fn: Callable[[], Awaitable[T]]) -> _Call[T]:
+        async def _run() -> T:
+            return await fn()
+
+        task = asyncio.ensure_future(_run())
+        call: _Call[T] = _Call(task=task)
+        self._calls[key] = call
+        self.calls += 1
+
+        def _done(_: asyncio.Task[T]) -> None:
+            # Runs before any waiter resumes, so `collectors` is final for them
+            call.collectors = call.waiting
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+        task.add_done_callback(_done)
+        return call
+
+    def stats(self) -> dict[str, int]:
+        return {"in_flight": len(self._calls), "calls": self.calls, "coalesced": self.coalesced}
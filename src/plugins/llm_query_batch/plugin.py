@@ -0,0 +1,185 @@
+"""llm.query_batch plugin — many prompts in one tool call, fanned out in parallel."""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+from src.core.config import AppConfig
+from src.core.policy import PolicyEngine
+from src.core.types import Capability, PluginManifest
+from src.plugins._base import ToolContext
+from src.plugins.llm_query.backend import LLMBackend, get_llm_backend
+from src.plugins.llm_query.input_guard import check_input_async
+from src.plugins.llm_query.plugin import LLMQueryPlugin
+
+logger = logging.getLogger("mcp_server")
+
+MAX_BATCH_SIZE = 100
+
+
+class LLMQueryBatchInput(BaseModel):
+    provider: str = Field(description="LLM provider: 'openai', 'anthropic', or 'local'")
+    model: str = Field(description="Model name (must be on allowlist)")
+    prompts: list[str] = Field(
+        min_length=1,
+        max_length=MAX_BATCH_SIZE,
+        description=f"Prompts to run (1-{MAX_BATCH_SIZE}); each is an independent query",
+    )
+    system: str = Field(
+        default="",
+        description="Stable prefix shared by every prompt in the batch; "
+        "sent ahead of each prompt so the provider can cache it",
+    )
+    max_tokens: int = Field(default=1024, description="Maximum tokens in each response")
+
+
+class LLMQueryBatchPlugin(LLMQueryPlugin):
+    """Runs prompts with at most `batch_parallelism` upstream calls at once per agent.
+
+    The cap is shared by all of an agent's concurrent batches. The batch is
+    policed as a whole: it consumes one rate-limit unit per prompt (a batch
+    larger than the agent's per-minute limit is rejected) and reserves the estimated cost of every uncached prompt up front.
+    Each item's result is sent as a progress notification as soon as it is
+    ready; failures are reported per item and do not fail the batch.
+    """
+
+    def __init__(
+        self,
+        config: AppConfig,
+        policy_engine: PolicyEngine,
+        backend: LLMBackend | None = None,
+    ) -> None:
+        super().__init__(config, policy_engine, backend)
+        self._batch_slots: dict[str, asyncio.Semaphore] = {}
+
+    def manifest(self) -> PluginManifest:
+        return PluginManifest(
+            name="llm.query_batch",
+            title="LLM Query Batch",
+            description="Run many independent prompts against one model in a single call, "
+            "in parallel. Results are returned per item. "
+            "Requires network:outbound and llm:query capabilities.",
+            capabilities=frozenset({Capability.NETWORK_OUTBOUND, Capability.LLM_QUERY}),
+        )
+
+    def input_model(self) -> type[BaseModel]:
+        return LLMQueryBatchInput
+
+    def rate_cost(self, arguments: dict[str, Any]) -> int:
+        prompts = arguments.get("prompts")
+        return max(1, len(prompts)) if isinstance(prompts, list) else 1
+
+    async def execute(self, ctx: ToolContext, params: BaseModel) -> str:
+        assert isinstance(params, LLMQueryBatchInput)
+        identity = ctx.identity
+        agent_cfg = self._config.agents.get(identity.agent_id)
+        if agent_cfg is None:
+            return json.dumps({"error": f"Unknown agent: {identity.agent_id}"})
+
+        provider, error = self._resolve_provider(identity, params.provider, params.model)
+        if error is not None:
+            return json.dumps(error)
+        assert provider is not None
+        targets, route = self._targets(identity, params.provider, params.model, provider)
+
+        max_tokens = min(params.max_tokens, agent_cfg.max_tokens_per_request)
+        results: list[dict[str, Any] | None] = [None] * len(params.prompts)
+
+        system_reasons = await check_input_async(params.system) if params.system else []
+        if system_reasons:
+            return json.dumps({"error": "Input rejected", "reasons": system_reasons})
+
+        async def finish(index: int, item: dict[str, Any]) -> None:
+            results[index] = {"index": index, **item}
+            await ctx.report_progress(json.dumps(results[index]))
+
+        # Guard and cache lookups first; only the rest goes upstream
+        pending: list[tuple[int, str, str | None]] = []
+        for index, prompt in enumerate(params.prompts):
+            guard_reasons = await check_input_async(prompt)
+            if guard_reasons:
+                await finish(index, {"error": "Input rejected", "reasons": guard_reasons})
+                continue
+            key = self._cache_key(identity, agent_cfg, targets, prompt, max_tokens, params.system)
+            cached = self._cache.get(key) if key is not None and self._cache is not None else None
+            if cached is not None:
+                await finish(index, {
+                    "text": cached.text,
+                    "usage": cached.usage,
+                    "estimated_cost": 0.0,
+                    "cached": True,
+                })
+            else:
+                pending.append((index, prompt, key))
+
+        spent = 0.0
+        if pending:
+            # One reservation covers the whole batch
+            budget = self._policy.budget_tracker
+            estimate = sum(
+                self._estimate(targets, prompt, max_tokens, params.system) for _, prompt, _ in pending
+            )
+            reservation = budget.reserve(identity.agent_id, estimate, agent_cfg.max_cost_per_day)
+            if reservation is None:
+                return json.dumps(self._budget_error(identity, agent_cfg, estimate))
+
+            semaphore = self._batch_slots.setdefault(
+                identity.agent_id, asyncio.Semaphore(max(1, agent_cfg.batch_parallelism))
+            )
+
+            async def run(index: int, prompt: str, key: str | None) -> None:
+                nonlocal spent
+                async with semaphore:
+                    try:
+                        response, cost, coalesced = await self._complete(
+                            ctx, targets, route, prompt, max_tokens, system=params.system
+                        )
+                    except Exception as exc:
+                        logger.warning(
+                            "LLM batch item failed",
+                            extra={"provider": params.provider, "model": params.model, "index": index},
+                        )
+                        await finish(index, self._query_error(exc))
+                        return
+                spent += cost
+                if key is not None and self._cache is not None:
+                    self._cache.put(key, response)
+                await finish(index, {
+                    "text": response.text,
+                    "usage": response.usage,
+                    "estimated_cost": cost,
+                    "cached": False,
+                    "coalesced": coalesced,
+                })
+
+            # Charge what completed even if the batch is cancelled part-way
+            try:
+                await asyncio.gather(*(run(*item) for item in pending))
+            finally:
+                budget.commit(reservation, spent)
+
+        failed = sum(1 for r in results if r is not None and "error" in r)
+        return json.dumps({
+            "model": params.model,
+            "results": results,
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "estimated_cost": spent,
+        })
+
+
+def create_plugin(
+    config: AppConfig,
+    policy_engine: PolicyEngine,
+    services: dict[str, Any] | None = None,
+    **kwargs: Any,
+) -> LLMQueryBatchPlugin:
+    return LLMQueryBatchPlugin(
+        config=config,
+        policy_engine=policy_engine,
+        backend=get_llm_backend(config, services),
+    )
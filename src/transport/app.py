@@ -1,26 +1,59 @@
 """FastAPI app + FastMCP mount + wiring."""
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-from typing import Any
+import time
+from typing import Any, Awaitable, Callable
 
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 
 from src.core.audit import setup_logging
 from src.core.auth import AuthService
 from src.core.config import AppConfig, load_config
 from src.core.policy import PolicyEngine
+from src.core.rate_limit import ConcurrencyLimitExceeded
 from src.core.registry import PluginRegistry
 from src.core.types import PolicyDecision
 from src.plugins._base import ToolContext, ToolPlugin
-from src.transport.middleware import BearerAuthMiddleware, current_agent
+from src.transport.middleware import (
+    BearerAuthMiddleware,
+    PayloadLimitMiddleware,
+    current_agent,
+    request_body_size,
+)
 
 logger = logging.getLogger("mcp_server")
 
 
+# Name of the wrapper parameter FastMCP fills with the request's Context
+_CONTEXT_PARAM = "mcp_context"
+
+
+def _progress_reporter(mcp_ctx: Context | None) -> Callable[[str], Awaitable[None]] | None:
+    """Return a callback that sends MCP progress notifications, if the client asked for them."""
+    if mcp_ctx is None:
+        return None
+    try:
+        meta = mcp_ctx.request_context.meta
+    except ValueError:  # not inside an MCP request
+        return None
+    if meta is None or meta.progressToken is None:
+        return None
+
+    step = 0
+
+    async def report(message: str) -> None:
+        nonlocal step
+        step += 1
+        await mcp_ctx.report_progress(step, message=message)
+
+    return report
+
+
 def _make_tool_wrapper(
     plugin: ToolPlugin,
     policy: PolicyEngine,
@@ -38,12 +71,15 @@ def _make_tool_wrapper(
 
     # Build the wrapper with **kwargs so FastMCP generates schema from the input model
     async def tool_wrapper(**kwargs: Any) -> str:
+        mcp_ctx = kwargs.pop(_CONTEXT_PARAM, None)
         identity = current_agent.get()
         if identity is None:
             return json.dumps({"error": "Not authenticated"})
 
-        payload_size = len(json.dumps(kwargs))
-        decision = policy.check_tool_call(identity, manifest, payload_size)
+        # Body size is measured on the raw bytes by PayloadLimitMiddleware
+        decision = policy.check_tool_call(
+            identity, manifest, request_body_size(), rate_cost=plugin.rate_cost(kwargs)
+        )
 
         if not decision.allowed:
             logger.warning(
@@ -59,10 +95,31 @@ def _make_tool_wrapper(
                 "reasons": decision.reasons,
             })
 
+        agent_cfg = policy.agent_config(identity)
+        if agent_cfg is None:
+            # Unknown agents are denied by check_tool_call; this covers a config reload
+            return json.dumps({"error": f"Unknown agent: {identity.agent_id}"})
         try:
-            params = input_model.model_validate(kwargs)
-            ctx = ToolContext(identity=identity, raw_arguments=kwargs)
-            result = await plugin.execute(ctx, params)
+            async with policy.concurrency_limiter.acquire(
+                identity.agent_id,
+                agent_cfg.concurrency,
+                mode=agent_cfg.concurrency_mode,
+                max_queue_depth=agent_cfg.max_queue_depth,
+                queue_timeout=agent_cfg.queue_timeout_seconds,
+            ):
+                params = input_model.model_validate(kwargs)
+                ctx = ToolContext(
+                    identity=identity,
+                    raw_arguments=kwargs,
+                    deadline=time.monotonic() + agent_cfg.timeout_seconds,
+                    progress=_progress_reporter(mcp_ctx),
+                )
+                # wait_for cancels plugin.execute on expiry, which aborts any
+                # in-flight upstream request and unwinds its resources.
+                result = await asyncio.wait_for(
+                    plugin.execute(ctx, params),
+                    timeout=agent_cfg.timeout_seconds,
+                )
             logger.info(
                 "Tool call success",
                 extra={
@@ -71,6 +128,33 @@ def _make_tool_wrapper(
                 },
             )
             return result
+        except asyncio.TimeoutError:
+            reason = f"Tool call exceeded timeout of {agent_cfg.timeout_seconds}s"
+            logger.warning(
+                "Tool call timed out",
+                extra={
+                    "agent_id": identity.agent_id,
+                    "tool": manifest.name,
+                    "reasons": [reason],
+                },
+            )
+            return json.dumps({
+                "error": "Timeout",
+                "reasons": [reason],
+            })
+        except ConcurrencyLimitExceeded as exc:
+            logger.warning(
+                "Tool call throttled",
+                extra={
+                    "agent_id": identity.agent_id,
+                    "tool": manifest.name,
+                    "reasons": [exc.reason],
+                },
+            )
+            return json.dumps({
+                "error": "Concurrency limit exceeded",
+                "reasons": [exc.reason],
+            })
         except Exception as exc:
             logger.exception(
                 "Tool execution error",
@@ -100,11 +184,23 @@ def _make_tool_wrapper(
     # Remove 'self' — FastMCP doesn't need it
     params = params[1:]
 
+    # FastMCP injects the request Context into the parameter annotated with it
+    # (excluded from the tool's input schema); used for progress notifications.
+    params.append(
+        inspect.Parameter(
+            _CONTEXT_PARAM,
+            inspect.Parameter.KEYWORD_ONLY,
+            default=None,
+            annotation=Context | None,
+        )
+    )
+
     # Apply annotations and signature to the wrapper
     tool_wrapper.__annotations__ = {
         field_name: field_info.annotation
         for field_name, field_info in model_fields.items()
     }
+    tool_wrapper.__annotations__[_CONTEXT_PARAM] = Context | None
     tool_wrapper.__signature__ = inspect.Signature(params)  # type: ignore[attr-defined]
     tool_wrapper.__name__ = manifest.name.replace(".", "_")
     tool_wrapper.__doc__ = manifest.description
@@ -204,8 +300,13 @@ def create_app(config: AppConfig | None = None) -> FastAPI:
 
     @asynccontextmanager
     async def lifespan(app: FastAPI):  # type: ignore[override]
-        async with mcp.session_manager.run():
-            yield
+        await registry.startup()
+        try:
+            async with mcp.session_manager.run():
+                yield
+        finally:
+            await registry.shutdown()
+            policy_engine.close()
 
     # Create FastAPI app with MCP lifespan
     app = FastAPI(
@@ -214,7 +315,8 @@ def create_app(config: AppConfig | None = None) -> FastAPI:
         lifespan=lifespan,
     )
 
-    # Add auth middleware
+    # Middleware: the last added runs first, so auth wraps the payload limit
+    app.add_middleware(PayloadLimitMiddleware, policy_engine=policy_engine)
     app.add_middleware(BearerAuthMiddleware, auth_service=auth_service)
 
     # Health endpoint
@@ -1,14 +1,14 @@
-"""Starlette middleware: Bearer token → ContextVar for current agent."""
+"""ASGI middleware: Bearer token → ContextVar for current agent, request size limits."""
 from __future__ import annotations
 
 import contextvars
-from typing import Any
+from dataclasses import dataclass
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from src.core.auth import AuthService
+from src.core.policy import PolicyEngine
 from src.core.types import AgentIdentity
 
 current_agent: contextvars.ContextVar[AgentIdentity | None] = contextvars.ContextVar(
@@ -16,35 +16,148 @@ current_agent: contextvars.ContextVar[AgentIdentity | None] = contextvars.Contex
 )
 
 
-class BearerAuthMiddleware(BaseHTTPMiddleware):
+@dataclass
+class RequestBodyMeter:
+    """Running count of request body bytes, shared with tasks spawned for the request."""
+    bytes_received: int = 0
+
+
+current_request_body: contextvars.ContextVar[RequestBodyMeter | None] = contextvars.ContextVar(
+    "current_request_body", default=None
+)
+
+
+def request_body_size() -> int:
+    """Return the body size of the current HTTP request (0 outside a request)."""
+    meter = current_request_body.get()
+    return meter.bytes_received if meter is not None else 0
+
+
+def _header(scope: Scope, name: bytes) -> bytes:
+    """Return the first value of a raw ASGI header (name must be lowercase)."""
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return b""
+
+
+class BearerAuthMiddleware:
     """Extract Bearer token from Authorization header and set current_agent ContextVar.
 
     Allows /health through without auth. All other paths require valid token.
+    Implemented as a plain ASGI middleware so `receive`/`send` pass through
+    untouched and streamed (SSE) responses are never buffered.
     """
 
-    def __init__(self, app: Any, auth_service: AuthService) -> None:
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, auth_service: AuthService) -> None:
+        self.app = app
         self._auth = auth_service
 
-    async def dispatch(self, request: Request, call_next: Any) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Allow health check without auth
-        if request.url.path == "/health":
-            return await call_next(request)
+        if scope["path"] == "/health":
+            await self.app(scope, receive, send)
+            return
 
-        auth_header = request.headers.get("authorization", "")
-        if not auth_header.startswith("Bearer "):
-            return JSONResponse(
+        auth_header = _header(scope, b"authorization")
+        if not auth_header.startswith(b"Bearer "):
+            response = JSONResponse(
                 {"error": "Missing or invalid Authorization header"},
                 status_code=401,
             )
+            await response(scope, receive, send)
+            return
 
-        token = auth_header[7:]  # Strip "Bearer "
+        token = auth_header[7:].decode("latin-1")  # Strip "Bearer "
         identity = self._auth.resolve(token)
         if identity is None:
-            return JSONResponse(
+            response = JSONResponse(
                 {"error": "Invalid token"},
                 status_code=401,
             )
+            await response(scope, receive, send)
+            return
+
+        reset_token = current_agent.set(identity)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_agent.reset(reset_token)
+
+
+class _PayloadTooLarge(Exception):
+    pass
+
+
+class PayloadLimitMiddleware:
+    """Enforce the agent's max_payload_bytes on the raw request body.
+
+    Rejects up front on Content-Length and otherwise counts bytes as body
+    chunks arrive, so oversized requests are never fully buffered or parsed.
+    Must run inside BearerAuthMiddleware (it reads current_agent).
+    """
+
+    def __init__(self, app: ASGIApp, policy_engine: PolicyEngine) -> None:
+        self.app = app
+        self._policy = policy_engine
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        identity = current_agent.get()
+        agent_cfg = self._policy.agent_config(identity) if identity is not None else None
+        if scope["type"] != "http" or agent_cfg is None:
+            await self.app(scope, receive, send)
+            return
+
+        limit = agent_cfg.max_payload_bytes
+        content_length = _header(scope, b"content-length")
+        if content_length.isdigit() and int(content_length) > limit:
+            await _too_large(int(content_length), limit)(scope, receive, send)
+            return
+
+        meter = RequestBodyMeter()
+        exceeded = False
+        response_started = False
+
+        async def counting_receive() -> Message:
+            nonlocal exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                meter.bytes_received += len(message.get("body", b""))
+                if meter.bytes_received > limit:
+                    exceeded = True
+                    raise _PayloadTooLarge()
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal response_started
+            if exceeded:
+                # Drop whatever the app tries to send after the limit tripped
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        reset_token = current_request_body.set(meter)
+        try:
+            await self.app(scope, counting_receive, guarded_send)
+        except _PayloadTooLarge:
+            pass
+        finally:
+            current_request_body.reset(reset_token)
+
+        if exceeded and not response_started:
+            await _too_large(meter.bytes_received, limit)(scope, receive, send)
+
 
-        current_agent.set(identity)
-        return await call_next(request)
+def _too_large(size: int, limit: int) -> JSONResponse:
+    return JSONResponse(
+        {
+            "error": "Payload too large",
+            "reasons": [f"Payload size {size} exceeds limit {limit}"],
+        },
+        status_code=413,
+    )
@@ -0,0 +1,111 @@
+"""Helpers shared by the test modules for the LLM plugins and policy runtime."""
+from __future__ import annotations
+
+from typing import Callable, Sequence
+
+import anyio
+import httpx
+import pytest
+
+from src.plugins.llm_query.providers.base import LLMProvider, LLMResponse, Message, TextCallback
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    """Pin a module to asyncio: import this fixture where the code under test
+    uses asyncio primitives (tasks, futures, locks), as the server does."""
+    return "asyncio"
+
+
+def status_error(status: int, headers: dict[str, str] | None = None) -> httpx.HTTPStatusError:
+    """An upstream HTTP error as raised by `raise_for_status()`."""
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError("upstream error", request=request, response=response)
+
+
+class StubProvider(LLMProvider):
+    """Configurable stand-in for an upstream provider.
+
+    Each call waits `delay` seconds, then fails with HTTP `status` if it is
+    set, or with the exception `fail(prompt)` returns, and otherwise answers
+    `reply(prompt)` at `cost`. stream() delivers the answer as one chunk and
+    then raises `stream_error` if it is set. The stub records its calls,
+    peak concurrency, the history each call was sent and whether a call was
+    cancelled.
+    """
+
+    def __init__(
+        self,
+        name: str = "openai",
+        cost: float = 1.0,
+        delay: float = 0.0,
+        status: int | None = None,
+        reply: Callable[[str], str] = lambda prompt: "ok",
+        fail: Callable[[str], BaseException | None] = lambda prompt: None,
+        stream_error: BaseException | None = None,
+    ) -> None:
+        self.name = name
+        self.cost = cost
+        self.delay = delay
+        self.status = status
+        self.reply = reply
+        self.fail = fail
+        self.stream_error = stream_error
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self.cancelled = False
+        self.histories: list[list[Message]] = []
+
+    def provider_name(self) -> str:
+        return self.name
+
+    def estimate_cost(self, model: str, prompt: str, max_tokens: int) -> float:
+        return self.cost
+
+    async def query(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        self.calls += 1
+        self.histories.append(list(history))
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await anyio.sleep(self.delay)
+        except anyio.get_cancelled_exc_class():
+            self.cancelled = True
+            raise
+        finally:
+            self.active -= 1
+        if self.status is not None:
+            raise status_error(self.status)
+        error = self.fail(prompt)
+        if error is not None:
+            raise error
+        return LLMResponse(text=self.reply(prompt), model=model, estimated_cost=self.cost)
+
+    async def stream(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        on_text: TextCallback,
+        timeout: float | None = None,
+        system: str = "",
+        history: Sequence[Message] = (),
+    ) -> LLMResponse:
+        response = await self.query(model, prompt, max_tokens, timeout, system, history)
+        await on_text(response.text)
+        if self.stream_error is not None:
+            raise self.stream_error
+        return response
+
+    async def close(self) -> None:
+        pass
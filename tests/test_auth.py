@@ -62,3 +62,34 @@ async def test_401_bad_token_integration(sample_config: AppConfig) -> None:
             headers={"Authorization": "Bearer wrong-token"},
         )
         assert resp.status_code == 401
+
+
+def test_resolve_uses_single_compare(sample_config: AppConfig, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Lookup is a digest-indexed probe: one constant-time compare regardless of agent count."""
+    import hmac
+
+    from src.core.config import AgentConfig
+
+    agents = {f"agent-{i}": AgentConfig(token=f"token-{i}") for i in range(500)}
+    auth = AuthService(AppConfig(agents=agents))
+
+    calls: list[int] = []
+    original = hmac.compare_digest
+
+    def counting(a: bytes, b: bytes) -> bool:
+        calls.append(1)
+        return original(a, b)
+
+    monkeypatch.setattr(hmac, "compare_digest", counting)
+    identity = auth.resolve("token-499")
+    assert identity is not None and identity.agent_id == "agent-499"
+    assert len(calls) == 1
+    assert auth.resolve("token-missing") is None
+    assert len(calls) == 1
+
+
+def test_resolve_cached_token(sample_config: AppConfig) -> None:
+    auth = AuthService(sample_config)
+    first = auth.resolve("token-alpha-secret")
+    second = auth.resolve("token-alpha-secret")
+    assert first is second
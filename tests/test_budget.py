@@ -1,6 +1,10 @@
 """Tests for LLM budget tracking."""
 from __future__ import annotations
 
+import json
+import time
+from pathlib import Path
+
 from src.core.budget import BudgetTracker
 from src.core.config import AppConfig
 from src.core.policy import PolicyEngine
@@ -44,3 +48,75 @@ def test_budget_exhausted_denies_tool_call(
     decision = policy_engine.check_tool_call(beta_identity, manifest)
     assert not decision.allowed
     assert any("budget exhausted" in r for r in decision.reasons)
+
+
+def test_budget_journal_survives_restart(tmp_path: Path) -> None:
+    path = tmp_path / "budget.journal"
+    tracker = BudgetTracker()
+    tracker.attach_journal(path, flush_interval=60)
+    tracker.record("agent-x", 2.5)
+    tracker.record("agent-x", 1.0)
+    tracker.record("agent-y", 4.0)
+    tracker.close()  # flushes pending entries
+
+    restored = BudgetTracker()
+    restored.attach_journal(path, flush_interval=60)
+    assert restored.spent_today("agent-x") == 3.5
+    assert restored.spent_today("agent-y") == 4.0
+    # Startup compacts the journal to one line per agent
+    assert len(path.read_text().splitlines()) == 2
+    restored.close()
+
+
+def test_budget_journal_flushes_in_background(tmp_path: Path) -> None:
+    path = tmp_path / "budget.journal"
+    tracker = BudgetTracker()
+    tracker.attach_journal(path, flush_interval=0.01)
+    tracker.record("agent-x", 1.0)
+    deadline = time.monotonic() + 5
+    while not path.read_text() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert json.loads(path.read_text())["cost"] == 1.0
+    tracker.close()
+
+
+def test_budget_journal_ignores_other_days_and_torn_lines(tmp_path: Path) -> None:
+    path = tmp_path / "budget.journal"
+    today = BudgetTracker._current_day()
+    path.write_text(
+        json.dumps({"agent_id": "agent-x", "day": today - 1, "cost": 9.0}) + "\n"
+        + json.dumps({"agent_id": "agent-x", "day": today, "cost": 1.0}) + "\n"
+        + '{"agent_id": "agent-x", "da'
+    )
+    tracker = BudgetTracker()
+    tracker.attach_journal(path)
+    assert tracker.spent_today("agent-x") == 1.0
+    tracker.close()
+
+
+def test_reservation_holds_budget() -> None:
+    tracker = BudgetTracker()
+    first = tracker.reserve("agent-x", 6.0, max_cost_per_day=10.0)
+    assert first is not None
+    assert tracker.check("agent-x", max_cost_per_day=10.0) == 4.0
+    # A second concurrent reservation that would overshoot is refused
+    assert tracker.reserve("agent-x", 6.0, max_cost_per_day=10.0) is None
+
+
+def test_reservation_commit_reconciles_actual_cost() -> None:
+    tracker = BudgetTracker()
+    reservation = tracker.reserve("agent-x", 6.0, max_cost_per_day=10.0)
+    assert reservation is not None
+    tracker.commit(reservation, 2.5)
+    assert tracker.reserved_today("agent-x") == 0.0
+    assert tracker.spent_today("agent-x") == 2.5
+    assert tracker.check("agent-x", max_cost_per_day=10.0) == 7.5
+
+
+def test_reservation_release_charges_nothing() -> None:
+    tracker = BudgetTracker()
+    reservation = tracker.reserve("agent-x", 6.0, max_cost_per_day=10.0)
+    assert reservation is not None
+    tracker.release(reservation)
+    assert tracker.spent_today("agent-x") == 0.0
+    assert tracker.check("agent-x", max_cost_per_day=10.0) == 10.0
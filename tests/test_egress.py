@@ -45,3 +45,50 @@ def test_guarded_client_allows_listed_host() -> None:
     client = GuardedHttpClient(allowlist=["api.openai.com"])
     # Should not raise
     client._check("https://api.openai.com/v1/chat/completions")
+
+
+@pytest.mark.anyio
+async def test_guarded_client_warmup_and_pool_stats() -> None:
+    import httpx
+
+    methods: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        methods.append(request.method)
+        return httpx.Response(404)  # any response means the connection is up
+
+    client = GuardedHttpClient(
+        allowlist=["api.openai.com"],
+        transport=httpx.MockTransport(handler),
+        limits=httpx.Limits(max_connections=8, keepalive_expiry=30.0),
+    )
+    assert await client.warmup("https://api.openai.com/v1", connections=3) == 3
+    assert methods == ["HEAD"] * 3
+
+    await client.post("https://api.openai.com/v1/chat/completions", json={})
+    stats = client.pool_stats()
+    assert stats["max_connections"] == 8
+    assert stats["keepalive_expiry"] == 30.0
+    assert stats["requests"] == 1
+    assert stats["in_flight"] == 0
+    await client.aclose()
+
+
+@pytest.mark.anyio
+async def test_guarded_client_warmup_failure_is_not_fatal() -> None:
+    import httpx
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("refused", request=request)
+
+    client = GuardedHttpClient(allowlist=["localhost"], transport=httpx.MockTransport(handler))
+    assert await client.warmup("http://localhost:11434", connections=2) == 0
+    await client.aclose()
+
+
+def test_guarded_client_http2_falls_back_without_h2(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import egress
+
+    monkeypatch.setattr(egress, "_http2_available", lambda: False)
+    client = GuardedHttpClient(allowlist=["api.openai.com"], http2=True)
+    assert client.pool_stats()["http2"] is False
@@ -26,3 +26,67 @@ async def test_health_no_auth_required(sample_config: AppConfig) -> None:
     async with AsyncClient(transport=transport, base_url="http://test") as client:
         resp = await client.get("/health")
         assert resp.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_authenticated_tool_call_round_trip(sample_config: AppConfig) -> None:
+    """Identity set by the ASGI auth middleware reaches the tool wrapper."""
+    app = create_app(config=sample_config)
+    transport = ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post(
+                "/mcp/",
+                json={
+                    "jsonrpc": "2.0",
+                    "id": 1,
+                    "method": "tools/call",
+                    "params": {"name": "core.echo", "arguments": {"text": "hello"}},
+                },
+                headers={
+                    "Authorization": "Bearer token-alpha-secret",
+                    "Accept": "application/json, text/event-stream",
+                },
+            )
+    assert resp.status_code == 200
+    assert '"text":"hello"' in resp.text
+
+
+@pytest.mark.anyio
+async def test_payload_limit_rejects_on_content_length(sample_config: AppConfig) -> None:
+    sample_config.agents["agent-alpha"].max_payload_bytes = 100
+    app = create_app(config=sample_config)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post(
+            "/mcp/",
+            json={"jsonrpc": "2.0", "id": 1, "method": "tools/list", "padding": "x" * 500},
+            headers={"Authorization": "Bearer token-alpha-secret"},
+        )
+    assert resp.status_code == 413
+    assert "exceeds limit 100" in resp.json()["reasons"][0]
+
+
+@pytest.mark.anyio
+async def test_payload_limit_counts_streamed_chunks(sample_config: AppConfig) -> None:
+    """Without Content-Length the body is counted chunk by chunk as it arrives."""
+    sample_config.agents["agent-alpha"].max_payload_bytes = 100
+    app = create_app(config=sample_config)
+    transport = ASGITransport(app=app)
+
+    async def body():  # type: ignore[no-untyped-def]
+        for _ in range(10):
+            yield b"x" * 50
+
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post(
+                "/mcp/",
+                content=body(),
+                headers={
+                    "Authorization": "Bearer token-alpha-secret",
+                    "Content-Type": "application/json",
+                    "Accept": "application/json, text/event-stream",
+                },
+            )
+    assert resp.status_code == 413
@@ -0,0 +1,170 @@
+"""Tests for the per-provider circuit breakers."""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Awaitable
+
+import httpx
+import pytest
+
+from src.core.config import AppConfig, LLMBreakerConfig, LLMRouteConfig
+from src.core.policy import PolicyEngine
+from src.core.types import AgentIdentity
+from src.plugins._base import ToolContext
+from src.plugins.llm_query.breaker import (
+    CircuitBreakers,
+    CircuitOpenError,
+    guarded_call,
+    upstream_call,
+)
+from src.plugins.llm_query.plugin import LLMQueryInput, LLMQueryPlugin
+from src.plugins.llm_query.providers.base import LLMResponse
+from src.plugins.llm_query.routing import LatencyTracker, Router, RouteTarget
+from tests.helpers import StubProvider, anyio_backend, status_error  # noqa: F401 (fixture)
+
+
+def _config(**overrides: object) -> LLMBreakerConfig:
+    values: dict = {"window": 4, "min_calls": 4, "failure_rate": 0.5, "open_seconds": 10.0}
+    values.update(overrides)
+    return LLMBreakerConfig(**values)
+
+
+def test_breaker_trips_on_failure_rate_and_probes_before_closing() -> None:
+    breaker = CircuitBreakers(_config(half_open_probes=2)).get("openai", "gpt-4o")
+    for healthy in (True, False, True):
+        breaker.settle(breaker.admit(0.0), healthy, 0.0)
+    assert breaker.state == "closed"  # fewer than min_calls so far
+    breaker.settle(breaker.admit(1.0), False, 1.0)
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError) as err:
+        breaker.admit(5.0)
+    assert err.value.retry_after == pytest.approx(6.0)
+
+    # Half-open: only half_open_probes calls at a time, and all must succeed
+    assert breaker.admit(11.0) is True
+    assert breaker.admit(11.0) is True
+    with pytest.raises(CircuitOpenError):
+        breaker.admit(11.0)
+    breaker.settle(True, True, 12.0)
+    assert breaker.state == "half_open"
+    breaker.settle(True, True, 12.0)
+    assert breaker.state == "closed"
+
+    # A failed probe reopens the circuit
+    for _ in range(4):
+        breaker.settle(breaker.admit(20.0), False, 20.0)
+    assert breaker.admit(31.0) is True
+    breaker.settle(True, False, 31.0)
+    assert breaker.state == "open" and breaker.trips == 3
+
+
+@pytest.mark.anyio
+async def test_only_upstream_faults_count_against_the_breaker() -> None:
+    breakers = CircuitBreakers(_config(min_calls=2, window=2, failure_rate=1.0, slow_call_seconds=0.01))
+
+    async def call(error: BaseException | None = None, delay: float = 0.0) -> None:
+        async with upstream_call(breakers, None, "openai", "gpt-4o", None):
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+
+    # Rate limiting and cancelled calls (e.g. hedge losers) are not faults
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            await call(status_error(429))
+    task = asyncio.ensure_future(call(delay=1.0))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert breakers.get("openai", "gpt-4o").state == "closed"
+
+    # A 5xx and a slow success trip it
+    with pytest.raises(httpx.HTTPStatusError):
+        await call(status_error(503))
+    await call(delay=0.02)
+    assert breakers.stats()["openai/*"]["state"] == "open"
+    with pytest.raises(CircuitOpenError):
+        await call()
+
+
+@pytest.mark.anyio
+async def test_calls_cut_off_by_the_deadline_trip_the_breaker() -> None:
+    breakers = CircuitBreakers(LLMBreakerConfig())
+
+    async def hung(remaining: float | None) -> LLMResponse:
+        await asyncio.sleep(3600)  # an upstream that accepted the call and went silent
+        raise AssertionError("unreachable")
+
+    def call() -> Awaitable[LLMResponse]:
+        # The tool wrapper cancels at the deadline, before httpx's read timeout fires
+        return asyncio.wait_for(
+            guarded_call(breakers, None, None, "openai", "gpt-4o", None, hung, 0.05), 0.05
+        )
+
+    for _ in range(5):
+        with pytest.raises(asyncio.TimeoutError):
+            await call()
+    stats = breakers.stats()["openai/*"]
+    assert stats["state"] == "open" and stats["trips"] == 1
+    with pytest.raises(CircuitOpenError):
+        await call()
+
+
+@pytest.mark.anyio
+async def test_slow_successes_are_healthy_by_default() -> None:
+    breakers = CircuitBreakers(_config(min_calls=2, window=2, failure_rate=0.5))
+    for _ in range(4):
+        async with upstream_call(breakers, None, "local", "llama3", None):
+            await asyncio.sleep(0.01)
+    assert breakers.get("local", "llama3").state == "closed"
+
+
+@pytest.mark.anyio
+async def test_open_circuit_fails_fast_with_structured_error(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.llm.breaker = _config(min_calls=2, window=2)
+    sample_config.llm.retry.enabled = False  # one upstream attempt per call
+    sample_config.agents["agent-beta"].llm_cache = False
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    provider = StubProvider(cost=0.01, status=503)
+    plugin._providers["openai"] = provider
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", max_tokens=10)
+
+    for _ in range(2):
+        result = json.loads(await plugin.execute(ctx, params))
+        assert "LLM query failed" in result["error"]
+
+    result = json.loads(await plugin.execute(ctx, params))
+    assert result["error"] == "Provider unavailable"
+    assert result["reason"] == "circuit_open"
+    assert result["provider"] == "openai"
+    assert 0 < result["retry_after_seconds"] <= 10
+    assert provider.calls == 2  # the third call never reached the upstream
+    assert policy.budget_tracker.reserved_today("agent-beta") == 0.0
+
+
+@pytest.mark.anyio
+async def test_router_skips_targets_with_open_circuits() -> None:
+    breakers = CircuitBreakers(_config(min_calls=1, window=1, open_seconds=3600))
+    breaker = breakers.get("openai", "gpt-4o")
+    breaker.settle(breaker.admit(time.monotonic()), False, time.monotonic())
+
+    down = StubProvider(cost=0.01, status=503)
+    up = StubProvider(cost=0.01)
+    router = Router(LatencyTracker(), breakers=breakers)
+    targets = [
+        RouteTarget(name="openai", provider=down, model="gpt-4o"),
+        RouteTarget(name="anthropic", provider=up, model="claude-sonnet-4-20250514"),
+    ]
+    response = await router.query(targets, LLMRouteConfig(hedge=False), "hi", 10, lambda: None)
+    assert response.text == "ok"
+    assert down.calls == 0 and up.calls == 1
+    assert router.fallbacks == 1
@@ -0,0 +1,260 @@
+"""Tests for the local (Ollama) provider: endpoint balancing, preloading and keep-warm."""
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+from pydantic import ValidationError
+
+from src.core.config import AppConfig, LLMKeepWarmConfig, LLMProviderConfig
+from src.core.egress import GuardedHttpClient
+from src.core.policy import PolicyEngine
+from src.core.types import AgentIdentity
+from src.plugins._base import ToolContext
+from src.plugins.llm_query.plugin import LLMQueryInput, LLMQueryPlugin
+from src.plugins.llm_query.providers.local import LocalProvider, in_working_hours
+from tests.helpers import anyio_backend  # noqa: F401 (fixture)
+
+_ENDPOINTS = ["http://gpu1:11434", "http://gpu2:11434"]
+
+
+def _provider(handler, **kwargs: object) -> LocalProvider:
+    http = GuardedHttpClient(["gpu1", "gpu2"], transport=httpx.MockTransport(handler))
+    return LocalProvider(base_url=_ENDPOINTS[0], http_client=http, endpoints=_ENDPOINTS, **kwargs)
+
+
+def _generated(text: str = "ok") -> httpx.Response:
+    return httpx.Response(200, json={"response": text, "done": True, "eval_count": 1})
+
+
+@pytest.mark.anyio
+async def test_requests_go_to_the_least_busy_endpoint() -> None:
+    hosts: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        await asyncio.sleep(0.01)
+        return _generated()
+
+    provider = _provider(handler)
+    await asyncio.gather(*(provider.query("llama3", "hi", 10) for _ in range(4)))
+    assert sorted(hosts) == ["gpu1", "gpu1", "gpu2", "gpu2"]
+    assert [e["outstanding"] for e in provider.endpoint_stats()] == [0, 0]
+
+
+@pytest.mark.anyio
+async def test_resident_model_keeps_its_endpoint() -> None:
+    hosts: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/ps":
+            loaded = [{"name": "llama3:latest"}] if request.url.host == "gpu2" else []
+            return httpx.Response(200, json={"models": loaded})
+        hosts.append(request.url.host)
+        return _generated()
+
+    provider = _provider(handler)
+    await provider.check_health()
+    for _ in range(3):
+        await provider.query("llama3", "hi", 10)
+    # Another model goes to the least busy endpoint and then sticks there too
+    await provider.query("mistral", "hi", 10)
+    await provider.query("mistral", "hi", 10)
+    assert hosts == ["gpu2", "gpu2", "gpu2", "gpu1", "gpu1"]
+    assert provider.endpoint_stats()[1]["resident_models"] == ["llama3", "llama3:latest"]
+
+
+@pytest.mark.anyio
+async def test_failed_endpoint_leaves_rotation_until_healthy() -> None:
+    hosts: list[str] = []
+    down = {"gpu1"}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host in down:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": []})
+        hosts.append(request.url.host)
+        return _generated()
+
+    provider = _provider(handler)
+    with pytest.raises(httpx.ConnectError):
+        await provider.query("llama3", "hi", 10)
+    stats = provider.endpoint_stats()
+    assert stats[0]["healthy"] is False and stats[0]["failures"] == 1
+
+    await provider.query("mistral", "hi", 10)
+    assert hosts == ["gpu2"]
+
+    down.clear()
+    await provider.check_health()
+    assert all(e["healthy"] for e in provider.endpoint_stats())
+    await provider.query("phi3", "hi", 10)
+    assert hosts == ["gpu2", "gpu1"]
+
+
+@pytest.mark.anyio
+async def test_server_error_moves_only_that_model() -> None:
+    hosts: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": []})
+        if request.url.host == "gpu1" and json.loads(request.content)["model"] == "llama3":
+            return httpx.Response(500, json={"error": "model requires more system memory"})
+        hosts.append(request.url.host)
+        return _generated()
+
+    provider = _provider(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        await provider.query("llama3", "hi", 10)
+    await provider.query("llama3", "hi", 10)
+    await provider.query("mistral", "hi", 10)
+    assert hosts == ["gpu2", "gpu1"]
+    stats = provider.endpoint_stats()
+    assert stats[0]["healthy"] is True
+    assert stats[0]["failed_models"] == ["llama3", "llama3:latest"]
+
+    await provider.check_health()
+    assert provider.endpoint_stats()[0]["failed_models"] == []
+
+
+@pytest.mark.anyio
+async def test_timeouts_and_single_endpoints_stay_in_rotation() -> None:
+    def slow(request: httpx.Request) -> httpx.Response:
+        raise httpx.ReadTimeout("deadline", request=request)
+
+    provider = _provider(slow)
+    with pytest.raises(httpx.ReadTimeout):
+        await provider.query("llama3", "hi", 10, timeout=0.5)
+    assert provider.endpoint_stats()[0]["healthy"] is True
+
+    def refused(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("connection refused", request=request)
+
+    http = GuardedHttpClient(["gpu1"], transport=httpx.MockTransport(refused))
+    single = LocalProvider(base_url=_ENDPOINTS[0], http_client=http)
+    with pytest.raises(httpx.ConnectError):
+        await single.query("llama3", "hi", 10)
+    # Nothing would put it back, so it is not taken out
+    stats = single.endpoint_stats()
+    assert stats[0]["healthy"] is True and stats[0]["failures"] == 1
+
+
+@pytest.mark.anyio
+async def test_egress_covers_every_local_endpoint(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.llm.providers["local"] = LLMProviderConfig(
+        endpoints=_ENDPOINTS, allowed_models=["llama3"]
+    )
+    sample_config.agents["agent-beta"].egress_allowlist.append("gpu1")
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=PolicyEngine(sample_config))
+    assert plugin._backend.hosts["local"] == ["gpu1", "gpu2"]
+
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+    params = LLMQueryInput(provider="local", model="llama3", prompt="hi", max_tokens=10)
+    result = json.loads(await plugin.execute(ctx, params))
+    assert result["error"] == "Egress denied"
+    assert "gpu2" in result["reasons"][0]
+    await plugin._backend.shutdown()
+
+
+def test_working_hours_window() -> None:
+    office = LLMKeepWarmConfig(start="08:00", end="18:00")
+    assert in_working_hours(office, datetime(2026, 10, 14, 9, 30))  # Wednesday
+    assert not in_working_hours(office, datetime(2026, 10, 14, 18, 0))
+    assert not in_working_hours(office, datetime(2026, 10, 17, 9, 30))  # Saturday
+
+    night = LLMKeepWarmConfig(start="22:00", end="06:00", days=[4])  # Friday night
+    assert in_working_hours(night, datetime(2026, 10, 16, 23, 0))
+    assert in_working_hours(night, datetime(2026, 10, 17, 5, 0))
+    assert not in_working_hours(night, datetime(2026, 10, 16, 5, 0))
+
+
+@pytest.mark.parametrize(
+    "field",
+    [{"timezone": "Europe/Bogus"}, {"start": "8:00"}, {"end": "18:60"}, {"days": [7]}],
+)
+def test_keep_warm_config_is_validated(field: dict) -> None:
+    with pytest.raises(ValidationError):
+        LLMKeepWarmConfig(**field)
+
+
+@pytest.mark.anyio
+async def test_close_survives_a_failed_background_task() -> None:
+    provider = _provider(lambda request: httpx.Response(200))
+
+    async def boom() -> None:
+        raise RuntimeError("boom")
+
+    provider._keep_warm_task = asyncio.create_task(boom())
+    await asyncio.sleep(0)
+    await provider.close()
+    assert provider._http._client.is_closed
+
+
+@pytest.mark.anyio
+async def test_keep_alive_is_sent_and_load_time_reported_apart() -> None:
+    bodies: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(json.loads(request.content))
+        return httpx.Response(
+            200,
+            json={
+                "response": "ok",
+                "done": True,
+                "eval_count": 3,
+                "prompt_eval_count": 2,
+                "load_duration": 12_000_000_000,
+                "prompt_eval_duration": 40_000_000,
+                "eval_duration": 90_000_000,
+            },
+        )
+
+    provider = _provider(handler, keep_alive="30m")
+    response = await provider.query("llama3", "hi", 10)
+    assert bodies[0]["keep_alive"] == "30m"
+    assert response.usage == {
+        "total_tokens": 5,
+        "load_duration_ms": 12_000,
+        "prompt_eval_duration_ms": 40,
+        "eval_duration_ms": 90,
+    }
+    assert provider.endpoint_stats()[0]["load_seconds"] == pytest.approx(12.0)
+
+
+@pytest.mark.anyio
+async def test_preload_spreads_models_and_keep_warm_refreshes_them() -> None:
+    loads: list[tuple[str, str]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": []})
+        body = json.loads(request.content)
+        assert "prompt" not in body  # an empty request loads without generating
+        loads.append((request.url.host, body["model"]))
+        return httpx.Response(200, json={"done": True, "load_duration": 1_000_000})
+
+    always = LLMKeepWarmConfig(
+        enabled=True, interval_seconds=0.01, start="00:00", end="24:00", days=list(range(7))
+    )
+    provider = _provider(
+        handler,
+        preload=["llama3", "mistral"],
+        keep_warm=always,
+        keep_warm_models=["llama3"],
+    )
+    await provider.start()
+    assert loads == [("gpu1", "llama3"), ("gpu2", "mistral")]
+
+    await asyncio.sleep(0.05)
+    await provider.close()
+    refreshed = loads[2:]
+    assert len(refreshed) >= 2 and set(refreshed) == {("gpu1", "llama3")}
+    assert provider.endpoint_stats()[0]["warmups"] == len(refreshed) + 1
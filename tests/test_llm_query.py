@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 import json
+from typing import Any
 
+import anyio
 import pytest
 
 from src.core.config import AppConfig
@@ -11,6 +13,8 @@ from src.core.types import AgentIdentity
 from src.plugins._base import ToolContext
 from src.plugins.llm_query.input_guard import check_input
 from src.plugins.llm_query.plugin import LLMQueryInput, LLMQueryPlugin
+from src.plugins.llm_query.providers.base import LLMResponse
+from tests.helpers import StubProvider
 
 
 def test_input_guard_accept_normal() -> None:
@@ -31,6 +35,43 @@ def test_input_guard_reject_repo_paste() -> None:
     assert any("code fences" in r for r in reasons)
 
 
+def test_input_guard_thresholds() -> None:
+    assert check_input("```x```\n" * 10) == []
+    assert any("code fences" in r for r in check_input("```x```\n" * 11))
+    assert check_input("  def f(): pass\n" * 20) == []
+    assert any("code definitions" in r for r in check_input("\n\n  def f(): pass" * 21))
+    # An unterminated fence does not count as a block
+    assert check_input("```x```\n" * 10 + "```" + "y" * 50_000) == []
+
+
+def test_input_guard_non_ascii_size() -> None:
+    # 40k three-byte characters: under the limit in characters, over it in bytes
+    reasons = check_input("€" * 40_000)
+    assert any("120000 bytes exceeds hard limit" in r for r in reasons)
+    assert check_input("€" * 20_000) == []
+    assert any("at least" in r for r in check_input("€" * 200_000))
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+async def test_input_guard_offloads_large_inputs(
+    anyio_backend: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from src.plugins.llm_query import input_guard
+
+    offloaded: list[int] = []
+    real_to_thread = input_guard.asyncio.to_thread
+
+    async def recording_to_thread(fn, *args):  # type: ignore[no-untyped-def]
+        offloaded.append(len(args[0]))
+        return await real_to_thread(fn, *args)
+
+    monkeypatch.setattr(input_guard.asyncio, "to_thread", recording_to_thread)
+    assert await input_guard.check_input_async("short") == []
+    assert await input_guard.check_input_async("x" * 50_000) == []
+    assert offloaded == [50_000]
+
+
 @pytest.mark.anyio
 async def test_model_not_in_allowlist(
     sample_config: AppConfig,
@@ -87,3 +128,632 @@ async def test_missing_api_key(
     result = await plugin.execute(ctx, params)
     data = json.loads(result)
     assert "not configured" in data.get("text", data.get("error", ""))
+    # The placeholder is not cached, so a key configured later takes effect
+    assert plugin._cache.stats()["entries"] == 0
+
+
+@pytest.mark.anyio
+async def test_provider_receives_remaining_time_budget() -> None:
+    """Providers forward the caller's remaining time as the httpx request timeout."""
+    import httpx
+
+    from src.plugins.llm_query.providers.openai import OpenAIProvider
+
+    seen: dict[str, object] = {}
+
+    class _StubHttp:
+        async def post(self, url: str, **kwargs: object) -> httpx.Response:
+            seen.update(kwargs)
+            return httpx.Response(
+                200,
+                json={"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 3}},
+                request=httpx.Request("POST", url),
+            )
+
+    provider = OpenAIProvider(api_key="k", base_url="https://api.openai.com/v1", http_client=_StubHttp())  # type: ignore[arg-type]
+    await provider.query("gpt-4o", "hi", 10, timeout=2.5)
+    assert seen["timeout"] == 2.5
+
+    seen.clear()
+    await provider.query("gpt-4o", "hi", 10)
+    assert "timeout" not in seen
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_cannot_overshoot_budget(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.agents["agent-beta"].max_cost_per_day = 3.0
+    sample_config.agents["agent-beta"].llm_cache = False
+    sample_config.llm.single_flight.enabled = False  # every call must go upstream
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    plugin._providers["openai"] = StubProvider(delay=0.01)
+
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", max_tokens=10)
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+    results: list[dict] = []
+
+    async def call() -> None:
+        results.append(json.loads(await plugin.execute(ctx, params)))
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(5):
+            tg.start_soon(call)
+
+    assert sum("text" in r for r in results) == 3
+    assert sum(r.get("error") == "Budget exceeded" for r in results) == 2
+    assert policy.budget_tracker.spent_today("agent-beta") == 3.0
+    assert policy.budget_tracker.reserved_today("agent-beta") == 0.0
+
+
+@pytest.mark.anyio
+async def test_failed_call_releases_reservation(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    plugin._providers["openai"] = StubProvider(delay=0.01, fail=lambda prompt: RuntimeError("upstream exploded"))
+
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", max_tokens=10)
+    result = json.loads(await plugin.execute(ToolContext(identity=beta_identity, raw_arguments={}), params))
+    assert "LLM query failed" in result["error"]
+    assert policy.budget_tracker.reserved_today("agent-beta") == 0.0
+    assert policy.budget_tracker.spent_today("agent-beta") == 0.0
+
+
+def test_response_cache_lru_and_ttl(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.plugins.llm_query import cache as cache_module
+    from src.plugins.llm_query.cache import ResponseCache
+
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(max_bytes=2000, ttl_seconds=10)
+    cache.put("a", LLMResponse(text="x" * 500, model="m"))
+    cache.put("b", LLMResponse(text="x" * 500, model="m"))
+    assert cache.get("a") is not None  # "a" is now most recently used
+    cache.put("c", LLMResponse(text="x" * 500, model="m"))  # over the byte cap: evicts "b"
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+@pytest.mark.anyio
+async def test_cache_hit_is_free_and_flagged(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    plugin._providers["openai"] = StubProvider(delay=0.01)
+
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", max_tokens=10)
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+    first = json.loads(await plugin.execute(ctx, params))
+    second = json.loads(await plugin.execute(ctx, params))
+
+    assert first["cached"] is False and first["estimated_cost"] == 1.0
+    assert second["cached"] is True and second["estimated_cost"] == 0.0
+    assert second["text"] == first["text"]
+    assert policy.budget_tracker.spent_today("agent-beta") == 1.0
+
+
+@pytest.mark.anyio
+async def test_cache_opt_out_and_scope(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.agents["agent-gamma"] = sample_config.agents["agent-beta"].model_copy()
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    plugin._providers["openai"] = StubProvider(delay=0.01)
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", max_tokens=10)
+    gamma = AgentIdentity(agent_id="agent-gamma", tenant_id="team-b")
+
+    # Per-agent scope (default): another agent does not see beta's entry
+    await plugin.execute(ToolContext(identity=beta_identity, raw_arguments={}), params)
+    result = json.loads(await plugin.execute(ToolContext(identity=gamma, raw_arguments={}), params))
+    assert result["cached"] is False
+
+    # Tenant scope: agents of the same tenant share entries
+    for agent_cfg in sample_config.agents.values():
+        agent_cfg.llm_cache_scope = "tenant"
+    await plugin.execute(ToolContext(identity=beta_identity, raw_arguments={}), params)
+    result = json.loads(await plugin.execute(ToolContext(identity=gamma, raw_arguments={}), params))
+    assert result["cached"] is True
+
+    # Opt-out always goes upstream
+    sample_config.agents["agent-gamma"].llm_cache = False
+    result = json.loads(await plugin.execute(ToolContext(identity=gamma, raw_arguments={}), params))
+    assert result["cached"] is False
+
+
+def _sse(*events: object) -> bytes:
+    return "".join(f"data: {json.dumps(e) if not isinstance(e, str) else e}\n\n" for e in events).encode()
+
+
+@pytest.mark.anyio
+async def test_openai_stream_forwards_deltas_and_usage() -> None:
+    import httpx
+
+    from src.core.egress import GuardedHttpClient
+    from src.plugins.llm_query.providers.openai import OpenAIProvider
+
+    sent: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, content=_sse(
+            {"choices": [{"delta": {"content": "Hel"}}]},
+            {"choices": [{"delta": {"content": "lo"}}]},
+            {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}},
+            "[DONE]",
+        ))
+
+    http = GuardedHttpClient(["api.openai.com"], transport=httpx.MockTransport(handler))
+    provider = OpenAIProvider(api_key="k", base_url="https://api.openai.com/v1", http_client=http)
+    deltas: list[str] = []
+
+    async def on_text(text: str) -> None:
+        deltas.append(text)
+
+    response = await provider.stream("gpt-4o", "hi", 10, on_text=on_text)
+    assert deltas == ["Hel", "lo"]
+    assert response.text == "Hello"
+    assert response.usage["total_tokens"] == 7
+    assert response.estimated_cost == pytest.approx(7 / 1000 * 0.005)
+    assert sent[0]["stream"] is True and sent[0]["stream_options"] == {"include_usage": True}
+
+
+@pytest.mark.anyio
+async def test_anthropic_stream_collects_usage_from_start_and_delta() -> None:
+    import httpx
+
+    from src.core.egress import GuardedHttpClient
+    from src.plugins.llm_query.providers.anthropic import AnthropicProvider
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=_sse(
+            {"type": "message_start", "message": {"usage": {"input_tokens": 12, "output_tokens": 1}}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hi"}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": " there"}},
+            {"type": "message_delta", "usage": {"output_tokens": 3}},
+            {"type": "message_stop"},
+        ))
+
+    http = GuardedHttpClient(["api.anthropic.com"], transport=httpx.MockTransport(handler))
+    provider = AnthropicProvider(api_key="k", base_url="https://api.anthropic.com/v1", http_client=http)
+    deltas: list[str] = []
+
+    async def on_text(text: str) -> None:
+        deltas.append(text)
+
+    response = await provider.stream("claude-sonnet-4-20250514", "hi", 10, on_text=on_text)
+    assert deltas == ["Hi", " there"]
+    assert response.text == "Hi there"
+    assert response.usage == {
+        "input_tokens": 12,
+        "output_tokens": 3,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0,
+        "total_tokens": 15,
+    }
+
+
+@pytest.mark.anyio
+async def test_local_stream_reads_ndjson() -> None:
+    import httpx
+
+    from src.core.egress import GuardedHttpClient
+    from src.plugins.llm_query.providers.local import LocalProvider
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        lines = [
+            {"response": "a", "done": False},
+            {"response": "b", "done": False},
+            {"response": "", "done": True, "eval_count": 2, "prompt_eval_count": 4},
+        ]
+        return httpx.Response(200, content="\n".join(json.dumps(x) for x in lines).encode())
+
+    http = GuardedHttpClient(["localhost"], transport=httpx.MockTransport(handler))
+    provider = LocalProvider(base_url="http://localhost:11434", http_client=http)
+    deltas: list[str] = []
+
+    async def on_text(text: str) -> None:
+        deltas.append(text)
+
+    response = await provider.stream("llama3", "hi", 10, on_text=on_text)
+    assert deltas == ["a", "b"]
+    assert response.text == "ab"
+    assert response.usage["total_tokens"] == 6
+
+
+@pytest.mark.anyio
+async def test_anthropic_marks_system_prefix_cacheable_and_bills_cache_tokens() -> None:
+    import httpx
+
+    from src.core.egress import GuardedHttpClient
+    from src.plugins.llm_query.providers.anthropic import AnthropicProvider
+
+    sent: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json={
+            "content": [{"type": "text", "text": "ok"}],
+            "usage": {
+                "input_tokens": 10,
+                "output_tokens": 20,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 2000,
+            },
+        })
+
+    http = GuardedHttpClient(["api.anthropic.com"], transport=httpx.MockTransport(handler))
+    provider = AnthropicProvider(api_key="k", base_url="https://api.anthropic.com/v1", http_client=http)
+
+    response = await provider.query("claude-sonnet-4-20250514", "question", 10, system="rules " * 500)
+    assert sent[0]["system"] == [
+        {"type": "text", "text": "rules " * 500, "cache_control": {"type": "ephemeral"}}
+    ]
+    assert sent[0]["messages"] == [{"role": "user", "content": "question"}]
+    assert response.usage["cache_read_input_tokens"] == 2000
+    assert response.usage["total_tokens"] == 2030
+    # Cache reads are billed at a tenth of the input rate
+    assert response.estimated_cost == pytest.approx((10 + 20 + 200) / 1000 * 0.006)
+
+    await provider.query("claude-sonnet-4-20250514", "question", 10)
+    assert "system" not in sent[1]
+
+
+@pytest.mark.anyio
+async def test_openai_puts_system_prefix_first_and_discounts_cached_tokens() -> None:
+    import httpx
+
+    from src.core.egress import GuardedHttpClient
+    from src.plugins.llm_query.providers.openai import OpenAIProvider
+
+    sent: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {
+                "prompt_tokens": 1200,
+                "completion_tokens": 100,
+                "total_tokens": 1300,
+                "prompt_tokens_details": {"cached_tokens": 1024},
+            },
+        })
+
+    http = GuardedHttpClient(["api.openai.com"], transport=httpx.MockTransport(handler))
+    provider = OpenAIProvider(api_key="k", base_url="https://api.openai.com/v1", http_client=http)
+
+    response = await provider.query("gpt-4o", "question", 10, system="shared context")
+    assert sent[0]["messages"] == [
+        {"role": "system", "content": "shared context"},
+        {"role": "user", "content": "question"},
+    ]
+    assert response.usage["cached_tokens"] == 1024
+    assert response.estimated_cost == pytest.approx((1300 - 512) / 1000 * 0.005)
+
+
+@pytest.mark.anyio
+async def test_system_prefix_reaches_upstream_and_budget_charges_discount(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    import httpx
+
+    from src.core.egress import GuardedHttpClient
+    from src.plugins.llm_query.providers.openai import OpenAIProvider
+
+    sent: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        cached = 1000 if len(sent) > 1 else 0
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {
+                "prompt_tokens": 1010,
+                "completion_tokens": 10,
+                "total_tokens": 1020,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        })
+
+    sample_config.agents["agent-beta"].llm_cache = False
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    http = GuardedHttpClient(["api.openai.com"], transport=httpx.MockTransport(handler))
+    plugin._providers["openai"] = OpenAIProvider(
+        api_key="k", base_url="https://api.openai.com/v1", http_client=http
+    )
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+
+    for prompt in ("first", "second"):
+        params = LLMQueryInput(
+            provider="openai", model="gpt-4o", system="style guide", prompt=prompt, max_tokens=10
+        )
+        result = json.loads(await plugin.execute(ctx, params))
+
+    assert [m["messages"][0]["content"] for m in sent] == ["style guide", "style guide"]
+    assert result["usage"]["cached_tokens"] == 1000
+    assert result["estimated_cost"] == pytest.approx((1020 - 500) / 1000 * 0.005)
+    assert policy.budget_tracker.spent_today("agent-beta") == pytest.approx(
+        (1020 + 520) / 1000 * 0.005
+    )
+
+
+@pytest.mark.anyio
+async def test_stream_reports_progress_and_charges_final_cost(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    plugin._providers["openai"] = StubProvider(delay=0.01)
+    progress: list[str] = []
+
+    async def report(message: str) -> None:
+        progress.append(message)
+
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", max_tokens=10, stream=True)
+    ctx = ToolContext(identity=beta_identity, raw_arguments={}, progress=report)
+    result = json.loads(await plugin.execute(ctx, params))
+
+    # The base-class fallback delivers the whole text as one delta
+    assert progress == ["ok"]
+    assert result["text"] == "ok"
+    assert policy.budget_tracker.spent_today("agent-beta") == 1.0
+    assert policy.budget_tracker.reserved_today("agent-beta") == 0.0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+@pytest.mark.parametrize(
+    ("attribution", "shares"), [("leader", [1.0, 0.0, 0.0]), ("split", [1 / 3] * 3)]
+)
+async def test_single_flight_runs_once_and_attributes_cost(
+    anyio_backend: str, attribution: str, shares: list[float]
+) -> None:
+    import asyncio
+
+    from src.plugins.llm_query.singleflight import SingleFlight
+
+    flight: SingleFlight[str] = SingleFlight(attribution=attribution)  # type: ignore[arg-type]
+    calls = 0
+
+    async def upstream() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(3)))
+    assert calls == 1
+    assert [r.value for r in results] == ["ok"] * 3
+    assert [r.cost_share for r in results] == pytest.approx(shares)
+    assert [r.coalesced for r in results] == [False, True, True]
+
+    # Nothing is kept after completion
+    await flight.do("k", upstream)
+    assert calls == 2
+    assert flight.stats() == {"in_flight": 0, "calls": 2, "coalesced": 2}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+async def test_single_flight_survives_caller_cancellation(anyio_backend: str) -> None:
+    import asyncio
+
+    from src.plugins.llm_query.singleflight import SingleFlight
+
+    flight: SingleFlight[str] = SingleFlight()
+    started = asyncio.Event()
+    cancelled = False
+
+    async def upstream() -> str:
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        return "ok"
+
+    leader = asyncio.create_task(flight.do("k", upstream))
+    await started.wait()
+    follower = asyncio.create_task(flight.do("k", upstream))
+    await asyncio.sleep(0)
+    leader.cancel()
+    result = await follower
+    assert result.value == "ok" and result.cost_share == 1.0  # follower pays once leader left
+    assert not cancelled
+
+    # When every caller goes away, the upstream call is cancelled too
+    started.clear()
+    only = asyncio.create_task(flight.do("k2", upstream))
+    await started.wait()
+    only.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await only
+    await asyncio.sleep(0)
+    assert cancelled
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+async def test_identical_concurrent_queries_share_one_upstream_call(
+    anyio_backend: str,
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    import asyncio
+
+    sample_config.agents["agent-beta"].llm_cache = False
+    sample_config.agents["agent-gamma"] = sample_config.agents["agent-beta"].model_copy()
+    sample_config.llm.single_flight.cost_attribution = "split"
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    provider = StubProvider(delay=0.01)
+    plugin._providers["openai"] = provider
+
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", max_tokens=10)
+    gamma = AgentIdentity(agent_id="agent-gamma", tenant_id="team-b")
+    results = [
+        json.loads(r)
+        for r in await asyncio.gather(
+            plugin.execute(ToolContext(identity=beta_identity, raw_arguments={}), params),
+            plugin.execute(ToolContext(identity=gamma, raw_arguments={}), params),
+        )
+    ]
+
+    assert provider.calls == 1
+    assert [r["coalesced"] for r in results] == [False, True]
+    assert [r["estimated_cost"] for r in results] == [0.5, 0.5]
+    assert policy.budget_tracker.spent_today("agent-beta") == 0.5
+    assert policy.budget_tracker.spent_today("agent-gamma") == 0.5
+    assert policy.budget_tracker.reserved_today("agent-gamma") == 0.0
+
+
+def test_flight_and_cache_keys_cover_the_resolved_route(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    from src.plugins.llm_query.routing import RouteTarget
+
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=PolicyEngine(sample_config))
+    primary = RouteTarget(name="openai", provider=StubProvider(delay=0.01), model="gpt-4o")
+    fallback = RouteTarget(
+        name="anthropic", provider=StubProvider(delay=0.01), model="claude-sonnet-4-20250514"
+    )
+    # A caller whose policy filtered out the fallback must not share the routed call
+    routed = plugin._flight_key(beta_identity, [primary, fallback], "hi", 10)
+    direct = plugin._flight_key(beta_identity, [primary], "hi", 10)
+    assert routed != direct
+    assert direct == plugin._flight_key(beta_identity, [primary], "hi", 10)
+
+    # Likewise a tenant-shared cache entry a fallback may have answered
+    agent_cfg = sample_config.agents["agent-beta"]
+    agent_cfg.llm_cache_scope = "tenant"
+    routed = plugin._cache_key(beta_identity, agent_cfg, [primary, fallback], "hi", 10)
+    direct = plugin._cache_key(beta_identity, agent_cfg, [primary], "hi", 10)
+    assert routed is not None and routed != direct
+
+
+def _scripted(name: str, **kwargs: Any) -> StubProvider:
+    """A stub that answers with its own name, so tests can tell which target replied."""
+    return StubProvider(name, reply=lambda prompt: name, **kwargs)
+
+
+def _route_targets(*providers: StubProvider) -> list:
+    from src.plugins.llm_query.routing import RouteTarget
+
+    return [RouteTarget(name=p.name, provider=p, model=f"{p.name}-model") for p in providers]
+
+
+def test_latency_tracker_percentile() -> None:
+    from src.plugins.llm_query.routing import LatencyTracker
+
+    tracker = LatencyTracker()
+    assert tracker.percentile("openai", "gpt-4o", 95) is None
+    for i in range(1, 101):
+        tracker.record("openai", "gpt-4o", i / 100)
+    assert tracker.percentile("openai", "gpt-4o", 95) == 0.95
+    assert tracker.percentile("openai", "gpt-4o", 50, min_samples=200) is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+async def test_router_hedges_slow_primary_and_cancels_loser(anyio_backend: str) -> None:
+    from src.core.config import LLMRouteConfig
+    from src.plugins.llm_query.routing import LatencyTracker, Router
+
+    slow, fast = _scripted("slow", delay=1.0), _scripted("fast", delay=0.01)
+    router = Router(LatencyTracker())
+    route = LLMRouteConfig(hedge_delay_seconds=0.02)
+
+    response = await router.query(_route_targets(slow, fast), route, "hi", 10, lambda: None)
+    assert response.text == "fast"
+    assert slow.cancelled
+    assert router.stats()["hedges"] == 1 and router.stats()["hedge_wins"] == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+async def test_router_falls_back_only_on_retryable_errors(anyio_backend: str) -> None:
+    import httpx
+
+    from src.core.config import LLMRouteConfig
+    from src.plugins.llm_query.routing import LatencyTracker, Router
+
+    router = Router(LatencyTracker())
+    route = LLMRouteConfig(hedge=False)
+
+    for status in (429, 503):
+        backup = _scripted("backup")
+        response = await router.query(
+            _route_targets(_scripted("primary", status=status), backup), route, "hi", 10, lambda: None
+        )
+        assert response.text == "backup"
+    assert router.fallbacks == 2
+
+    backup = _scripted("backup")
+    with pytest.raises(httpx.HTTPStatusError):
+        await router.query(
+            _route_targets(_scripted("primary", status=400), backup), route, "hi", 10, lambda: None
+        )
+    assert backup.calls == 0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])
+async def test_routed_query_respects_allowlists_and_charges_kept_response(
+    anyio_backend: str,
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    from src.core.config import LLMRouteConfig, LLMRouteTarget
+
+    sample_config.agents["agent-beta"].llm_cache = False
+    sample_config.llm.routes["frontier"] = LLMRouteConfig(
+        targets=[
+            LLMRouteTarget(provider="openai", model="gpt-4o"),
+            LLMRouteTarget(provider="anthropic", model="claude-haiku-4-5-20251001"),  # not allowed
+            LLMRouteTarget(provider="anthropic", model="claude-sonnet-4-20250514"),
+        ],
+        hedge_delay_seconds=0.02,
+    )
+    policy = PolicyEngine(sample_config)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=policy)
+    openai = _scripted("openai", delay=1.0, cost=1.0)
+    anthropic = _scripted("anthropic", delay=0.01, cost=3.0)
+    plugin._providers["openai"] = openai
+    plugin._providers["anthropic"] = anthropic
+
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", max_tokens=10)
+    targets, _ = plugin._targets(beta_identity, "openai", "gpt-4o", openai)
+    assert [(t.name, t.model) for t in targets] == [
+        ("openai", "gpt-4o"),
+        ("anthropic", "claude-sonnet-4-20250514"),
+    ]
+
+    result = json.loads(await plugin.execute(ToolContext(identity=beta_identity, raw_arguments={}), params))
+    assert result["model"] == "claude-sonnet-4-20250514"
+    assert openai.cancelled
+    assert result["estimated_cost"] == 3.0
+    assert policy.budget_tracker.spent_today("agent-beta") == 3.0
+    assert policy.budget_tracker.reserved_today("agent-beta") == 0.0
+
+    # Without egress to the alternate's host there is nothing to hedge to
+    sample_config.agents["agent-beta"].egress_allowlist = ["api.openai.com"]
+    policy.reload(sample_config)
+    targets, _ = plugin._targets(beta_identity, "openai", "gpt-4o", openai)
+    assert [t.name for t in targets] == ["openai"]
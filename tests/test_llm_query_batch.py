@@ -0,0 +1,136 @@
+"""Tests for the llm.query_batch plugin."""
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+
+from src.core.config import AppConfig
+from src.core.policy import PolicyEngine
+from src.core.types import AgentIdentity
+from src.plugins._base import ToolContext
+from src.plugins.llm_query_batch.plugin import LLMQueryBatchInput, LLMQueryBatchPlugin
+from tests.helpers import StubProvider, anyio_backend  # noqa: F401 (fixture)
+
+
+def _plugin(config: AppConfig) -> tuple[LLMQueryBatchPlugin, StubProvider, PolicyEngine]:
+    policy = PolicyEngine(config)
+    plugin = LLMQueryBatchPlugin(config=config, policy_engine=policy)
+    # Each call costs $1 and takes a little while; the prompt "bad" fails
+    provider = StubProvider(
+        delay=0.01,
+        reply=str.upper,
+        fail=lambda prompt: RuntimeError("upstream 500") if prompt == "bad" else None,
+    )
+    plugin._providers["openai"] = provider
+    return plugin, provider, policy
+
+
+@pytest.mark.anyio
+async def test_batch_runs_bounded_and_reports_items(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.agents["agent-beta"].batch_parallelism = 2
+    plugin, provider, policy = _plugin(sample_config)
+    progress: list[dict] = []
+
+    async def report(message: str) -> None:
+        progress.append(json.loads(message))
+
+    params = LLMQueryBatchInput(
+        provider="openai", model="gpt-4o", prompts=["a", "bad", "c", "d", "e"], max_tokens=10
+    )
+    ctx = ToolContext(identity=beta_identity, raw_arguments={}, progress=report)
+    result = json.loads(await plugin.execute(ctx, params))
+
+    assert provider.calls == 5
+    assert provider.peak == 2
+    assert result["succeeded"] == 4 and result["failed"] == 1
+    assert [r["index"] for r in result["results"]] == [0, 1, 2, 3, 4]
+    assert result["results"][0]["text"] == "A"
+    assert "upstream 500" in result["results"][1]["error"]
+    assert sorted(item["index"] for item in progress) == [0, 1, 2, 3, 4]
+    # Only the completions that succeeded are charged
+    assert result["estimated_cost"] == 4.0
+    assert policy.budget_tracker.spent_today("agent-beta") == 4.0
+    assert policy.budget_tracker.reserved_today("agent-beta") == 0.0
+
+
+@pytest.mark.anyio
+async def test_concurrent_batches_share_the_agents_cap(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.agents["agent-beta"].batch_parallelism = 2
+    plugin, provider, _ = _plugin(sample_config)
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+
+    await asyncio.gather(*(
+        plugin.execute(ctx, LLMQueryBatchInput(provider="openai", model="gpt-4o", prompts=batch))
+        for batch in (["a", "b", "c"], ["d", "e", "f"])
+    ))
+    assert provider.calls == 6
+    assert provider.peak == 2
+
+
+@pytest.mark.anyio
+async def test_batch_budget_is_reserved_as_a_whole(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.agents["agent-beta"].max_cost_per_day = 2.0
+    plugin, provider, _ = _plugin(sample_config)
+
+    params = LLMQueryBatchInput(provider="openai", model="gpt-4o", prompts=["a", "b", "c"])
+    result = json.loads(
+        await plugin.execute(ToolContext(identity=beta_identity, raw_arguments={}), params)
+    )
+    assert result["error"] == "Budget exceeded"
+    assert provider.calls == 0
+
+
+@pytest.mark.anyio
+async def test_batch_serves_cached_items_without_upstream_call(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    plugin, provider, _ = _plugin(sample_config)
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+
+    await plugin.execute(ctx, LLMQueryBatchInput(provider="openai", model="gpt-4o", prompts=["a"]))
+    result = json.loads(await plugin.execute(
+        ctx, LLMQueryBatchInput(provider="openai", model="gpt-4o", prompts=["a", "b"])
+    ))
+    assert provider.calls == 2
+    assert [r["cached"] for r in result["results"]] == [True, False]
+    assert result["estimated_cost"] == 1.0
+
+
+def test_batch_consumes_one_rate_unit_per_prompt(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.agents["agent-beta"].rate_limit = 5
+    sample_config.agents["agent-beta"].allowed_tools.append("llm.query_batch")
+    plugin, _, policy = _plugin(sample_config)
+    manifest = plugin.manifest()
+
+    assert plugin.rate_cost({"prompts": ["x"] * 4}) == 4
+    assert policy.check_tool_call(beta_identity, manifest, rate_cost=4).allowed
+    decision = policy.check_tool_call(beta_identity, manifest, rate_cost=2)
+    assert not decision.allowed
+    assert any("Rate limit exceeded" in r for r in decision.reasons)
+
+    # A batch larger than the whole limit is rejected outright, without being charged
+    policy = PolicyEngine(sample_config)
+    decision = policy.check_tool_call(
+        beta_identity, manifest, rate_cost=plugin.rate_cost({"prompts": ["x"] * 50})
+    )
+    assert not decision.allowed
+    assert decision.reasons == [
+        "Call needs 50 rate-limit units, more than the limit of 5 requests/minute; "
+        "split it into smaller calls"
+    ]
+    assert policy.check_tool_call(beta_identity, manifest, rate_cost=5).allowed
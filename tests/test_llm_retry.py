@@ -0,0 +1,183 @@
+"""Tests for retries of transient upstream failures."""
+from __future__ import annotations
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.core.config import AppConfig, LLMAdaptiveLimitConfig, LLMRetryConfig
+from src.core.egress import GuardedHttpClient
+from src.core.policy import PolicyEngine
+from src.core.types import AgentIdentity
+from src.plugins._base import ToolContext
+from src.plugins.llm_query.breaker import guarded_call
+from src.plugins.llm_query.plugin import LLMQueryInput, LLMQueryPlugin
+from src.plugins.llm_query.providers.base import LLMProvider, LLMResponse
+from src.plugins.llm_query.providers.openai import OpenAIProvider
+from src.plugins.llm_query.retry import RetryPolicy, retry_after, retry_reason
+from src.plugins.llm_query.scheduler import UpstreamScheduler
+from tests.helpers import StubProvider, status_error
+
+
+def _policy(**overrides: object) -> RetryPolicy:
+    values: dict = {"base_delay": 0.001, "max_delay": 0.01}
+    values.update(overrides)
+    return RetryPolicy(LLMRetryConfig(**values))
+
+
+def _openai(handler) -> OpenAIProvider:
+    http = GuardedHttpClient(["api.openai.com"], transport=httpx.MockTransport(handler))
+    return OpenAIProvider(api_key="sk-test", base_url="https://api.openai.com/v1", http_client=http)
+
+
+async def _query(
+    provider: LLMProvider,
+    retry: RetryPolicy,
+    timeout: float | None = None,
+    scheduler: UpstreamScheduler | None = None,
+    identity: AgentIdentity | None = None,
+) -> LLMResponse:
+    async def once(remaining: float | None) -> LLMResponse:
+        return await provider.query("gpt-4o", "hi", 10, timeout=remaining)
+
+    return await guarded_call(None, scheduler, retry, "openai", "gpt-4o", identity, once, timeout)
+
+
+def _completion(text: str = "ok") -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={"choices": [{"message": {"content": text}}], "usage": {"total_tokens": 5}},
+    )
+
+
+def test_only_failures_before_the_completion_ran_are_retryable() -> None:
+    assert retry_reason(status_error(429)) == "http_429"
+    assert retry_reason(status_error(529)) == "http_529"
+    assert retry_reason(status_error(500)) is None  # the model may have run
+    assert retry_reason(status_error(504)) is None
+    assert retry_reason(status_error(400)) is None
+    assert retry_reason(httpx.ConnectError("refused")) == "connect"
+    assert retry_reason(httpx.ReadTimeout("slow")) is None
+
+    assert retry_after(status_error(429, {"retry-after": "3"}).response) == 3.0
+    assert retry_after(status_error(429, {"retry-after-ms": "250"}).response) == 0.25
+    assert retry_after(status_error(429, {"retry-after": "soon"}).response) is None
+    assert retry_after(status_error(429).response) is None
+
+
+@pytest.mark.anyio
+async def test_transient_failures_are_retried_and_reported_in_usage() -> None:
+    statuses = [429, 503]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if statuses:
+            return httpx.Response(statuses.pop(0), headers={"retry-after": "0"})
+        return _completion()
+
+    policy = _policy()
+    response = await _query(_openai(handler), policy, timeout=5.0)
+    assert response.text == "ok"
+    assert response.usage["retries"] == 2
+    stats = policy.stats()
+    assert stats["calls"] == 1 and stats["retries"] == 2
+    assert stats["reasons"] == {"http_429": 1, "http_503": 1}
+
+
+@pytest.mark.anyio
+async def test_retries_are_capped_per_call_and_by_the_shared_budget() -> None:
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(503)
+
+    policy = _policy(max_retries=2, budget_reserve=3, budget_ratio=0.0)
+    provider = _openai(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        await _query(provider, policy)
+    assert calls == 3
+    # One retry left in the budget, then the outage is not amplified any further
+    with pytest.raises(httpx.HTTPStatusError):
+        await _query(provider, policy)
+    assert calls == 5
+    assert policy.stats()["not_retried"] == {"max_retries": 1, "budget": 1}
+
+
+@pytest.mark.anyio
+async def test_retry_after_beyond_the_deadline_fails_at_once() -> None:
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(429, headers={"retry-after": "5"})
+
+    policy = _policy()
+    with pytest.raises(httpx.HTTPStatusError):
+        await _query(_openai(handler), policy, timeout=1.0)
+    assert calls == 1
+    assert policy.stats()["not_retried"] == {"deadline": 1}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])  # the scheduler queues on asyncio
+async def test_backoff_releases_the_slot_and_each_attempt_feeds_the_limit(
+    anyio_backend: str,
+) -> None:
+    scheduler = UpstreamScheduler(
+        limits={"openai": 8},
+        default_limit=8,
+        adaptive=LLMAdaptiveLimitConfig(min_limit=1, max_limit=8, backoff=0.5),
+    )
+    active_during_backoff: list[int] = []
+    attempts = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            return httpx.Response(429, headers={"retry-after": "0.05"})
+        return _completion()
+
+    async def watch() -> None:
+        await asyncio.sleep(0.02)
+        active_during_backoff.append(scheduler.stats()["openai"]["active"])
+
+    identity = AgentIdentity(agent_id="a", tenant_id="t")
+    response, _ = await asyncio.gather(
+        _query(_openai(handler), _policy(), scheduler=scheduler, identity=identity), watch()
+    )
+    assert response.usage["retries"] == 1
+    assert active_during_backoff == [0]
+    # The 429 shrank the limit even though the call succeeded on retry
+    assert scheduler.stats()["openai"]["limit"] == 4
+
+
+@pytest.mark.anyio
+async def test_stream_is_retried_only_before_text_is_delivered(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    sample_config.llm.retry = LLMRetryConfig(base_delay=0.001, max_delay=0.01)
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=PolicyEngine(sample_config))
+    # The first stream fails with a 529; the next delivers text, then drops the connection
+    provider = StubProvider(
+        reply=lambda prompt: "hi", stream_error=httpx.ConnectError("connection dropped")
+    )
+    provider.fail = lambda prompt: status_error(529) if provider.calls == 1 else None
+    plugin._providers["openai"] = provider
+    deltas: list[str] = []
+
+    async def progress(text: str) -> None:
+        deltas.append(text)
+
+    ctx = ToolContext(identity=beta_identity, raw_arguments={}, progress=progress)
+    params = LLMQueryInput(provider="openai", model="gpt-4o", prompt="hi", stream=True)
+    result = json.loads(await plugin.execute(ctx, params))
+    # The 529 was retried; the failure after "hi" was delivered was not
+    assert "connection dropped" in result["error"]
+    assert provider.calls == 2
+    assert deltas == ["hi"]
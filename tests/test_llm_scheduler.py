@@ -0,0 +1,203 @@
+"""Tests for the global upstream scheduler (per-provider cap, fair queuing, adaptive limit)."""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from src.core.config import AppConfig, LLMAdaptiveLimitConfig
+from src.core.types import AgentIdentity
+from src.plugins.about_upstreams.plugin import AboutUpstreamsPlugin
+from src.plugins.llm_query.adaptive import AIMDLimit
+from src.plugins.llm_query.backend import LLMBackend
+from src.plugins.llm_query.scheduler import UpstreamScheduler
+from tests.helpers import anyio_backend, status_error  # noqa: F401 (fixture)
+
+
+async def _service_order(
+    scheduler: UpstreamScheduler, callers: list[tuple[str, str]]
+) -> list[str]:
+    """Queue `callers` (tenant, agent) behind a held slot; return the order they are served."""
+    order: list[str] = []
+    release = asyncio.Event()
+
+    async def hold() -> None:
+        async with scheduler.acquire("openai", "holder", "holder"):
+            await release.wait()
+
+    async def call(tenant: str, agent: str) -> None:
+        async with scheduler.acquire("openai", tenant, agent):
+            order.append(f"{tenant}/{agent}")
+            await asyncio.sleep(0)
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    tasks = []
+    for tenant, agent in callers:
+        tasks.append(asyncio.create_task(call(tenant, agent)))
+        await asyncio.sleep(0)  # enqueue in list order
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return order
+
+
+@pytest.mark.anyio
+async def test_scheduler_caps_concurrency_per_provider() -> None:
+    scheduler = UpstreamScheduler(limits={"openai": 2}, default_limit=8)
+    active = peak = 0
+
+    async def call(provider: str) -> None:
+        nonlocal active, peak
+        async with scheduler.acquire(provider, "t", "a"):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    await asyncio.gather(*(call("openai") for _ in range(6)))
+    assert peak == 2
+    stats = scheduler.stats()["openai"]
+    assert stats["granted"] == 6 and stats["active"] == 0 and stats["queued"] == 0
+    assert stats["queues"]["t/a"]["max_depth"] == 4
+    assert stats["queues"]["t/a"]["max_wait_seconds"] > 0
+
+    # Other providers have their own (default) cap
+    peak = 0
+    await asyncio.gather(*(call("anthropic") for _ in range(6)))
+    assert peak == 6
+
+
+@pytest.mark.anyio
+async def test_noisy_tenant_cannot_starve_others() -> None:
+    scheduler = UpstreamScheduler(limits={"openai": 1}, default_limit=1)
+    order = await _service_order(scheduler, [("noisy", "a")] * 6 + [("quiet", "b")] * 2)
+    # The quiet tenant arrived last but is served in alternation, not after the backlog
+    assert order[:4] == ["noisy/a", "quiet/b", "noisy/a", "quiet/b"]
+
+
+@pytest.mark.anyio
+async def test_tenant_and_agent_weights() -> None:
+    scheduler = UpstreamScheduler(
+        limits={"openai": 1},
+        default_limit=1,
+        tenant_weights={"big": 2.0},
+        agent_weights={"fast": 3.0},
+    )
+    order = await _service_order(scheduler, [("big", "x")] * 6 + [("small", "y")] * 3)
+    # While both are backlogged the heavier tenant gets twice the slots
+    assert order[:6].count("big/x") == 4 and order[:6].count("small/y") == 2
+
+    # Within a tenant, agents share its slots by their own weights
+    order = await _service_order(scheduler, [("t", "slow")] * 4 + [("t", "fast")] * 6)
+    assert order[:8].count("t/fast") == 6
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_leaves_the_queue() -> None:
+    scheduler = UpstreamScheduler(limits={"openai": 1}, default_limit=1)
+    release = asyncio.Event()
+
+    async def hold() -> None:
+        async with scheduler.acquire("openai", "t", "a"):
+            await release.wait()
+
+    async def wait_for_slot() -> None:
+        async with scheduler.acquire("openai", "t", "b"):
+            pass
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(wait_for_slot())
+    await asyncio.sleep(0.01)
+    queue = scheduler.stats()["openai"]["queues"]["t/b"]
+    assert queue["depth"] == 1 and queue["oldest_wait_seconds"] > 0
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler.stats()["openai"]["queued"] == 0
+
+    release.set()
+    await holder
+    # The slot is free again for the next caller
+    async with scheduler.acquire("openai", "t", "c"):
+        assert scheduler.stats()["openai"]["active"] == 1
+
+
+@pytest.mark.anyio
+async def test_upstreams_resource_shows_only_the_callers_tenant_queues(
+    sample_config: AppConfig,
+) -> None:
+    backend = LLMBackend(sample_config)
+    assert backend.scheduler is not None
+    async with backend.scheduler.acquire("openai", "team-a", "agent-alpha"):
+        async with backend.scheduler.acquire("openai", "team-b", "agent-beta"):
+            resource = AboutUpstreamsPlugin(backend=backend)
+            stats = json.loads(
+                await resource.read(AgentIdentity(agent_id="agent-beta", tenant_id="team-b"))
+            )
+    openai = stats["scheduler"]["openai"]
+    assert list(openai["queues"]) == ["team-b/agent-beta"]
+    assert openai["granted"] == 2  # provider totals still cover every tenant
+    await backend.shutdown()
+
+
+def test_aimd_limit_backs_off_once_per_congestion_event() -> None:
+    limit = AIMDLimit(initial=10, min_limit=2, max_limit=20, backoff=0.5)
+    before = time.monotonic()
+    # A burst of 429s from calls that were all in flight together halves the limit once
+    for _ in range(5):
+        limit.observe(before, 0.1, saturated=True, error=status_error(429))
+    assert limit.limit == 5
+    # A call started after the decrease can shrink it again; a 400 cannot
+    limit.observe(time.monotonic(), 0.1, saturated=True, error=status_error(400))
+    assert limit.limit == 5
+    limit.observe(time.monotonic(), 0.1, saturated=True, error=status_error(503))
+    assert limit.limit == 2  # floored at min_limit
+    assert [h["reason"] for h in limit.history] == ["rate_limited", "overloaded"]
+
+
+def test_aimd_limit_grows_under_saturation_and_shrinks_on_slow_calls() -> None:
+    limit = AIMDLimit(initial=4, min_limit=1, max_limit=6, backoff=0.5, latency_tolerance=2.0)
+    for _ in range(40):
+        limit.observe(time.monotonic(), 1.0, saturated=False)
+    assert limit.limit == 4  # headroom is only probed while every slot is in use
+    for _ in range(40):
+        limit.observe(time.monotonic(), 1.0, saturated=True)
+    assert limit.limit == 6  # capped at max_limit
+    limit.observe(time.monotonic(), 5.0, saturated=True)
+    assert limit.limit == 3
+    assert limit.history[-1]["reason"] == "latency"
+    assert limit.stats()["baseline_latency"] == pytest.approx(1.4)
+
+
+def test_aimd_limit_ignores_latency_by_default() -> None:
+    limit = AIMDLimit(initial=32, min_limit=1, max_limit=64, backoff=0.7)
+    # Healthy upstream, completions of very different lengths
+    for i in range(3000):
+        limit.observe(time.monotonic(), 1.0 + (i * 7) % 6, saturated=False)
+    assert limit.limit == 32
+    assert not limit.history
+
+
+@pytest.mark.anyio
+async def test_scheduler_limit_follows_upstream_rate_limits() -> None:
+    scheduler = UpstreamScheduler(
+        limits={"openai": 8},
+        default_limit=8,
+        adaptive=LLMAdaptiveLimitConfig(min_limit=1, max_limit=8, backoff=0.5),
+    )
+
+    async def rate_limited() -> None:
+        async with scheduler.acquire("openai", "t", "a"):
+            await asyncio.sleep(0)
+            raise status_error(429)
+
+    results = await asyncio.gather(*(rate_limited() for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+    stats = scheduler.stats()["openai"]
+    assert stats["limit"] == 4
+    assert stats["adaptive"]["history"][0]["reason"] == "rate_limited"
@@ -0,0 +1,209 @@
+"""Tests for llm.query conversation sessions."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from src.core.config import AppConfig
+from src.core.policy import PolicyEngine
+from src.core.types import AgentIdentity
+from src.plugins._base import ToolContext
+from src.plugins.llm_query.plugin import LLMQueryInput, LLMQueryPlugin
+from src.plugins.llm_query.providers.base import Message
+from src.plugins.llm_query.sessions import SessionStore
+from tests.helpers import StubProvider
+
+
+def _turn(n: int, size: int = 100) -> list[Message]:
+    return [
+        {"role": "user", "content": f"q{n}" + "x" * size},
+        {"role": "assistant", "content": f"a{n}" + "x" * size},
+    ]
+
+
+@pytest.mark.anyio
+async def test_session_store_is_agent_scoped() -> None:
+    store = SessionStore(max_bytes=10_000, ttl_seconds=60, max_session_bytes=10_000)
+    await store.append("agent-a", "s1", _turn(1))
+    assert await store.history("agent-a", "s1") == _turn(1)
+    assert await store.history("agent-b", "s1") is None
+
+
+@pytest.mark.anyio
+async def test_session_store_ttl_and_turn_trimming(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.plugins.llm_query import sessions as sessions_module
+
+    now = [1000.0]
+    monkeypatch.setattr(sessions_module.time, "time", lambda: now[0])
+    store = SessionStore(max_bytes=100_000, ttl_seconds=10, max_session_bytes=700)
+    for n in range(4):
+        await store.append("a", "s", _turn(n))
+    # Each turn is ~330 bytes; only the newest two fit
+    assert await store.history("a", "s") == _turn(2) + _turn(3)
+    now[0] += 9
+    assert await store.history("a", "s") is not None
+    now[0] += 9  # TTL is idle time: reads do not extend it, appends do
+    assert await store.history("a", "s") is None
+
+    # Sessions nobody touches again are swept from memory
+    await store.append("a", "idle", _turn(9))
+    now[0] += 61
+    await store.append("a", "busy", _turn(10))
+    assert store.stats()["sessions"] == 1
+    assert store.stats()["expired"] == 2
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("anyio_backend", ["asyncio"])  # spill I/O runs in asyncio worker threads
+async def test_session_store_spills_lru_sessions_to_disk(anyio_backend: str, tmp_path: Path) -> None:
+    store = SessionStore(
+        max_bytes=900, ttl_seconds=60, max_session_bytes=900, spill_dir=tmp_path
+    )
+    await store.append("a", "s1", _turn(1))
+    await store.append("a", "s2", _turn(2))
+    await store.append("a", "s3", _turn(3))  # over the byte cap: s1 goes to disk
+    assert store.stats()["spilled"] == 1
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+    assert await store.history("a", "s1") == _turn(1)
+    assert store.stats()["restored"] == 1
+    # Restoring s1 pushed the least recently used session (s2) out in turn
+    assert store.stats()["sessions"] == 2
+
+    # A new store over the same directory still finds spilled sessions
+    reopened = SessionStore(
+        max_bytes=900, ttl_seconds=60, max_session_bytes=900, spill_dir=tmp_path
+    )
+    assert await reopened.history("a", "s2") == _turn(2)
+
+
+@pytest.mark.anyio
+async def test_session_replays_history_so_agents_send_only_deltas(
+    sample_config: AppConfig,
+    alpha_identity: AgentIdentity,
+    beta_identity: AgentIdentity,
+) -> None:
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=PolicyEngine(sample_config))
+    provider = StubProvider(cost=0.01, reply=lambda prompt: f"re: {prompt}")
+    plugin._providers["openai"] = provider
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+
+    first = json.loads(await plugin.execute(ctx, LLMQueryInput(
+        provider="openai", model="gpt-4o", prompt="hello", new_session=True,
+    )))
+    session_id = first["session_id"]
+    second = json.loads(await plugin.execute(ctx, LLMQueryInput(
+        provider="openai", model="gpt-4o", prompt="and then?", session_id=session_id,
+    )))
+
+    assert second["text"] == "re: and then?"
+    assert second["session_id"] == session_id
+    assert second["cached"] is False
+    assert provider.histories == [
+        [],
+        [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "re: hello"}],
+    ]
+
+    result = json.loads(await plugin.execute(ctx, LLMQueryInput(
+        provider="openai", model="gpt-4o", prompt="hi", session_id="not-a-session",
+    )))
+    assert "Unknown or expired session" in result["error"]
+    # Sessions are keyed by agent
+    assert plugin._sessions is not None
+    assert await plugin._sessions.history(alpha_identity.agent_id, session_id) is None
+
+
+@pytest.mark.anyio
+async def test_guard_heuristics_do_not_add_up_over_a_conversation(
+    sample_config: AppConfig,
+    beta_identity: AgentIdentity,
+) -> None:
+    plugin = LLMQueryPlugin(config=sample_config, policy_engine=PolicyEngine(sample_config))
+    provider = StubProvider(cost=0.01, reply=lambda prompt: f"re: {prompt}")
+    plugin._providers["openai"] = provider
+    ctx = ToolContext(identity=beta_identity, raw_arguments={})
+
+    # One small snippet per turn: more than MAX_CODE_FENCES over the conversation
+    snippet = "Why does this fail?\n```\nfrom x import y\nlet z = y\n```"
+    first = json.loads(await plugin.execute(ctx, LLMQueryInput(
+        provider="openai", model="gpt-4o", prompt=snippet, new_session=True,
+    )))
+    for _ in range(14):
+        result = json.loads(await plugin.execute(ctx, LLMQueryInput(
+            provider="openai", model="gpt-4o", prompt=snippet, session_id=first["session_id"],
+        )))
+        assert "error" not in result
+    assert len(provider.histories) == 15
+
+    # The new message itself is still checked
+    paste = "\n".join(f"def f{i}(): pass" for i in range(25))
+    result = json.loads(await plugin.execute(ctx, LLMQueryInput(
+        provider="openai", model="gpt-4o", prompt=paste, session_id=first["session_id"],
+    )))
+    assert result["error"] == "Input rejected"
+
+
+def test_fit_history_keeps_the_newest_turns_within_the_limit() -> None:
+    from src.plugins.llm_query.sessions import fit_history
+
+    history = _turn(1) + _turn(2) + _turn(3)
+    assert fit_history(history, 450) == _turn(2) + _turn(3)
+    assert fit_history(history, 10) == []
+
+
+@pytest.mark.anyio
+async def test_providers_rebuild_messages_from_history() -> None:
+    import httpx
+
+    from src.core.egress import GuardedHttpClient
+    from src.plugins.llm_query.providers.anthropic import AnthropicProvider
+    from src.plugins.llm_query.providers.local import LocalProvider
+    from src.plugins.llm_query.providers.openai import OpenAIProvider
+
+    history = _turn(1, size=0)
+    sent: list[tuple[str, dict]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append((request.url.path, json.loads(request.content)))
+        if request.url.path == "/api/chat":
+            return httpx.Response(200, json={"message": {"content": "ok"}, "done": True})
+        if "anthropic" in request.url.host:
+            return httpx.Response(200, json={"content": [{"type": "text", "text": "ok"}]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    transport = httpx.MockTransport(handler)
+    openai = OpenAIProvider(
+        api_key="k",
+        base_url="https://api.openai.com/v1",
+        http_client=GuardedHttpClient(["api.openai.com"], transport=transport),
+    )
+    anthropic = AnthropicProvider(
+        api_key="k",
+        base_url="https://api.anthropic.com/v1",
+        http_client=GuardedHttpClient(["api.anthropic.com"], transport=transport),
+    )
+    local = LocalProvider(
+        base_url="http://localhost:11434",
+        http_client=GuardedHttpClient(["localhost"], transport=transport),
+    )
+
+    await openai.query("gpt-4o", "q2", 10, system="sys", history=history)
+    assert sent[-1][1]["messages"] == [
+        {"role": "system", "content": "sys"}, *history, {"role": "user", "content": "q2"},
+    ]
+
+    await anthropic.query("claude-sonnet-4-20250514", "q2", 10, history=history)
+    messages = sent[-1][1]["messages"]
+    assert messages[0] == history[0]
+    # The conversation so far is marked for prompt caching
+    assert messages[1]["content"] == [
+        {"type": "text", "text": "a1", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert messages[2] == {"role": "user", "content": "q2"}
+
+    response = await local.query("llama3", "q2", 10, history=history)
+    assert sent[-1][0] == "/api/chat"
+    assert sent[-1][1]["messages"] == [*history, {"role": "user", "content": "q2"}]
+    assert response.text == "ok"
@@ -89,3 +89,28 @@ def test_unknown_plugin_skipped(sample_config: AppConfig) -> None:
     policy = PolicyEngine(sample_config)
     registry.load(config=config, policy_engine=policy)
     assert len(registry.tools) == 0
+
+
+@pytest.mark.anyio
+async def test_llm_plugins_share_one_backend(sample_config: AppConfig) -> None:
+    import json
+
+    from src.core.types import AgentIdentity
+    from src.plugins.llm_query.backend import SERVICE_KEY
+
+    sample_config.enabled_plugins = ["llm.query", "about.upstreams"]
+    for pcfg in sample_config.llm.providers.values():
+        pcfg.pool.warmup_connections = 0
+    registry = PluginRegistry()
+    registry.load(config=sample_config, policy_engine=PolicyEngine(sample_config))
+
+    backend = registry.services[SERVICE_KEY]
+    assert registry.tools["llm.query"]._backend is backend  # type: ignore[attr-defined]
+
+    await registry.startup()
+    stats = json.loads(
+        await registry.resources["about://upstreams"].read(AgentIdentity(agent_id="a", tenant_id="t"))
+    )
+    assert set(stats["providers"]) == {"openai", "anthropic"}
+    assert stats["providers"]["openai"]["max_connections"] == 100
+    await registry.shutdown()
@@ -1,6 +1,7 @@
 """Tests for policy engine."""
 from __future__ import annotations
 
+from src.core.config import AppConfig
 from src.core.policy import PolicyEngine
 from src.core.types import AgentIdentity, Capability, PluginManifest
 
@@ -89,3 +90,35 @@ def test_multiple_deny_reasons(
     decision = policy_engine.check_tool_call(alpha_identity, manifest)
     assert not decision.allowed
     assert len(decision.reasons) >= 2
+
+
+def test_static_verdict_is_cached(
+    policy_engine: PolicyEngine,
+    alpha_identity: AgentIdentity,
+) -> None:
+    manifest = PluginManifest(name="llm.query", title="LLM", description="llm")
+    first = policy_engine.check_tool_call(alpha_identity, manifest)
+    second = policy_engine.check_tool_call(alpha_identity, manifest)
+    assert not first.allowed and not second.allowed
+    assert first.reasons == second.reasons
+    assert (alpha_identity.agent_id, manifest) in policy_engine._static_verdicts
+
+
+def test_reload_recompiles_tables(
+    policy_engine: PolicyEngine,
+    sample_config: AppConfig,
+    alpha_identity: AgentIdentity,
+) -> None:
+    manifest = PluginManifest(name="llm.query", title="LLM", description="llm")
+    assert not policy_engine.check_tool_call(alpha_identity, manifest).allowed
+
+    sample_config.agents["agent-alpha"].allowed_tools.append("llm.query")
+    policy_engine.reload(sample_config)
+    assert policy_engine.check_tool_call(alpha_identity, manifest).allowed
+
+
+def test_egress_host_match_is_case_insensitive(
+    policy_engine: PolicyEngine,
+    beta_identity: AgentIdentity,
+) -> None:
+    assert policy_engine.check_egress(beta_identity, "API.OpenAI.com").allowed
@@ -0,0 +1,141 @@
+"""Tests for rate and concurrency limiters."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from src.core import rate_limit, state
+from src.core.rate_limit import (
+    RATE_LIMIT_ALGORITHMS,
+    ConcurrencyLimiter,
+    ConcurrencyLimitExceeded,
+    RateLimiter,
+)
+from tests.helpers import anyio_backend  # noqa: F401 (fixture)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> _Clock:
+    fake = _Clock()
+    monkeypatch.setattr(rate_limit.time, "time", fake)
+    monkeypatch.setattr(state.time, "time", fake)
+    return fake
+
+
+@pytest.mark.parametrize("algorithm", sorted(RATE_LIMIT_ALGORITHMS))
+def test_rate_limit_allows_up_to_limit(algorithm: str, clock: _Clock) -> None:
+    limiter = RateLimiter()
+    assert all(limiter.acquire("agent-x", 5, algorithm) for _ in range(5))
+    assert not limiter.acquire("agent-x", 5, algorithm)
+    # Other agents are unaffected
+    assert limiter.acquire("agent-y", 5, algorithm)
+
+
+@pytest.mark.parametrize("algorithm", sorted(RATE_LIMIT_ALGORITHMS))
+def test_rate_limit_recovers_after_window(algorithm: str, clock: _Clock) -> None:
+    limiter = RateLimiter()
+    for _ in range(5):
+        limiter.acquire("agent-x", 5, algorithm)
+    assert not limiter.acquire("agent-x", 5, algorithm)
+    clock.now += 120
+    assert limiter.acquire("agent-x", 5, algorithm)
+
+
+def test_token_bucket_refills_gradually(clock: _Clock) -> None:
+    limiter = RateLimiter()
+    for _ in range(60):
+        assert limiter.acquire("agent-x", 60, "token_bucket")
+    assert not limiter.acquire("agent-x", 60, "token_bucket")
+    clock.now += 1.0  # one token per second at 60/minute
+    assert limiter.acquire("agent-x", 60, "token_bucket")
+    assert not limiter.acquire("agent-x", 60, "token_bucket")
+
+
+def test_rate_limit_cost_is_all_or_nothing(clock: _Clock) -> None:
+    limiter = RateLimiter()
+    assert limiter.acquire("agent-x", 10, "gcra", cost=8)
+    assert not limiter.acquire("agent-x", 10, "gcra", cost=3)
+    assert limiter.acquire("agent-x", 10, "gcra", cost=2)
+
+
+def test_idle_keys_are_evicted(clock: _Clock) -> None:
+    backend = state.MemoryStateBackend()
+    limiter = RateLimiter(backend)
+    for i in range(100):
+        limiter.acquire(f"agent-{i}", 5)
+    assert len(backend) == 100
+    clock.now += 300
+    limiter.acquire("agent-new", 5)
+    assert len(backend) == 1
+
+
+@pytest.mark.anyio
+async def test_concurrency_reject_mode_fails_fast() -> None:
+    limiter = ConcurrencyLimiter()
+    async with limiter.acquire("agent-x", 1, mode="reject"):
+        with pytest.raises(ConcurrencyLimitExceeded, match="limit reached"):
+            async with limiter.acquire("agent-x", 1, mode="reject"):
+                pass
+    assert limiter.stats("agent-x")["rejected"] == 1
+    # Slot is released afterwards
+    async with limiter.acquire("agent-x", 1, mode="reject"):
+        pass
+
+
+@pytest.mark.anyio
+async def test_concurrency_wait_mode_queues() -> None:
+    limiter = ConcurrencyLimiter()
+    acquired = asyncio.Event()
+    release = asyncio.Event()
+    order: list[str] = []
+
+    async def holder() -> None:
+        async with limiter.acquire("agent-x", 1, max_queue_depth=5, queue_timeout=5.0):
+            order.append("first")
+            acquired.set()
+            await release.wait()
+
+    async def waiter() -> None:
+        async with limiter.acquire("agent-x", 1, max_queue_depth=5, queue_timeout=5.0):
+            order.append("second")
+
+    first = asyncio.create_task(holder())
+    await acquired.wait()
+    second = asyncio.create_task(waiter())
+    await asyncio.sleep(0.01)
+    assert limiter.stats("agent-x")["queue_depth"] == 1
+    release.set()
+    await asyncio.wait_for(asyncio.gather(first, second), timeout=5)
+    assert order == ["first", "second"]
+    stats = limiter.stats("agent-x")
+    assert stats["queue_depth"] == 0
+    assert stats["in_flight"] == 0
+    assert stats["max_queue_depth"] == 1
+
+
+@pytest.mark.anyio
+async def test_concurrency_wait_mode_queue_full() -> None:
+    limiter = ConcurrencyLimiter()
+    async with limiter.acquire("agent-x", 1, max_queue_depth=0):
+        with pytest.raises(ConcurrencyLimitExceeded, match="queue full"):
+            async with limiter.acquire("agent-x", 1, max_queue_depth=0):
+                pass
+
+
+@pytest.mark.anyio
+async def test_concurrency_wait_mode_deadline() -> None:
+    limiter = ConcurrencyLimiter()
+    async with limiter.acquire("agent-x", 1, max_queue_depth=1, queue_timeout=0.01):
+        with pytest.raises(ConcurrencyLimitExceeded, match="Timed out"):
+            async with limiter.acquire("agent-x", 1, max_queue_depth=1, queue_timeout=0.01):
+                pass
+    assert limiter.stats("agent-x")["queue_depth"] == 0
@@ -0,0 +1,114 @@
+"""Tests for the rate-limit/budget state backends."""
+from __future__ import annotations
+
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from src.core import state
+from src.core.budget import BudgetTracker
+from src.core.config import AppConfig, StateConfig
+from src.core.policy import PolicyEngine
+from src.core.rate_limit import RateLimiter
+from src.core.state import (
+    MemoryStateBackend,
+    MmapStateBackend,
+    SQLiteStateBackend,
+    StateBackend,
+    create_state_backend,
+)
+
+
+@pytest.fixture(params=["memory", "mmap", "sqlite"])
+def backend(request: pytest.FixtureRequest, tmp_path: Path) -> StateBackend:
+    if request.param == "mmap":
+        b: StateBackend = MmapStateBackend(str(tmp_path / "state.mmap"), slots=64)
+    elif request.param == "sqlite":
+        b = SQLiteStateBackend(str(tmp_path / "state.sqlite3"))
+    else:
+        b = MemoryStateBackend()
+    yield b
+    b.close()
+
+
+def test_update_and_get(backend: StateBackend) -> None:
+    assert backend.get("k") is None
+    result = backend.update("k", lambda s: ("first", (1.0, 2.0)), ttl=60)
+    assert result == "first"
+    assert backend.get("k") == (1.0, 2.0)
+    backend.update("k", lambda s: (None, (s[0] + 1, s[1])), ttl=60)
+    assert backend.get("k") == (2.0, 2.0)
+
+
+def test_incr(backend: StateBackend) -> None:
+    assert backend.incr("counter", 1.5, ttl=60) == 1.5
+    assert backend.incr("counter", 2.0, ttl=60) == 3.5
+
+
+def test_expiry(backend: StateBackend, monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [1_000_000.0]
+    monkeypatch.setattr(state.time, "time", lambda: now[0])
+    backend.incr("counter", 1.0, ttl=10)
+    now[0] += 11
+    assert backend.get("counter") is None
+    assert backend.incr("counter", 1.0, ttl=10) == 1.0
+
+
+def test_mmap_reuses_expired_slots(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [1_000_000.0]
+    monkeypatch.setattr(state.time, "time", lambda: now[0])
+    backend = MmapStateBackend(str(tmp_path / "state.mmap"), slots=8)
+    for i in range(8):
+        backend.incr(f"k{i}", 1.0, ttl=10)
+    with pytest.raises(RuntimeError, match="full"):
+        backend.incr("overflow", 1.0, ttl=10)
+    now[0] += 11
+    assert backend.incr("overflow", 1.0, ttl=10) == 1.0
+    backend.close()
+
+
+def _hammer(kind: str, path: str, n: int) -> None:
+    backend = create_state_backend(StateConfig(backend=kind, path=path, mmap_slots=64))  # type: ignore[arg-type]
+    tracker = BudgetTracker(backend)
+    for _ in range(n):
+        tracker.record("agent-x", 1.0)
+    backend.close()
+
+
+@pytest.mark.parametrize("kind", ["mmap", "sqlite"])
+def test_shared_backend_is_atomic_across_processes(kind: str, tmp_path: Path) -> None:
+    path = str(tmp_path / f"state.{kind}")
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_hammer, args=(kind, path, 200)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(timeout=30)
+        assert w.exitcode == 0
+
+    backend = create_state_backend(StateConfig(backend=kind, path=path, mmap_slots=64))  # type: ignore[arg-type]
+    assert BudgetTracker(backend).spent_today("agent-x") == 800.0
+    backend.close()
+
+
+def test_rate_limit_shared_between_engines(tmp_path: Path) -> None:
+    """Two workers on one shared backend enforce a single combined limit."""
+    path = str(tmp_path / "state.mmap")
+    first = RateLimiter(MmapStateBackend(path, slots=64))
+    second = RateLimiter(MmapStateBackend(path, slots=64))
+    allowed = sum(
+        limiter.acquire("agent-x", 10, "gcra") for _ in range(10) for limiter in (first, second)
+    )
+    assert allowed == 10
+
+
+def test_policy_engine_uses_configured_backend(sample_config: AppConfig, tmp_path: Path) -> None:
+    sample_config.state = StateConfig(backend="sqlite", path=str(tmp_path / "state.sqlite3"))
+    engine = PolicyEngine(sample_config)
+    engine.budget_tracker.record("agent-beta", 5.0)
+    engine.close()
+
+    reopened = PolicyEngine(sample_config)
+    assert reopened.budget_tracker.spent_today("agent-beta") == 5.0
+    reopened.close()
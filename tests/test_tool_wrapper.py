@@ -0,0 +1,153 @@
+"""Tests for the policy-enforcing tool wrapper: deadlines, concurrency."""
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any
+
+import pytest
+from pydantic import BaseModel, Field
+
+from src.core.config import AppConfig
+from src.core.policy import PolicyEngine
+from src.core.types import AgentIdentity, PluginManifest
+from src.plugins._base import ToolContext, ToolPlugin
+from src.transport.app import _make_tool_wrapper
+from src.transport.middleware import current_agent
+from tests.helpers import anyio_backend  # noqa: F401 (fixture)
+
+
+class _SlowInput(BaseModel):
+    delay: float = Field(description="Seconds to sleep")
+
+
+class _SlowPlugin(ToolPlugin):
+    def __init__(self) -> None:
+        self.cancelled = False
+        self.seen_remaining: float | None = None
+
+    def manifest(self) -> PluginManifest:
+        return PluginManifest(name="core.echo", title="Slow", description="sleeps")
+
+    def input_model(self) -> type[BaseModel]:
+        return _SlowInput
+
+    async def execute(self, ctx: ToolContext, params: BaseModel) -> str:
+        assert isinstance(params, _SlowInput)
+        self.seen_remaining = ctx.remaining_time()
+        try:
+            await asyncio.sleep(params.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "done"
+
+
+def _wrapper_for(config: AppConfig, plugin: ToolPlugin) -> tuple[Any, PolicyEngine]:
+    policy = PolicyEngine(config)
+    return _make_tool_wrapper(plugin, policy), policy
+
+
+@pytest.mark.anyio
+async def test_tool_call_deadline_cancels_execution(sample_config: AppConfig) -> None:
+    sample_config.agents["agent-alpha"].timeout_seconds = 0.05
+    plugin = _SlowPlugin()
+    wrapper, policy = _wrapper_for(sample_config, plugin)
+
+    token = current_agent.set(AgentIdentity(agent_id="agent-alpha", tenant_id="team-a"))
+    try:
+        result = json.loads(await wrapper(delay=5))
+    finally:
+        current_agent.reset(token)
+
+    assert result["error"] == "Timeout"
+    assert plugin.cancelled
+    assert plugin.seen_remaining is not None and plugin.seen_remaining <= 0.05
+    # The concurrency slot is released on timeout
+    assert policy.concurrency_limiter.stats("agent-alpha")["in_flight"] == 0
+
+
+@pytest.mark.anyio
+async def test_tool_call_concurrency_reject(sample_config: AppConfig) -> None:
+    sample_config.agents["agent-alpha"].concurrency = 1
+    sample_config.agents["agent-alpha"].concurrency_mode = "reject"
+    wrapper, _ = _wrapper_for(sample_config, _SlowPlugin())
+
+    token = current_agent.set(AgentIdentity(agent_id="agent-alpha", tenant_id="team-a"))
+    try:
+        first = asyncio.create_task(wrapper(delay=0.1))
+        await asyncio.sleep(0.01)
+        second = json.loads(await wrapper(delay=0))
+        assert await first == "done"
+    finally:
+        current_agent.reset(token)
+
+    assert second["error"] == "Concurrency limit exceeded"
+
+
+class _ProgressPlugin(_SlowPlugin):
+    async def execute(self, ctx: ToolContext, params: BaseModel) -> str:
+        await ctx.report_progress("half")
+        await ctx.report_progress("all")
+        return "done"
+
+
+class _FakeMCPContext:
+    """Just enough of FastMCP's Context for the wrapper's progress reporter."""
+
+    def __init__(self, progress_token: str | None) -> None:
+        meta = type("Meta", (), {"progressToken": progress_token})()
+        self.request_context = type("RequestContext", (), {"meta": meta})()
+        self.sent: list[tuple[float, str | None]] = []
+
+    async def report_progress(
+        self, progress: float, total: float | None = None, message: str | None = None
+    ) -> None:
+        self.sent.append((progress, message))
+
+
+@pytest.mark.anyio
+async def test_tool_progress_is_forwarded_to_mcp_context(sample_config: AppConfig) -> None:
+    wrapper, _ = _wrapper_for(sample_config, _ProgressPlugin())
+    with_token = _FakeMCPContext("tok")
+    without_token = _FakeMCPContext(None)
+
+    token = current_agent.set(AgentIdentity(agent_id="agent-alpha", tenant_id="team-a"))
+    try:
+        assert await wrapper(delay=0, mcp_context=with_token) == "done"
+        assert await wrapper(delay=0, mcp_context=without_token) == "done"
+    finally:
+        current_agent.reset(token)
+
+    assert with_token.sent == [(1, "half"), (2, "all")]
+    assert without_token.sent == []
+
+
+def test_context_parameter_is_hidden_from_tool_schema(sample_config: AppConfig) -> None:
+    from mcp.server.fastmcp import FastMCP
+
+    wrapper, _ = _wrapper_for(sample_config, _SlowPlugin())
+    listed = FastMCP()
+    listed.add_tool(wrapper)
+    schema = listed._tool_manager.list_tools()[0].parameters
+    assert "delay" in schema["properties"]
+    assert "mcp_context" not in schema["properties"]
+
+
+@pytest.mark.anyio
+async def test_agent_removed_after_policy_check_gets_an_error(
+    sample_config: AppConfig, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    plugin = _SlowPlugin()
+    wrapper, policy = _wrapper_for(sample_config, plugin)
+    # As if a config reload dropped the agent between the check and the lookup
+    monkeypatch.setattr(policy, "agent_config", lambda identity: None)
+
+    token = current_agent.set(AgentIdentity(agent_id="agent-alpha", tenant_id="team-a"))
+    try:
+        result = json.loads(await wrapper(delay=0))
+    finally:
+        current_agent.reset(token)
+
+    assert result == {"error": "Unknown agent: agent-alpha"}
+    assert plugin.seen_remaining is None